@@ -2,10 +2,23 @@
 سرور بک‌اند Flask برای API شجره‌نامه
 """
 
-from flask import Flask, request, jsonify
+from flask import (Flask, Response, copy_current_request_context, request, jsonify, make_response,
+                   stream_with_context)
 from flask_cors import CORS
 from family_tree import FamilyTree, Gender
+from query_cache import RelationshipCache
+from tree_store import SQLiteFamilyTree
+from journal import MutationJournal
+from binary_snapshot import MappedFamilyTree
+from change_log import describe_change
+from traversal_pool import PoolSaturated, TraversalPool
+from functools import wraps
+import atexit
+import base64
+import binascii
 import json
+import os
+import time
 
 # app = Flask(__name__)
 # CORS(app)
@@ -13,28 +26,218 @@ import json
 from flask_cors import CORS
 
 app = Flask(__name__)
-CORS(app, resources={
+CORS_RESOURCES = {
     r"/api/*": {
-        "origins": "*"  # برای تست - بعداً محدود می‌کنیم
+        "origins": "*",  # برای تست - بعداً محدود می‌کنیم
+        "expose_headers": ["ETag"]
     }
-})
+}
+CORS(app, resources=CORS_RESOURCES)
 
-# ایجاد نمونه درخت خانوادگی
-family_tree = FamilyTree()
+# ایجاد نمونه درخت خانوادگی؛ با FAMILY_TREE_DB داده در SQLite ذخیره و بین
+# workerها به اشتراک گذاشته می‌شود. با FAMILY_TREE_SNAPSHOT درخت از یک تصویر
+# دودویی mmap خوانده می‌شود. با FAMILY_TREE_JOURNAL (فقط یک پروسه) تغییرات در
+# ژورنال و تصویر دوره‌ای ذخیره می‌شوند، در غیر این صورت درخت فقط در حافظه می‌ماند
+database_path = os.environ.get('FAMILY_TREE_DB')
+snapshot_path = os.environ.get('FAMILY_TREE_SNAPSHOT')
+journal_directory = os.environ.get('FAMILY_TREE_JOURNAL')
+mutation_journal = None
+if database_path:
+    family_tree = SQLiteFamilyTree(database_path)
+elif snapshot_path:
+    family_tree = MappedFamilyTree(snapshot_path)
+else:
+    family_tree = FamilyTree()
+    if journal_directory:
+        mutation_journal = MutationJournal(
+            journal_directory,
+            sync_interval=float(os.environ.get('JOURNAL_SYNC_INTERVAL', '0')),
+            snapshot_every=int(os.environ.get('JOURNAL_SNAPSHOT_EVERY', '100000'))
+        )
+        mutation_journal.attach(family_tree)
+        atexit.register(mutation_journal.close)
+
+# کش نتایج مسیر و نسبت؛ ظرفیت با متغیر محیطی قابل تنظیم است
+relationship_cache = RelationshipCache(int(os.environ.get('RELATIONSHIP_CACHE_SIZE', '1024')))
+
+# فید تغییرات: ظرفیت حلقه، فاصله بررسی تغییرات workerهای دیگر و طول هر اتصال SSE
+family_tree.changes.resize(int(os.environ.get('CHANGE_FEED_SIZE', '10000')))
+CHANGE_POLL_INTERVAL = 1.0
+CHANGE_STREAM_SECONDS = 30.0
+CHANGE_KEEPALIVE_SECONDS = 15.0
+
+# استخر محدود پیمایش‌های سنگین: تعداد نخ‌ها، حداکثر صف و مهلت هر پیمایش (ثانیه)
+traversal_pool = TraversalPool(
+    workers=int(os.environ.get('TRAVERSAL_WORKERS', '4')),
+    max_queue=int(os.environ.get('TRAVERSAL_QUEUE', '32'))
+)
+atexit.register(traversal_pool.shutdown, wait=False)
+TRAVERSAL_TIMEOUT = float(os.environ.get('TRAVERSAL_TIMEOUT', '30'))
+
+# فیلدهای هر عملیات در /api/batch، به ترتیب آرگومان‌های متد درخت
+BATCH_FIELDS = {
+    "add_person": ("id", "name", "gender", "birth_year"),
+    "remove_person": ("id",),
+    "add_parent_child": ("parent_id", "child_id"),
+    "add_spouse": ("person1_id", "person2_id")
+}
+BATCH_MAX_OPERATIONS = 10000
+KINSHIP_MAX_PAIRS = 10000
+
+_NOT_CACHED = object()
+
+BFS_ALGORITHM = "BFS (جستجوی سطح به سطح)"
+DFS_ALGORITHM = "DFS (جستجوی عمقی)"
+
+
+def path_payload(algorithm, path, simplified):
+    """بدنه پاسخ یک مسیر؛ مشترک بین مسیریاب‌ها"""
+    return {
+        "algorithm": algorithm,
+        "path": [
+            {"id": person.id, "name": person.name, "relation": relation}
+            for person, relation in path
+        ],
+        "simplified_relationship": simplified,
+        "path_length": len(path) - 1
+    }
+
+
+def find_relationship(algorithm, start_id, end_id):
+    """مسیر و نسبت ساده‌شده با الگوریتم داده‌شده (bfs/dfs)، یا None اگر مسیری نباشد
+    
+    نسخه، مسیر و فرد شروع زیر یک قفل خواندن خوانده می‌شوند تا نتیجه با نسخه‌ای
+    که در کش ثبت می‌شود یکی باشد.
+    """
+    key = (algorithm, start_id, end_id)
+    with family_tree.lock.read():
+        version = family_tree.version
+        result = relationship_cache.get(key, version, _NOT_CACHED)
+        if result is not _NOT_CACHED:
+            return result
+        
+        finder = family_tree.bfs_find_path if algorithm == "bfs" else family_tree.dfs_find_path
+        path = finder(start_id, end_id)
+        result = None
+        if path is not None:
+            start_person = family_tree.people[start_id]
+            result = (path, family_tree.simplify_relationship(path, start_person))
+        
+        relationship_cache.put(key, version, result)
+    return result
+
+
+@app.before_request
+def sync_family_tree():
+    """دریافت تغییرات workerهای دیگر پیش از پاسخ به هر درخواست"""
+    family_tree.sync()
+
+
+def conditional(view):
+    """ETag قوی از نسخه درخت و پاسخ 304 برای If-None-Match منطبق
+    
+    تطبیق پیش از اجرای view انجام می‌شود، پس درخواست تکراری به درخت دست
+    نمی‌زند و چیزی سریال نمی‌شود. برچسب پیش از ساخت پاسخ خوانده می‌شود؛ اگر
+    درخت هم‌زمان تغییر کند برچسب قدیمی‌تر از بدنه است و درخواست بعدی فقط
+    یک پاسخ کامل اضافه می‌گیرد.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        etag = family_tree.etag()
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag)
+        # مرورگر هر بار اعتبارسنجی می‌کند و پاسخ 304 را از کش خودش پر می‌کند
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return wrapper
+
+
+def offloaded(view):
+    """اجرای view در استخر پیمایش با زمینه همین درخواست
+    
+    اگر صف استخر پر باشد بلافاصله 503 با Retry-After برمی‌گردد و اگر پیمایش
+    در مهلت TRAVERSAL_TIMEOUT تمام نشود 504؛ نخ سرور هیچ‌وقت بیش از مهلت
+    پشت یک پیمایش نمی‌ماند.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            return traversal_pool.run(
+                copy_current_request_context(view), *args,
+                timeout=TRAVERSAL_TIMEOUT, **kwargs
+            )
+        except PoolSaturated as e:
+            response = jsonify({"success": False, "error": str(e)})
+            response.status_code = 503
+            response.headers['Retry-After'] = '1'
+            return response
+        except TimeoutError:
+            return jsonify({"success": False, "error": "زمان پیمایش به پایان رسید"}), 504
+    return wrapper
+
+
+HEALTH_STATUS = {"status": "healthy", "message": "سرور شجره‌نامه فعال است"}
 
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """بررسی سلامت سرور"""
-    return jsonify({"status": "healthy", "message": "سرور شجره‌نامه فعال است"})
+    return jsonify(HEALTH_STATUS)
+
+
+PEOPLE_PAGE_SIZE = 100
+PEOPLE_PAGE_MAX = 1000
+
+
+def encode_cursor(person_id: str) -> str:
+    return base64.urlsafe_b64encode(person_id.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> str:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return base64.b64decode(padded, altchars=b'-_', validate=True).decode('utf-8')
+    except (binascii.Error, UnicodeDecodeError):
+        raise ValueError("cursor نامعتبر است")
 
 
 @app.route('/api/people', methods=['GET'])
+@conditional
 def get_all_people():
-    """دریافت لیست تمام افراد"""
+    """دریافت لیست افراد
+    
+    بدون پارامتر همه افراد برگردانده می‌شوند. با limit یا cursor خروجی به ترتیب
+    شناسه صفحه‌بندی می‌شود و next_cursor صفحه بعد را مشخص می‌کند (یا null).
+    fields (مثلاً id,name) فقط فیلدهای خواسته‌شده را می‌فرستد.
+    """
     try:
-        people = family_tree.get_all_people()
-        return jsonify({"success": True, "data": people})
+        fields = request.args.get('fields')
+        fields = [field.strip() for field in fields.split(',') if field.strip()] if fields else None
+        cursor = request.args.get('cursor')
+        limit = request.args.get('limit')
+        if cursor is None and limit is None:
+            if fields is None:
+                return jsonify({"success": True, "data": family_tree.get_all_people()})
+            people, _ = family_tree.people_page(fields=fields)
+            return jsonify({"success": True, "data": people})
+        
+        limit = PEOPLE_PAGE_SIZE if limit is None else request.args.get('limit', type=int)
+        if limit is None or not 1 <= limit <= PEOPLE_PAGE_MAX:
+            raise ValueError(f"limit باید بین 1 و {PEOPLE_PAGE_MAX} باشد")
+        after = decode_cursor(cursor) if cursor else None
+        people, last = family_tree.people_page(after, limit, fields)
+        return jsonify({
+            "success": True,
+            "data": people,
+            "next_cursor": encode_cursor(last) if last is not None else None
+        })
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -61,6 +264,22 @@ def add_person():
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+@app.route('/api/person/<person_id>', methods=['GET'])
+@conditional
+def get_person(person_id):
+    """دریافت یک فرد"""
+    try:
+        person = family_tree.get_person(person_id)
+        if person is None:
+            return jsonify({
+                "success": False,
+                "error": "فرد مورد نظر یافت نشد"
+            }), 404
+        return jsonify({"success": True, "data": person})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
 @app.route('/api/person/<person_id>', methods=['DELETE'])
 def delete_person(person_id):
     """حذف فرد"""
@@ -80,6 +299,35 @@ def delete_person(person_id):
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+@app.route('/api/person/<person_id>/relationships', methods=['GET'])
+@conditional
+@offloaded
+def get_relationships(person_id):
+    """نسبت همه افراد با یک فرد"""
+    try:
+        relationships = family_tree.relationship_map(person_id)
+        return jsonify({
+            "success": True,
+            "data": {
+                "person_id": person_id,
+                "relationships": [
+                    {
+                        "id": person.id,
+                        "name": person.name,
+                        "simplified_relationship": label,
+                        "path_length": distance
+                    }
+                    for person, distance, label in relationships
+                ],
+                "count": len(relationships)
+            }
+        })
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 404
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
 @app.route('/api/relationship/parent-child', methods=['POST'])
 def add_parent_child_relationship():
     """افزودن رابطه والد-فرزند"""
@@ -112,7 +360,39 @@ def add_spouse_relationship():
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+@app.route('/api/batch', methods=['POST'])
+def apply_batch():
+    """اجرای اتمیک چند تغییر
+    
+    یا همه عملیات اعمال می‌شوند یا هیچ‌کدام؛ کل دسته یک نسخه جدید است.
+    """
+    try:
+        data = request.json
+        if len(data['operations']) > BATCH_MAX_OPERATIONS:
+            raise ValueError(f"حداکثر {BATCH_MAX_OPERATIONS} عملیات در هر دسته مجاز است")
+        operations = []
+        for index, item in enumerate(data['operations'], 1):
+            fields = BATCH_FIELDS.get(item.get('op')) if isinstance(item, dict) else None
+            if fields is None:
+                raise ValueError(f"عملیات شماره {index}: عملیات نامعتبر است")
+            missing = [field for field in fields if field not in item and field != 'birth_year']
+            if missing:
+                raise ValueError(f"عملیات شماره {index}: فیلد الزامی وجود ندارد: {', '.join(missing)}")
+            operations.append((item['op'], *(item.get(field) for field in fields)))
+        applied = family_tree.apply_batch(operations)
+        return jsonify({
+            "success": True,
+            "message": f"{applied} عملیات با موفقیت انجام شد",
+            "data": {"applied": applied, "version": family_tree.version}
+        })
+    except (ValueError, KeyError, TypeError) as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
 @app.route('/api/path/bfs', methods=['POST'])
+@offloaded
 def find_path_bfs():
     """پیدا کردن مسیر با BFS"""
     try:
@@ -120,40 +400,26 @@ def find_path_bfs():
         start_id = data['start_id']
         end_id = data['end_id']
         
-        path = family_tree.bfs_find_path(start_id, end_id)
+        result = find_relationship("bfs", start_id, end_id)
         
-        if path is None:
+        if result is None:
             return jsonify({
                 "success": False,
                 "error": "مسیری بین این دو فرد یافت نشد"
             }), 404
         
-        start_person = family_tree.people[start_id]
-        simplified = family_tree.simplify_relationship(path, start_person)
-        
-        path_data = [
-            {
-                "id": person.id,
-                "name": person.name,
-                "relation": relation
-            }
-            for person, relation in path
-        ]
+        path, simplified = result
         
         return jsonify({
             "success": True,
-            "data": {
-                "algorithm": "BFS (جستجوی سطح به سطح)",
-                "path": path_data,
-                "simplified_relationship": simplified,
-                "path_length": len(path) - 1
-            }
+            "data": path_payload(BFS_ALGORITHM, path, simplified)
         })
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
 
 @app.route('/api/path/dfs', methods=['POST'])
+@offloaded
 def find_path_dfs():
     """پیدا کردن مسیر با DFS"""
     try:
@@ -161,40 +427,26 @@ def find_path_dfs():
         start_id = data['start_id']
         end_id = data['end_id']
         
-        path = family_tree.dfs_find_path(start_id, end_id)
+        result = find_relationship("dfs", start_id, end_id)
         
-        if path is None:
+        if result is None:
             return jsonify({
                 "success": False,
                 "error": "مسیری بین این دو فرد یافت نشد"
             }), 404
         
-        start_person = family_tree.people[start_id]
-        simplified = family_tree.simplify_relationship(path, start_person)
-        
-        path_data = [
-            {
-                "id": person.id,
-                "name": person.name,
-                "relation": relation
-            }
-            for person, relation in path
-        ]
+        path, simplified = result
         
         return jsonify({
             "success": True,
-            "data": {
-                "algorithm": "DFS (جستجوی عمقی)",
-                "path": path_data,
-                "simplified_relationship": simplified,
-                "path_length": len(path) - 1
-            }
+            "data": path_payload(DFS_ALGORITHM, path, simplified)
         })
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
 
 @app.route('/api/path/compare', methods=['POST'])
+@offloaded
 def compare_paths():
     """مقایسه مسیرهای BFS و DFS"""
     try:
@@ -202,45 +454,23 @@ def compare_paths():
         start_id = data['start_id']
         end_id = data['end_id']
         
-        bfs_path = family_tree.bfs_find_path(start_id, end_id)
-        dfs_path = family_tree.dfs_find_path(start_id, end_id)
+        bfs_result = find_relationship("bfs", start_id, end_id)
+        dfs_result = find_relationship("dfs", start_id, end_id)
         
-        if bfs_path is None or dfs_path is None:
+        if bfs_result is None or dfs_result is None:
             return jsonify({
                 "success": False,
                 "error": "مسیری بین این دو فرد یافت نشد"
             }), 404
         
-        start_person = family_tree.people[start_id]
-        
-        bfs_simplified = family_tree.simplify_relationship(bfs_path, start_person)
-        dfs_simplified = family_tree.simplify_relationship(dfs_path, start_person)
-        
-        bfs_data = [
-            {"id": p.id, "name": p.name, "relation": r}
-            for p, r in bfs_path
-        ]
-        
-        dfs_data = [
-            {"id": p.id, "name": p.name, "relation": r}
-            for p, r in dfs_path
-        ]
+        bfs_path, bfs_simplified = bfs_result
+        dfs_path, dfs_simplified = dfs_result
         
         return jsonify({
             "success": True,
             "data": {
-                "bfs": {
-                    "algorithm": "BFS (جستجوی سطح به سطح)",
-                    "path": bfs_data,
-                    "simplified_relationship": bfs_simplified,
-                    "path_length": len(bfs_path) - 1
-                },
-                "dfs": {
-                    "algorithm": "DFS (جستجوی عمقی)",
-                    "path": dfs_data,
-                    "simplified_relationship": dfs_simplified,
-                    "path_length": len(dfs_path) - 1
-                },
+                "bfs": path_payload(BFS_ALGORITHM, bfs_path, bfs_simplified),
+                "dfs": path_payload(DFS_ALGORITHM, dfs_path, dfs_simplified),
                 "same_path": bfs_simplified == dfs_simplified
             }
         })
@@ -248,67 +478,343 @@ def compare_paths():
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+@app.route('/api/path/batch', methods=['POST'])
+def find_paths_batch():
+    """نسبت چندین جفت فرد در یک درخواست با BFS
+    
+    جفت‌ها بر اساس فرد شروع گروه‌بندی می‌شوند تا یک پیمایش به همه مقصدهای
+    آن گروه پاسخ دهد. خروجی به صورت NDJSON جریانی است؛ هر خط یک جفت با
+    اندیس آن در درخواست.
+    """
+    try:
+        data = request.json
+        groups = {}
+        for index, pair in enumerate(data['pairs']):
+            groups.setdefault(pair['start_id'], []).append((index, pair['end_id']))
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    
+    def resolve(start_id, targets):
+        results = {}
+        # هر گروه با قفل خواندن جداگانه؛ پاسخ طولانی نویسنده‌ها را متوقف نمی‌کند
+        with family_tree.lock.read():
+            version = family_tree.version
+            for _, end_id in targets:
+                cached = relationship_cache.get(("bfs", start_id, end_id), version, _NOT_CACHED)
+                if cached is not _NOT_CACHED:
+                    results[end_id] = cached
+            
+            pending = [end_id for _, end_id in targets if end_id not in results]
+            if pending:
+                start_person = family_tree.people.get(start_id)
+                for end_id, path in family_tree.bfs_find_paths(start_id, pending).items():
+                    result = None
+                    if path is not None:
+                        result = (path, family_tree.simplify_relationship(path, start_person))
+                    relationship_cache.put(("bfs", start_id, end_id), version, result)
+                    results[end_id] = result
+        return results
+    
+    def generate():
+        for start_id, targets in groups.items():
+            # هر گروه یک کار جدا در استخر پیمایش؛ گروهی که جا نگیرد خطا می‌گیرد
+            error = None
+            try:
+                results = traversal_pool.run(resolve, start_id, targets, timeout=TRAVERSAL_TIMEOUT)
+            except PoolSaturated as e:
+                error = str(e)
+            except TimeoutError:
+                error = "زمان پیمایش به پایان رسید"
+            
+            for index, end_id in targets:
+                line = {"index": index, "start_id": start_id, "end_id": end_id}
+                if error is not None:
+                    line.update(success=False, error=error)
+                elif results[end_id] is None:
+                    line.update(success=False, error="مسیری بین این دو فرد یافت نشد")
+                else:
+                    line.update(success=True, data=path_payload(BFS_ALGORITHM, *results[end_id]))
+                yield app.json.dumps(line) + "\n"
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@app.route('/api/ancestry/is-ancestor', methods=['POST'])
+@offloaded
+def is_ancestor():
+    """بررسی جد بودن یک فرد برای فرد دیگر"""
+    try:
+        data = request.json
+        result = family_tree.is_ancestor(data['ancestor_id'], data['person_id'])
+        return jsonify({
+            "success": True,
+            "data": {
+                "ancestor_id": data['ancestor_id'],
+                "person_id": data['person_id'],
+                "is_ancestor": result
+            }
+        })
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@app.route('/api/ancestry/common-ancestors', methods=['POST'])
+@offloaded
+def common_ancestors():
+    """یافتن نزدیک‌ترین اجداد مشترک دو فرد"""
+    try:
+        data = request.json
+        ancestors = family_tree.common_ancestors(
+            data['person1_id'],
+            data['person2_id'],
+            closest_only=not data.get('all', False)
+        )
+        return jsonify({
+            "success": True,
+            "data": {
+                "common_ancestors": [
+                    {"id": p.id, "name": p.name, "gender": p.gender.value}
+                    for p in ancestors
+                ],
+                "count": len(ancestors)
+            }
+        })
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@app.route('/api/kinship', methods=['POST'])
+@offloaded
+def kinship():
+    """ضریب خویشاوندی و ضریب رابطه رایت برای چند جفت فرد"""
+    try:
+        data = request.json
+        pairs = [(pair['person1_id'], pair['person2_id']) for pair in data['pairs']]
+        if len(pairs) > KINSHIP_MAX_PAIRS:
+            raise ValueError(f"حداکثر {KINSHIP_MAX_PAIRS} جفت در هر درخواست مجاز است")
+        coefficients = family_tree.kinship(pairs)
+        return jsonify({
+            "success": True,
+            "data": {
+                "pairs": [
+                    {
+                        "person1_id": person1_id,
+                        "person2_id": person2_id,
+                        "kinship": kinship_coefficient,
+                        "relationship": relationship
+                    }
+                    for (person1_id, person2_id), (kinship_coefficient, relationship) in zip(pairs, coefficients)
+                ],
+                "count": len(pairs)
+            }
+        })
+    except (ValueError, KeyError, TypeError) as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@app.route('/api/kinship/inbreeding', methods=['GET'])
+@conditional
+@offloaded
+def inbreeding():
+    """ضریب هم‌خونی افراد
+    
+    با ids (جدا شده با کاما) ضریب همان افراد برگردانده می‌شود و بدون آن فقط
+    افرادی که ضریبشان صفر نیست.
+    """
+    try:
+        ids = request.args.get('ids')
+        if ids:
+            coefficients = family_tree.inbreeding(ids.split(','))
+        else:
+            coefficients = {
+                person_id: coefficient
+                for person_id, coefficient in family_tree.inbreeding().items()
+                if coefficient > 0
+            }
+        return jsonify({
+            "success": True,
+            "data": {
+                "people": [
+                    {"id": person_id, "inbreeding": coefficient}
+                    for person_id, coefficient in coefficients.items()
+                ],
+                "count": len(coefficients)
+            }
+        })
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@app.route('/api/layout', methods=['GET'])
+@conditional
+@offloaded
+def layout():
+    """مختصات لایه‌ای افراد برای نمایش درخت؛ کلاینت فقط رسم می‌کند"""
+    try:
+        nodes = family_tree.layout()
+        return jsonify({
+            "success": True,
+            "data": {
+                "nodes": nodes,
+                "count": len(nodes),
+                "generations": 1 + max((node["generation"] for node in nodes), default=-1)
+            }
+        })
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """آمار کش نتایج مسیر"""
+    return jsonify({"success": True, "data": relationship_cache.stats()})
+
+
+@app.route('/api/traversal/stats', methods=['GET'])
+def traversal_stats():
+    """آمار استخر پیمایش"""
+    return jsonify({"success": True, "data": traversal_pool.stats()})
+
+
+@app.route('/api/changes', methods=['GET'])
+def get_changes():
+    """تغییرات درخت پس از نسخه since
+    
+    پاسخ عادی تغییرات را یک‌جا برمی‌گرداند (polling). با stream=1 یا
+    Accept: text/event-stream اتصال SSE باز می‌ماند و هر تغییر یک رویداد change
+    با id برابر نسخه است؛ EventSource پس از قطع اتصال با Last-Event-ID ادامه
+    می‌دهد. اگر since دیگر در تاریخچه نباشد، پاسخ 410 (یا رویداد resync) یعنی
+    کلاینت باید کل درخت را دوباره بگیرد.
+    """
+    since = request.args.get('since', type=int)
+    if since is None:
+        since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        return jsonify({"success": False, "error": "پارامتر since الزامی است"}), 400
+    
+    streaming = request.args.get('stream') in ('1', 'true') or \
+        request.accept_mimetypes.best == 'text/event-stream'
+    if not streaming:
+        try:
+            changes = family_tree.changes_since(since)
+        except Exception as e:
+            return jsonify({"success": False, "error": str(e)}), 500
+        if changes is None:
+            return jsonify({
+                "success": False,
+                "error": "تغییرات این نسخه دیگر در دسترس نیست؛ کل درخت را دوباره بگیرید",
+                "resync": True,
+                "version": family_tree.version
+            }), 410
+        return jsonify({
+            "success": True,
+            "data": {
+                "instance_id": family_tree.instance_id,
+                "version": changes[-1][0] if changes else since,
+                "changes": [describe_change(*change) for change in changes]
+            }
+        })
+    
+    def generate():
+        cursor = since
+        started = last_sent = time.monotonic()
+        yield f"retry: {int(CHANGE_POLL_INTERVAL * 1000)}\n\n"
+        while True:
+            family_tree.sync()
+            changes = family_tree.changes_since(cursor)
+            if changes is None:
+                yield f"event: resync\ndata: {app.json.dumps({'version': family_tree.version})}\n\n"
+                return
+            for change in changes:
+                cursor = change[0]
+                yield f"id: {cursor}\nevent: change\ndata: {app.json.dumps(describe_change(*change))}\n\n"
+                last_sent = time.monotonic()
+            
+            now = time.monotonic()
+            if now - started >= CHANGE_STREAM_SECONDS:
+                # اتصال محدود است تا worker آزاد شود؛ EventSource خودش دوباره وصل می‌شود
+                return
+            if now - last_sent >= CHANGE_KEEPALIVE_SECONDS:
+                yield ": keep-alive\n\n"
+                last_sent = now
+            # تغییر همین پروسه فوراً بیدار می‌کند؛ تغییر workerهای دیگر با sync دوره‌ای دیده می‌شود
+            family_tree.changes.wait(cursor, CHANGE_POLL_INTERVAL)
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 @app.route('/api/sample-data', methods=['POST'])
 def load_sample_data():
     """بارگذاری داده‌های نمونه"""
     try:
-        # پاک کردن داده‌های قبلی
-        family_tree.people.clear()
+        # پاک کردن و ساختن دوباره یک‌جا؛ هیچ خواننده‌ای درخت نیمه‌کاره را نمی‌بیند
+        with family_tree.lock.write():
+            # پاک کردن داده‌های قبلی
+            family_tree.clear()
         
-        # جد بزرگ
-        family_tree.add_person("p1", "احمد", "male", 1920)
-        family_tree.add_person("p2", "فاطمه", "female", 1925)
-        family_tree.add_spouse("p1", "p2")
+            # جد بزرگ
+            family_tree.add_person("p1", "احمد", "male", 1920)
+            family_tree.add_person("p2", "فاطمه", "female", 1925)
+            family_tree.add_spouse("p1", "p2")
         
-        # نسل دوم
-        family_tree.add_person("p3", "حسن", "male", 1945)
-        family_tree.add_person("p4", "زهرا", "female", 1950)
-        family_tree.add_person("p5", "علی", "male", 1948)
-        family_tree.add_person("p6", "مریم", "female", 1952)
+            # نسل دوم
+            family_tree.add_person("p3", "حسن", "male", 1945)
+            family_tree.add_person("p4", "زهرا", "female", 1950)
+            family_tree.add_person("p5", "علی", "male", 1948)
+            family_tree.add_person("p6", "مریم", "female", 1952)
         
-        family_tree.add_parent_child("p1", "p3")
-        family_tree.add_parent_child("p2", "p3")
-        family_tree.add_parent_child("p1", "p5")
-        family_tree.add_parent_child("p2", "p5")
+            family_tree.add_parent_child("p1", "p3")
+            family_tree.add_parent_child("p2", "p3")
+            family_tree.add_parent_child("p1", "p5")
+            family_tree.add_parent_child("p2", "p5")
         
-        family_tree.add_spouse("p3", "p4")
-        family_tree.add_spouse("p5", "p6")
+            family_tree.add_spouse("p3", "p4")
+            family_tree.add_spouse("p5", "p6")
         
-        # نسل سوم
-        family_tree.add_person("p7", "محمد", "male", 1970)
-        family_tree.add_person("p8", "سارا", "female", 1972)
-        family_tree.add_person("p9", "رضا", "male", 1975)
-        family_tree.add_person("p10", "نرگس", "female", 1978)
+            # نسل سوم
+            family_tree.add_person("p7", "محمد", "male", 1970)
+            family_tree.add_person("p8", "سارا", "female", 1972)
+            family_tree.add_person("p9", "رضا", "male", 1975)
+            family_tree.add_person("p10", "نرگس", "female", 1978)
         
-        family_tree.add_parent_child("p3", "p7")
-        family_tree.add_parent_child("p4", "p7")
-        family_tree.add_parent_child("p3", "p8")
-        family_tree.add_parent_child("p4", "p8")
+            family_tree.add_parent_child("p3", "p7")
+            family_tree.add_parent_child("p4", "p7")
+            family_tree.add_parent_child("p3", "p8")
+            family_tree.add_parent_child("p4", "p8")
         
-        family_tree.add_parent_child("p5", "p9")
-        family_tree.add_parent_child("p6", "p9")
-        family_tree.add_parent_child("p5", "p10")
-        family_tree.add_parent_child("p6", "p10")
+            family_tree.add_parent_child("p5", "p9")
+            family_tree.add_parent_child("p6", "p9")
+            family_tree.add_parent_child("p5", "p10")
+            family_tree.add_parent_child("p6", "p10")
         
-        # همسران نسل سوم
-        family_tree.add_person("p11", "لیلا", "female", 1972)
-        family_tree.add_person("p12", "کامران", "male", 1970)
+            # همسران نسل سوم
+            family_tree.add_person("p11", "لیلا", "female", 1972)
+            family_tree.add_person("p12", "کامران", "male", 1970)
         
-        family_tree.add_spouse("p7", "p11")
-        family_tree.add_spouse("p8", "p12")
+            family_tree.add_spouse("p7", "p11")
+            family_tree.add_spouse("p8", "p12")
         
-        # نسل چهارم
-        family_tree.add_person("p13", "امیر", "male", 1995)
-        family_tree.add_person("p14", "نیلوفر", "female", 1998)
-        family_tree.add_person("p15", "سینا", "male", 1997)
+            # نسل چهارم
+            family_tree.add_person("p13", "امیر", "male", 1995)
+            family_tree.add_person("p14", "نیلوفر", "female", 1998)
+            family_tree.add_person("p15", "سینا", "male", 1997)
         
-        family_tree.add_parent_child("p7", "p13")
-        family_tree.add_parent_child("p11", "p13")
-        family_tree.add_parent_child("p7", "p14")
-        family_tree.add_parent_child("p11", "p14")
+            family_tree.add_parent_child("p7", "p13")
+            family_tree.add_parent_child("p11", "p13")
+            family_tree.add_parent_child("p7", "p14")
+            family_tree.add_parent_child("p11", "p14")
         
-        family_tree.add_parent_child("p8", "p15")
-        family_tree.add_parent_child("p12", "p15")
+            family_tree.add_parent_child("p8", "p15")
+            family_tree.add_parent_child("p12", "p15")
         
         return jsonify({
             "success": True,
@@ -319,9 +825,70 @@ def load_sample_data():
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+IMPORT_CONTENT_TYPES = {
+    'application/json': 'json',
+    'application/x-ndjson': 'ndjson',
+    'application/ndjson': 'ndjson',
+    'text/csv': 'csv',
+    'application/x-gedcom': 'gedcom',
+    'text/x-gedcom': 'gedcom'
+}
+
+IMPORT_EXTENSIONS = {
+    'ged': 'gedcom'
+}
+
+
+@app.route('/api/import', methods=['POST'])
+def import_tree():
+    """وارد کردن جریانی افراد و روابط از فایل JSON، NDJSON، CSV یا GEDCOM
+    
+    فایل به صورت multipart (فیلد file) یا مستقیماً در بدنه درخواست فرستاده
+    می‌شود. قالب از پارامتر format، پسوند فایل یا Content-Type تعیین می‌شود.
+    """
+    upload = request.files.get('file')
+    if upload is not None:
+        stream = upload.stream
+        extension = os.path.splitext(upload.filename or '')[1].lstrip('.').lower()
+        fmt = request.args.get('format') or IMPORT_EXTENSIONS.get(extension, extension)
+    else:
+        stream = request.stream
+        fmt = request.args.get('format') or IMPORT_CONTENT_TYPES.get(request.mimetype, 'json')
+    
+    try:
+        report = family_tree.bulk_load(stream, fmt)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+    
+    return jsonify({
+        "success": True,
+        "message": f"{report['people_added']} فرد و {report['relationships_added']} رابطه وارد شد",
+        "data": report
+    })
+
+
 @app.route('/api/export', methods=['GET'])
+@conditional
 def export_tree():
-    """صادرات درخت"""
+    """صادرات درخت
+    
+    format=ndjson هر فرد را در یک خط و format=gedcom فایل GEDCOM را به صورت
+    جریانی می‌فرستد؛ حافظه و زمان رسیدن اولین بایت به اندازه درخت بستگی ندارد.
+    """
+    fmt = request.args.get('format', 'json')
+    if fmt == 'ndjson':
+        return Response(stream_with_context(family_tree.export_ndjson()), mimetype='application/x-ndjson')
+    if fmt == 'gedcom':
+        try:
+            chunks = family_tree.export_gedcom()
+        except Exception as e:
+            return jsonify({"success": False, "error": str(e)}), 500
+        return Response(stream_with_context(chunks), mimetype='text/x-gedcom',
+                        headers={'Content-Disposition': 'attachment; filename=family_tree.ged'})
+    if fmt != 'json':
+        return jsonify({"success": False, "error": f"قالب پشتیبانی نمی‌شود: {fmt}"}), 400
     try:
         return jsonify({
             "success": True,
@@ -336,15 +903,28 @@ if __name__ == '__main__':
     print("📍 آدرس: http://localhost:5000")
     print("📚 API Documentation:")
     print("  GET  /api/health - بررسی سلامت سرور")
-    print("  GET  /api/people - دریافت تمام افراد")
+    print("  GET  /api/people - دریافت افراد (limit/cursor برای صفحه‌بندی، fields برای انتخاب فیلدها)")
+    print("  GET  /api/person/<id> - دریافت یک فرد")
     print("  POST /api/person - افزودن فرد جدید")
     print("  DELETE /api/person/<id> - حذف فرد")
+    print("  GET  /api/person/<id>/relationships - نسبت همه افراد با یک فرد")
     print("  POST /api/relationship/parent-child - افزودن رابطه والد-فرزند")
     print("  POST /api/relationship/spouse - افزودن رابطه همسری")
+    print("  POST /api/batch - اجرای اتمیک چند تغییر")
     print("  POST /api/path/bfs - پیدا کردن مسیر با BFS")
     print("  POST /api/path/dfs - پیدا کردن مسیر با DFS")
     print("  POST /api/path/compare - مقایسه مسیرهای BFS و DFS")
+    print("  POST /api/path/batch - نسبت چندین جفت فرد (NDJSON)")
+    print("  POST /api/ancestry/is-ancestor - بررسی جد بودن")
+    print("  POST /api/ancestry/common-ancestors - اجداد مشترک")
+    print("  POST /api/kinship - ضریب خویشاوندی و ضریب رابطه رایت")
+    print("  GET  /api/kinship/inbreeding - ضریب هم‌خونی (ids برای افراد مشخص)")
+    print("  GET  /api/layout - مختصات لایه‌ای افراد برای نمایش درخت")
+    print("  GET  /api/cache/stats - آمار کش نتایج مسیر")
+    print("  GET  /api/traversal/stats - آمار استخر پیمایش")
+    print("  GET  /api/changes?since=<version> - فید تغییرات (stream=1 برای SSE)")
     print("  POST /api/sample-data - بارگذاری داده نمونه")
-    print("  GET  /api/export - صادرات درخت")
+    print("  POST /api/import - وارد کردن فایل JSON/NDJSON/CSV/GEDCOM")
+    print("  GET  /api/export - صادرات درخت (format=ndjson یا gedcom برای جریانی)")
     
     app.run(debug=True, host='0.0.0.0', port=5000)
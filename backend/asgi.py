@@ -0,0 +1,164 @@
+"""
+حالت سرویس ASGI
+
+درخواست‌های سبک مستقیم روی event loop پاسخ داده می‌شوند: /api/health و
+GET /api/person/<id> (اگر قفل خواندن درخت بدون انتظار گرفته شود). بقیه
+درخواست‌ها به همان برنامه Flask در استخر نخ WSGI_THREADS می‌روند و پیمایش‌های
+سنگین درون Flask به استخر محدود traversal_pool؛ پس پرس‌وجوی سنگین نه event
+loop را متوقف می‌کند و نه همه نخ‌ها را می‌گیرد. اگر بیش از WSGI_QUEUE درخواست
+منتظر نخ باشند پاسخ 503 با Retry-After داده می‌شود.
+
+تبدیل ASGI به WSGI کار a2wsgi است که بدنه درخواست و پاسخ را تکه‌تکه منتقل
+می‌کند، پس import و export بزرگ و SSE فید تغییرات در حافظه بافر نمی‌شوند. هر
+اتصال SSE تا پایان خودش یک نخ می‌گیرد. سرآیندهای CORS پاسخ‌های روی loop از
+همان تنظیمات flask-cors برنامه (CORS_RESOURCES) ساخته می‌شوند.
+
+اجرا (pip install -r requirements.txt):
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+    gunicorn -k uvicorn.workers.UvicornWorker asgi:application
+"""
+
+import os
+from typing import Dict, List, Optional, Tuple
+
+from a2wsgi import WSGIMiddleware
+from flask_cors.core import get_cors_headers, get_cors_options, parse_resources, try_match
+from werkzeug.datastructures import Headers as RequestHeaders
+
+from app import CORS_RESOURCES, HEALTH_STATUS, app as flask_app, family_tree
+from tree_store import SQLiteFamilyTree
+
+PERSON_PREFIX = "/api/person/"
+
+Headers = List[Tuple[bytes, bytes]]
+
+
+class AsgiApplication:
+    """برنامه ASGI روی برنامه WSGI (Flask) با پاسخ‌های سبک روی event loop"""
+
+    def __init__(self, wsgi_app, tree, threads: int = 16, max_queue: int = 64,
+                 cors_resources: Optional[Dict] = None):
+        self.wsgi_app = wsgi_app
+        self.tree = tree
+        self.threads = threads
+        self.max_queue = max_queue
+        self._wsgi = WSGIMiddleware(_terminated_input(wsgi_app), workers=threads)
+        # همان تطبیق مسیر و گزینه‌های CORS(app, resources=...) در Flask
+        self._cors = [
+            (pattern, get_cors_options(wsgi_app, options))
+            for pattern, options in parse_resources(cors_resources or {})
+        ]
+        # فقط روی event loop تغییر می‌کند، پس قفل نمی‌خواهد
+        self._active = 0
+        # SQLiteFamilyTree پیش از هر خواندن sync می‌شود (before_request)؛ روی loop نه
+        self.loop_lookups = not isinstance(tree, SQLiteFamilyTree)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        if scope["method"] == "GET":
+            response = self._on_loop(scope)
+            if response is not None:
+                await self._send_json(scope, send, *response)
+                return
+
+        if self._active >= self.threads + self.max_queue:
+            await self._send_json(scope, send, 503, {
+                "success": False,
+                "error": "سرور مشغول است، کمی بعد دوباره تلاش کنید"
+            }, [(b"retry-after", b"1")])
+            return
+
+        self._active += 1
+        try:
+            await self._wsgi(scope, receive, send)
+        finally:
+            self._active -= 1
+
+    def _on_loop(self, scope) -> Optional[Tuple[int, Dict, Headers]]:
+        """پاسخ بدون نخ جدا، یا None برای فرستادن به Flask"""
+        path = scope["path"]
+        if path == "/api/health":
+            return 200, HEALTH_STATUS, []
+        if not self.loop_lookups or not path.startswith(PERSON_PREFIX):
+            return None
+        person_id = path[len(PERSON_PREFIX):]
+        if not person_id or "/" in person_id:
+            return None
+        if any(name == b"if-none-match" for name, _ in scope["headers"]):
+            # پاسخ 304 کار conditional در Flask است
+            return None
+
+        lock = self.tree.lock
+        # نویسنده فعال یا منتظر loop را متوقف نمی‌کند؛ درخواست به نخ می‌رود
+        if not lock.acquire_read(blocking=False):
+            return None
+        try:
+            etag = self.tree.etag()
+            person = self.tree.get_person(person_id)
+        finally:
+            lock.release_read()
+        if person is None:
+            # پاسخ 404 با همان پیام Flask
+            return None
+        return 200, {"success": True, "data": person}, [
+            (b"etag", f'"{etag}"'.encode("latin-1")),
+            (b"cache-control", b"no-cache")
+        ]
+
+    async def _send_json(self, scope, send, status: int, payload: Dict, headers: Headers):
+        body = f"{self.wsgi_app.json.dumps(payload)}\n".encode("utf-8")
+        headers = [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("latin-1")),
+            *headers,
+            *self._cors_headers(scope)
+        ]
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    def _cors_headers(self, scope) -> Headers:
+        """سرآیندهایی که flask-cors برای همین مسیر و Origin می‌فرستاد"""
+        for pattern, options in self._cors:
+            if try_match(scope["path"], pattern):
+                request_headers = RequestHeaders(
+                    [(name.decode("latin-1"), value.decode("latin-1")) for name, value in scope["headers"]]
+                )
+                headers = get_cors_headers(options, request_headers, scope["method"])
+                return [
+                    (name.lower().encode("latin-1"), value.encode("latin-1"))
+                    for name, value in headers.items(multi=True)
+                ]
+        return []
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self._wsgi.executor.shutdown(wait=False, cancel_futures=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+def _terminated_input(wsgi_app):
+    """بدنه را سرور ASGI (حتی chunked) تا پایان می‌دهد؛ بدون این علامت
+    werkzeug بدنه بدون Content-Length را خالی می‌خواند"""
+    def app(environ, start_response):
+        environ["wsgi.input_terminated"] = True
+        return wsgi_app(environ, start_response)
+    return app
+
+
+application = AsgiApplication(
+    flask_app,
+    family_tree,
+    threads=int(os.environ.get('WSGI_THREADS', '16')),
+    max_queue=int(os.environ.get('WSGI_QUEUE', '64')),
+    cors_resources=CORS_RESOURCES
+)
@@ -0,0 +1,474 @@
+"""
+قالب دودویی نسخه‌دار برای تصویر درخت خانوادگی، قابل بارگذاری با mmap
+
+ساختار فایل (همه اعداد little-endian و هر بخش هم‌تراز به 8 بایت):
+
+    سرآیند          magic، نسخه قالب، نسخه درخت، تعداد افراد، تعداد یال‌ها، حجم رشته‌ها
+    رکورد افراد     24 بایت برای هر فرد: آفست/طول شناسه، آفست/طول نام، سال تولد، جنسیت
+    ترتیب شناسه‌ها  اندیس افراد مرتب بر اساس بایت‌های شناسه (برای جستجوی دودویی)
+    offsets         int64 × (n + 1)
+    child_start     int64 × n
+    spouse_start    int64 × n
+    targets         int32 × تعداد یال‌ها
+    رشته‌ها         شناسه‌ها و نام‌ها به صورت UTF-8 پشت سر هم
+
+بخش‌های CSR همان چیدمان GraphSnapshot را دارند، پس پیمایش‌ها مستقیم روی
+memoryviewهای فایل نگاشت‌شده اجرا می‌شوند. MappedFamilyTree هیچ Person یا
+دیکشنری شناسه‌ای از پیش نمی‌سازد؛ فرد فقط وقتی در خروجی لازم شود ساخته می‌شود.
+اولین تغییر یا پرسش اجداد، درخت را به درخت معمولی حافظه‌ای تبدیل می‌کند.
+"""
+
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections.abc import Mapping, Sequence
+from typing import Callable, Collection, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from family_tree import (FamilyTree, Gender, Person, _gc_paused, _reads, _relatives_from, _writes,
+                         check_fields)
+from graph_snapshot import GraphSnapshot
+
+MAGIC = b"FTSNAP\0\0"
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct("<8sIIQQQQ")
+_RECORD = struct.Struct("<IIIIiB3x")
+
+_GENDERS = (Gender.MALE, Gender.FEMALE)
+_GENDER_CODES = {Gender.MALE: 0, Gender.FEMALE: 1}
+_NO_BIRTH_YEAR = -2 ** 31
+
+
+def _aligned(size: int) -> int:
+    return (size + 7) & ~7
+
+
+def _layout(people: int, edges: int) -> Dict[str, int]:
+    """آفست شروع هر بخش بر اساس تعداد افراد و یال‌ها"""
+    layout = {}
+    position = _aligned(_HEADER.size)
+    for name, size in (("records", people * _RECORD.size),
+                       ("id_order", people * 4),
+                       ("offsets", (people + 1) * 8),
+                       ("child_start", people * 8),
+                       ("spouse_start", people * 8),
+                       ("targets", edges * 4)):
+        layout[name] = position
+        position = _aligned(position + size)
+    layout["strings"] = position
+    return layout
+
+
+def _little_endian(values: array) -> bytes:
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _section(buffer: memoryview, start: int, length: int, code: str):
+    """بخش عددی فایل؛ روی ماشین little-endian بدون کپی، در غیر این صورت کپی جابه‌جا شده"""
+    view = buffer[start:start + length * struct.calcsize(code)]
+    if sys.byteorder == "little":
+        return view.cast(code)
+    values = array(code, bytes(view))
+    values.byteswap()
+    return values
+
+
+def save_binary_snapshot(tree: FamilyTree, path: str):
+    """نوشتن تصویر دودویی درخت به صورت اتمیک"""
+    graph = GraphSnapshot(tree.people.values())
+    people = graph.people
+    count = len(people)
+
+    strings = bytearray()
+    records = bytearray(count * _RECORD.size)
+    encoded_ids = []
+    for i, person in enumerate(people):
+        person_id = person.id.encode("utf-8")
+        name = person.name.encode("utf-8")
+        encoded_ids.append(person_id)
+        birth_year = _NO_BIRTH_YEAR if person.birth_year is None else person.birth_year
+        _RECORD.pack_into(records, i * _RECORD.size, len(strings), len(person_id),
+                          len(strings) + len(person_id), len(name), birth_year,
+                          _GENDER_CODES[person.gender])
+        strings += person_id
+        strings += name
+
+    id_order = array("I", sorted(range(count), key=encoded_ids.__getitem__))
+    sections = {
+        "records": bytes(records),
+        "id_order": _little_endian(id_order),
+        "offsets": _little_endian(array("q", graph.offsets)),
+        "child_start": _little_endian(array("q", graph.child_start)),
+        "spouse_start": _little_endian(array("q", graph.spouse_start)),
+        "targets": _little_endian(array("i", graph.targets)),
+        "strings": bytes(strings),
+    }
+
+    layout = _layout(count, len(graph.targets))
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, 0, tree.version, count,
+                             len(graph.targets), len(strings)))
+        for name, data in sections.items():
+            f.write(b"\0" * (layout[name] - f.tell()))
+            f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+class _PersonTable:
+    """دسترسی به رکورد افراد و رشته‌ها روی بافر نگاشت‌شده"""
+
+    def __init__(self, buffer, layout: Dict[str, int], count: int):
+        self.buffer = buffer
+        self.count = count
+        self.records = layout["records"]
+        self.strings = layout["strings"]
+        self.id_order = _section(buffer, layout["id_order"], count, "I")
+        # افراد ساخته‌شده نگه داشته می‌شوند تا هر اندیس همیشه همان شیء Person باشد
+        self.cache: Dict[int, Person] = {}
+
+    def record(self, i: int):
+        return _RECORD.unpack_from(self.buffer, self.records + i * _RECORD.size)
+
+    def _string(self, offset: int, length: int) -> str:
+        start = self.strings + offset
+        return str(self.buffer[start:start + length], "utf-8")
+
+    def _id_bytes(self, i: int) -> bytes:
+        id_offset, id_length = _RECORD.unpack_from(self.buffer, self.records + i * _RECORD.size)[:2]
+        start = self.strings + id_offset
+        return bytes(self.buffer[start:start + id_length])
+
+    def person_id(self, i: int) -> str:
+        id_offset, id_length = self.record(i)[:2]
+        return self._string(id_offset, id_length)
+
+    def person(self, i: int) -> Person:
+        """فرد i بدون روابط (روابط در تصویر CSR هستند)"""
+        person = self.cache.get(i)
+        if person is None:
+            id_offset, id_length, name_offset, name_length, birth_year, gender = self.record(i)
+            person = Person(self._string(id_offset, id_length), self._string(name_offset, name_length),
+                            _GENDERS[gender], None if birth_year == _NO_BIRTH_YEAR else birth_year)
+            self.cache[i] = person
+        return person
+
+    def all_people(self) -> List[Person]:
+        """همه افراد به ترتیب اندیس؛ رکوردها یک‌جا خوانده می‌شوند"""
+        records = self.buffer[self.records:self.records + self.count * _RECORD.size]
+        strings = bytes(self.buffer[self.strings:])
+        cache = self.cache
+        people = []
+        for i, (id_offset, id_length, name_offset, name_length, birth_year, gender) in \
+                enumerate(_RECORD.iter_unpack(records)):
+            person = cache.get(i)
+            if person is None:
+                person = Person(strings[id_offset:id_offset + id_length].decode("utf-8"),
+                                strings[name_offset:name_offset + name_length].decode("utf-8"),
+                                _GENDERS[gender], None if birth_year == _NO_BIRTH_YEAR else birth_year)
+            people.append(person)
+        records.release()
+        return people
+
+    def rank(self, person_id: str, after: bool = False) -> int:
+        """جایگاه اولین شناسه >= person_id (با after اولین شناسه >) در ترتیب شناسه‌ها
+
+        ترتیب بایت‌های UTF-8 همان ترتیب رشته‌های پایتون است.
+        """
+        key = person_id.encode("utf-8")
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            found = self._id_bytes(self.id_order[middle])
+            if found < key or (after and found == key):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def find(self, person_id: str) -> int:
+        """اندیس فرد با جستجوی دودویی روی ترتیب شناسه‌ها، یا -1"""
+        if not isinstance(person_id, str):
+            return -1
+        position = self.rank(person_id)
+        if position < self.count:
+            i = self.id_order[position]
+            if self._id_bytes(i) == person_id.encode("utf-8"):
+                return i
+        return -1
+
+
+class _MappedPeopleList(Sequence):
+    """دنباله تنبل افراد بر اساس اندیس (نقش GraphSnapshot.people)"""
+
+    def __init__(self, table: _PersonTable):
+        self._table = table
+
+    def __len__(self) -> int:
+        return self._table.count
+
+    def __getitem__(self, i: int) -> Person:
+        if not 0 <= i < self._table.count:
+            raise IndexError(i)
+        return self._table.person(i)
+
+
+class _MappedIndex(Mapping):
+    """نگاشت تنبل شناسه به اندیس (نقش GraphSnapshot.index)"""
+
+    def __init__(self, table: _PersonTable):
+        self._table = table
+
+    def __getitem__(self, person_id: str) -> int:
+        i = self._table.find(person_id)
+        if i < 0:
+            raise KeyError(person_id)
+        return i
+
+    def __contains__(self, person_id) -> bool:
+        return self._table.find(person_id) >= 0
+
+    def __iter__(self):
+        return (self._table.person_id(i) for i in range(self._table.count))
+
+    def __len__(self) -> int:
+        return self._table.count
+
+
+class _MappedPeople(_MappedIndex):
+    """نگاشت تنبل شناسه به Person (نقش FamilyTree.people در حالت فقط‌خواندنی)"""
+
+    def __getitem__(self, person_id: str) -> Person:
+        return self._table.person(super().__getitem__(person_id))
+
+
+class MappedFamilyTree(FamilyTree):
+    """درخت خانوادگی روی یک تصویر دودویی mmap شده
+
+    پرس‌وجوهای مسیر و نسبت مستقیم روی بافرهای نگاشت‌شده اجرا می‌شوند.
+    اولین تغییر، پرسش اجداد یا دسترسی به روابط Personها درخت را یک‌باره به
+    ساختار معمولی حافظه‌ای تبدیل می‌کند (materialize).
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(self._mmap)
+        if len(buffer) < _HEADER.size:
+            raise ValueError("فایل تصویر ناقص است")
+        magic, format_version, _, version, count, edges, strings_size = _HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            raise ValueError("فایل تصویر دودویی درخت نیست")
+        if format_version != FORMAT_VERSION:
+            raise ValueError(f"قالب تصویر پشتیبانی نمی‌شود: {format_version}")
+        layout = _layout(count, edges)
+        if len(buffer) < layout["strings"] + strings_size:
+            raise ValueError("فایل تصویر ناقص است")
+
+        self._table = _PersonTable(buffer, layout, count)
+        self.version = version
+        self.changes.reset(version)
+        self.people = _MappedPeople(self._table)
+        self._snapshot = GraphSnapshot.from_buffers(
+            _MappedPeopleList(self._table), _MappedIndex(self._table),
+            _section(buffer, layout["offsets"], count + 1, "q"),
+            _section(buffer, layout["child_start"], count, "q"),
+            _section(buffer, layout["spouse_start"], count, "q"),
+            _section(buffer, layout["targets"], edges, "i"))
+        self._materialized = False
+
+    @property
+    def materialized(self) -> bool:
+        return self._materialized
+
+    def materialize(self):
+        """ساخت همه Personها با روابطشان از روی بافرها و رها کردن نگاشت فایل"""
+        if self._materialized:
+            return
+        with self.lock.write():
+            if not self._materialized:
+                self._materialize()
+
+    def _materialize(self):
+        graph = self._snapshot
+        table = self._table
+        offsets, child_start, spouse_start, targets = (
+            graph.offsets, graph.child_start, graph.spouse_start, graph.targets)
+        with _gc_paused():
+            people = table.all_people()
+            for i, person in enumerate(people):
+                first, middle, last, end = offsets[i], child_start[i], spouse_start[i], offsets[i + 1]
+                person.parents = _relatives_from([people[j] for j in targets[first:middle]])
+                person.children = _relatives_from([people[j] for j in targets[middle:last]])
+                if last < end:
+                    person.spouse = people[targets[last]]
+            self.people = {person.id: person for person in people}
+
+        self._materialized = True
+        self._ancestry.invalidate()
+        self._generations.invalidate()
+        del graph, offsets, child_start, spouse_start, targets
+        self.close()
+
+    @_writes
+    def close(self):
+        """آزاد کردن نگاشت فایل (پس از materialize درخت مستقل از فایل است)"""
+        if self._mmap is None:
+            return
+        if not self._materialized:
+            self.people = {}
+        self._snapshot = None
+        self._table = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            # هنوز برشی از بافر در دست کسی است؛ نگاشت با آزاد شدن آن بسته می‌شود
+            pass
+        self._mmap = None
+
+    def snapshot(self) -> GraphSnapshot:
+        if self._snapshot is None and not self._materialized:
+            raise ValueError("تصویر بسته شده است")
+        return super().snapshot()
+
+    @_reads
+    def get_person(self, person_id: str) -> Optional[Dict]:
+        """یک فرد با جستجوی دودویی در فایل، بدون materialize"""
+        if self._materialized:
+            return super().get_person(person_id)
+        i = self._table.find(person_id)
+        if i < 0:
+            return None
+        return next(self._person_dicts(self._table.person_id, (i,)))
+
+    @_reads
+    def get_all_people(self) -> List[Dict]:
+        """لیست افراد مستقیم از بافرها، بدون ساخت Personها"""
+        if self._materialized:
+            return super().get_all_people()
+        ids = [self._table.person_id(i) for i in range(self._table.count)]
+        return list(self._person_dicts(ids.__getitem__, range(self._table.count)))
+
+    @_reads
+    def iter_people(self) -> Iterator[Dict]:
+        """افراد یکی‌یکی از بافرها؛ شناسه همسایه‌ها هنگام نیاز خوانده می‌شود"""
+        if self._materialized:
+            return super().iter_people()
+        return self._person_dicts(self._table.person_id, range(self._table.count))
+
+    @_reads
+    def people_page(self, after: Optional[str] = None, limit: Optional[int] = None,
+                    fields: Optional[Collection[str]] = None) -> Tuple[List[Dict], Optional[str]]:
+        """صفحه‌بندی روی بخش ترتیب شناسه‌های فایل، بدون مرتب‌سازی"""
+        if self._materialized:
+            return super().people_page(after, limit, fields)
+        fields = check_fields(fields)
+        table = self._table
+        start = table.rank(after, after=True) if after is not None else 0
+        end = table.count if limit is None else min(start + limit, table.count)
+        page = [table.id_order[position] for position in range(start, end)]
+        people = list(self._person_dicts(table.person_id, page, fields))
+        last = table.person_id(page[-1]) if page and end < table.count else None
+        return people, last
+
+    def _person_dicts(self, person_id: Callable[[int], str], indices: Iterable[int],
+                      fields: Optional[Tuple[str, ...]] = None) -> Iterator[Dict]:
+        # بافرها همین حالا گرفته می‌شوند؛ materialize هم‌زمان نگاشت را تا پایان
+        # پیمایش نمی‌بندد (BufferError) پس تکه‌های بعدی هم معتبرند
+        graph = self._snapshot
+        table = self._table
+        offsets, child_start, spouse_start, targets = (
+            graph.offsets, graph.child_start, graph.spouse_start, graph.targets)
+
+        if fields is not None:
+            # فقط ستون‌های خواسته‌شده خوانده می‌شوند؛ شناسه بستگان گران‌ترین بخش است
+            columns = {
+                "id": lambda i, record: person_id(i),
+                "name": lambda i, record: table._string(record[2], record[3]),
+                "gender": lambda i, record: _GENDERS[record[5]].value,
+                "birth_year": lambda i, record: None if record[4] == _NO_BIRTH_YEAR else record[4],
+                "parents": lambda i, record: [person_id(j) for j in targets[offsets[i]:child_start[i]]],
+                "children": lambda i, record: [person_id(j) for j in targets[child_start[i]:spouse_start[i]]],
+                "spouse": lambda i, record: (person_id(targets[spouse_start[i]])
+                                             if spouse_start[i] < offsets[i + 1] else None)
+            }
+            getters = [(field, columns[field]) for field in fields]
+
+            def project() -> Iterator[Dict]:
+                for i in indices:
+                    record = table.record(i)
+                    yield {field: getter(i, record) for field, getter in getters}
+            return project()
+
+        def generate() -> Iterator[Dict]:
+            for i in indices:
+                _, _, name_offset, name_length, birth_year, gender = table.record(i)
+                first, middle, last, end = offsets[i], child_start[i], spouse_start[i], offsets[i + 1]
+                yield {
+                    "id": person_id(i),
+                    "name": table._string(name_offset, name_length),
+                    "gender": _GENDERS[gender].value,
+                    "birth_year": None if birth_year == _NO_BIRTH_YEAR else birth_year,
+                    "parents": [person_id(j) for j in targets[first:middle]],
+                    "children": [person_id(j) for j in targets[middle:last]],
+                    "spouse": person_id(targets[last]) if last < end else None
+                }
+        return generate()
+
+    def add_person(self, person_id: str, name: str, gender: str, birth_year: Optional[int] = None) -> Person:
+        self.materialize()
+        return super().add_person(person_id, name, gender, birth_year)
+
+    def remove_person(self, person_id: str) -> bool:
+        self.materialize()
+        return super().remove_person(person_id)
+
+    def add_parent_child(self, parent_id: str, child_id: str):
+        self.materialize()
+        super().add_parent_child(parent_id, child_id)
+
+    def add_spouse(self, person1_id: str, person2_id: str):
+        self.materialize()
+        super().add_spouse(person1_id, person2_id)
+
+    def clear(self):
+        self.materialize()
+        super().clear()
+
+    def apply_batch(self, operations: Iterable) -> int:
+        self.materialize()
+        return super().apply_batch(operations)
+
+    def bulk_load(self, stream, fmt: str = "json", chunk_size: int = 1 << 20,
+                  max_errors: int = 1000) -> Dict:
+        self.materialize()
+        return super().bulk_load(stream, fmt, chunk_size, max_errors)
+
+    def export_gedcom(self) -> Iterator[str]:
+        self.materialize()
+        return super().export_gedcom()
+
+    def is_ancestor(self, ancestor_id: str, person_id: str) -> bool:
+        self.materialize()
+        return super().is_ancestor(ancestor_id, person_id)
+
+    def common_ancestors(self, person1_id: str, person2_id: str, closest_only: bool = True) -> List[Person]:
+        self.materialize()
+        return super().common_ancestors(person1_id, person2_id, closest_only)
+
+    def generation(self, person_id: str) -> int:
+        self.materialize()
+        return super().generation(person_id)
+
+    def layout(self) -> List[Dict]:
+        self.materialize()
+        return super().layout()
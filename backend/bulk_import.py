@@ -0,0 +1,234 @@
+"""
+خواندن جریانی فایل‌های ورودی درخت خانوادگی (JSON، NDJSON، CSV و GEDCOM)
+
+ورودی تکه به تکه خوانده می‌شود و هر رکورد به محض کامل شدن تحویل داده
+می‌شود، پس حافظه مصرفی به اندازه فایل بستگی ندارد. قالب‌ها:
+
+    json    همان شکل sample_family.json: شیئی با آرایه people (و اختیاری
+            relationships)، یا مستقیماً آرایه‌ای از افراد
+    ndjson  هر خط یک فرد، یا یک رابطه با کلید type
+    csv     ستون‌های id,name,gender,birth_year,parents,children,spouse؛
+            چند والد یا فرزند با «;» جدا می‌شوند
+    gedcom  رکوردهای INDI و FAM (ماژول gedcom)
+
+خطای ساختاری (مثلاً JSON شکسته) با ValueError کل خواندن را متوقف می‌کند؛
+خطای یک خط NDJSON فقط همان رکورد را نامعتبر می‌کند.
+"""
+
+import csv
+import io
+import json
+import re
+import sys
+from typing import Any, Iterator, List, Optional, Tuple
+
+from gedcom import read_gedcom
+
+FORMATS = ("json", "ndjson", "csv", "gedcom")
+
+CSV_SEPARATOR = ";"
+
+_GENDERS = ("male", "female")
+_WHITESPACE = re.compile(r"\s*")
+
+# (رکورد، پیام خطا)؛ یکی از این دو None است
+Record = Tuple[Optional[Any], Optional[str]]
+
+
+def read_records(stream, fmt: str, chunk_size: int = 1 << 20) -> Iterator[Record]:
+    """رکوردهای ورودی به ترتیب فایل؛ stream می‌تواند متنی یا دودویی (UTF-8) باشد"""
+    if fmt not in FORMATS:
+        raise ValueError(f"قالب پشتیبانی نمی‌شود: {fmt}")
+    if not isinstance(stream, io.TextIOBase):
+        if isinstance(stream, io.RawIOBase):
+            stream = io.BufferedReader(stream, chunk_size)
+        stream = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if fmt == "json":
+        return _read_json(stream, chunk_size)
+    if fmt == "ndjson":
+        return _read_ndjson(stream)
+    if fmt == "gedcom":
+        return read_gedcom(stream)
+    return _read_csv(stream)
+
+
+def _read_ndjson(stream) -> Iterator[Record]:
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line), None
+        except ValueError as e:
+            yield None, f"JSON نامعتبر: {e}"
+
+
+def _read_csv(stream) -> Iterator[Record]:
+    reader = csv.DictReader(stream)
+    if reader.fieldnames is None:
+        return
+    missing = [field for field in ("id", "name", "gender") if field not in reader.fieldnames]
+    if missing:
+        raise ValueError(f"ستون‌های CSV یافت نشد: {', '.join(missing)}")
+    try:
+        for row in reader:
+            birth_year = (row.get("birth_year") or "").strip()
+            record = {
+                "id": row["id"],
+                "name": row["name"],
+                "gender": row["gender"],
+                "birth_year": birth_year or None,
+                "parents": _split(row.get("parents")),
+                "children": _split(row.get("children")),
+                "spouse": (row.get("spouse") or "").strip() or None,
+            }
+            if birth_year:
+                try:
+                    record["birth_year"] = int(birth_year)
+                except ValueError:
+                    yield None, f"سال تولد نامعتبر: {birth_year}"
+                    continue
+            yield record, None
+    except csv.Error as e:
+        raise ValueError(f"CSV نامعتبر (خط {reader.line_num}): {e}")
+
+
+def _split(value: Optional[str]) -> List[str]:
+    if not value:
+        return []
+    return [part.strip() for part in value.split(CSV_SEPARATOR) if part.strip()]
+
+
+class _JSONStream:
+    """خواندن مقدارهای JSON پشت سر هم از یک جریان متنی با بافر محدود"""
+
+    def __init__(self, stream, chunk_size: int):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+
+    def _read_more(self):
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+
+    def peek(self) -> str:
+        """اولین نویسه غیرفاصله (یا رشته خالی در پایان ورودی)"""
+        while True:
+            self.position = _WHITESPACE.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer) or self.eof:
+                return self.buffer[self.position:self.position + 1]
+            self._read_more()
+
+    def expect(self, characters: str) -> str:
+        character = self.peek()
+        if not character or character not in characters:
+            raise ValueError(f"JSON نامعتبر: انتظار «{characters}» به جای «{character or 'پایان فایل'}»")
+        self.position += 1
+        return character
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError as e:
+                if self.eof:
+                    raise ValueError(f"JSON نامعتبر: {e}")
+                self._read_more()
+                continue
+            # عددی که به انتهای بافر چسبیده ممکن است در تکه بعد ادامه داشته باشد
+            if end == len(self.buffer) and not self.eof:
+                self._read_more()
+                continue
+            self.position = end
+            return value
+
+    def array(self) -> Iterator[Any]:
+        self.expect("[")
+        if self.peek() == "]":
+            self.position += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(",]") == "]":
+                return
+
+
+def _read_json(stream, chunk_size: int) -> Iterator[Record]:
+    reader = _JSONStream(stream, chunk_size)
+    start = reader.peek()
+    if start == "[":
+        for record in reader.array():
+            yield record, None
+    elif start == "{":
+        reader.expect("{")
+        if reader.peek() == "}":
+            reader.position += 1
+        else:
+            while True:
+                key = reader.value()
+                reader.expect(":")
+                if key in ("people", "relationships") and reader.peek() == "[":
+                    for record in reader.array():
+                        if key == "relationships" and isinstance(record, dict):
+                            record.setdefault("type", None)
+                        yield record, None
+                else:
+                    reader.value()
+                if reader.expect(",}") == "}":
+                    break
+    else:
+        raise ValueError("JSON نامعتبر: ورودی باید شیء یا آرایه باشد")
+    if reader.peek():
+        raise ValueError("JSON نامعتبر: داده اضافه پس از پایان")
+
+
+def parse_person(record: Any) -> Tuple[str, str, str, Optional[int], List[str], List[str], Optional[str]]:
+    """اعتبارسنجی رکورد فرد؛ (id, name, gender, birth_year, parents, children, spouse)"""
+    if not isinstance(record, dict):
+        raise ValueError("رکورد باید شیء باشد")
+    person_id = record.get("id")
+    name = record.get("name")
+    gender = record.get("gender")
+    birth_year = record.get("birth_year")
+    if not isinstance(person_id, str) or not person_id:
+        raise ValueError("شناسه فرد الزامی است")
+    if not isinstance(name, str) or not name:
+        raise ValueError("نام فرد الزامی است")
+    if gender not in _GENDERS:
+        raise ValueError(f"جنسیت نامعتبر: {gender}")
+    if birth_year is not None and (not isinstance(birth_year, int) or isinstance(birth_year, bool)):
+        raise ValueError(f"سال تولد نامعتبر: {birth_year}")
+    parents = _references(record.get("parents"), "parents")
+    children = _references(record.get("children"), "children")
+    spouse = record.get("spouse")
+    if spouse is not None and (not isinstance(spouse, str) or not spouse):
+        raise ValueError("شناسه همسر نامعتبر است")
+    return person_id, name, gender, birth_year, parents, children, spouse
+
+
+def _references(value: Any, field: str) -> List[str]:
+    if value is None:
+        return []
+    if not isinstance(value, list) or not all(isinstance(item, str) and item for item in value):
+        raise ValueError(f"فیلد {field} باید لیستی از شناسه‌ها باشد")
+    return [sys.intern(item) for item in value]
+
+
+def parse_relationship(record: dict) -> Tuple[str, str, str]:
+    """اعتبارسنجی رکورد رابطه؛ ("parent-child", والد، فرزند) یا ("spouse", فرد۱، فرد۲)"""
+    kind = record.get("type")
+    if kind == "parent-child":
+        first, second = record.get("parent"), record.get("child")
+    elif kind == "spouse":
+        first, second = record.get("person1"), record.get("person2")
+    else:
+        raise ValueError(f"نوع رابطه نامعتبر: {kind}")
+    if not isinstance(first, str) or not first or not isinstance(second, str) or not second:
+        raise ValueError("شناسه افراد رابطه الزامی است")
+    return kind, sys.intern(first), sys.intern(second)
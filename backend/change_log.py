@@ -0,0 +1,118 @@
+"""
+حلقه محدود تغییرات اخیر درخت برای فید تغییرات (/api/changes)
+
+هر تغییر با نسخه درخت پس از آن ثبت می‌شود. کلاینتی که آخرین نسخه دیده‌شده را
+دارد فقط تغییرات بعدی را می‌گیرد؛ اگر آن نسخه از حلقه بیرون رفته باشد یا درخت
+بدون ثبت تغییر عوض شده باشد، پاسخ None است و کلاینت باید کل درخت را دوباره
+بگیرد. هر تغییر پیش از انتشار نسخه جدید درخت ثبت می‌شود، پس خواننده بدون قفل
+ممکن است تغییری جلوتر از نسخه درخت ببیند ولی هرگز نسخه‌ای بدون تغییرش.
+جایی که درخت را از دیسک جایگزین می‌کند reset را صدا می‌زند.
+"""
+
+import threading
+from collections import deque
+from itertools import islice
+from typing import Any, Dict, List, Optional, Tuple
+
+# (نسخه، نام عملیات، آرگومان‌ها)
+Change = Tuple[int, str, tuple]
+
+
+class ChangeLog:
+    """آخرین capacity تغییر به ترتیب نسخه، بدون شکاف"""
+
+    def __init__(self, capacity: int = 10_000, version: int = 0):
+        if capacity < 1:
+            raise ValueError("ظرفیت فید تغییرات باید مثبت باشد")
+        self._changes: deque = deque(maxlen=capacity)
+        # نسخه‌ای که تاریخچه از بعد از آن کامل است (وقتی حلقه خالی است)
+        self._start = version
+        self._condition = threading.Condition(threading.Lock())
+        # notify فقط وقتی کسی منتظر است (append در بارگذاری انبوه میلیون‌ها بار صدا زده می‌شود)
+        self._waiters = 0
+
+    @property
+    def capacity(self) -> int:
+        return self._changes.maxlen
+
+    def resize(self, capacity: int):
+        if capacity < 1:
+            raise ValueError("ظرفیت فید تغییرات باید مثبت باشد")
+        with self._condition:
+            self._changes = deque(self._changes, maxlen=capacity)
+
+    def _last(self) -> int:
+        return self._changes[-1][0] if self._changes else self._start
+
+    def reset(self, version: int):
+        """خالی کردن تاریخچه؛ درخت بدون ثبت تغییر به version رسیده (بارگذاری از دیسک)"""
+        with self._condition:
+            self._changes.clear()
+            self._start = version
+
+    def append(self, version: int, operation: str, args: tuple):
+        with self._condition:
+            if version != self._last() + 1:
+                # تاریخچه پیوسته نیست؛ از همین تغییر از نو شروع می‌شود
+                self._changes.clear()
+                self._start = version - 1
+            self._changes.append((version, operation, args))
+            if self._waiters:
+                self._condition.notify_all()
+
+    def truncate(self, version: int):
+        """حذف تغییرات بعد از version (مثلاً تراکنشی که برگشت خورده)"""
+        with self._condition:
+            while self._changes and self._changes[-1][0] > version:
+                self._changes.pop()
+            self._start = min(self._start, version)
+
+    def since(self, version: int, current: int) -> Optional[List[Change]]:
+        """تغییرات بعد از version تا نسخه فعلی درخت، یا None اگر تاریخچه کامل نیست
+
+        حلقه را تغییر نمی‌دهد؛ None فقط به همین فراخواننده گفته می‌شود.
+        """
+        with self._condition:
+            if self._last() < current:
+                # نسخه درخت بدون ثبت تغییر جلو رفته
+                return None
+            first = self._changes[0][0] - 1 if self._changes else self._start
+            if version < first or version > current:
+                return None
+            # تغییری که ثبت شده ولی نسخه‌اش هنوز منتشر نشده برگردانده نمی‌شود
+            return list(islice(self._changes, version - first, current - first))
+
+    def after(self, version: int) -> List[Change]:
+        """تغییرات موجود در حلقه با نسخه بزرگ‌تر از version (بدون بررسی کامل بودن)"""
+        with self._condition:
+            return [change for change in self._changes if change[0] > version]
+
+    def wait(self, version: int, timeout: float) -> bool:
+        """انتظار تا ثبت تغییری جدیدتر از version یا پایان timeout"""
+        with self._condition:
+            self._waiters += 1
+            try:
+                return self._condition.wait_for(lambda: self._last() > version, timeout)
+            finally:
+                self._waiters -= 1
+
+
+def describe_change(version: int, operation: str, args: tuple) -> Dict[str, Any]:
+    """شکل JSON یک تغییر برای کلاینت"""
+    if operation == "add_person":
+        person_id, name, gender, birth_year = args
+        return {"version": version, "type": "person_added",
+                "person": {"id": person_id, "name": name, "gender": gender, "birth_year": birth_year,
+                           "parents": [], "children": [], "spouse": None}}
+    if operation == "remove_person":
+        return {"version": version, "type": "person_removed", "id": args[0]}
+    if operation == "add_parent_child":
+        return {"version": version, "type": "edge_added", "parent_id": args[0], "child_id": args[1]}
+    if operation == "add_spouse":
+        return {"version": version, "type": "spouse_set", "person1_id": args[0], "person2_id": args[1]}
+    if operation == "clear":
+        return {"version": version, "type": "cleared"}
+    if operation == "apply_batch":
+        return {"version": version, "type": "batch",
+                "changes": [describe_change(version, name, tuple(args)) for name, *args in args[0]]}
+    raise ValueError(f"عملیات ناشناخته: {operation}")
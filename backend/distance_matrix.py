@@ -0,0 +1,297 @@
+"""
+ماتریس فاصله و نسبت همه جفت‌های یک زیرمجموعه از افراد
+
+آرایه‌های CSR درخت، جنسیت‌ها و اندیس زیرمجموعه (بدون شناسه‌ها و اشیای Person)
+یک بار در یک بلوک multiprocessing.shared_memory کپی می‌شوند و پروسه‌های worker
+بدون pickle کردن درخت به همان بلوک وصل می‌شوند. هر worker برای یک برش از
+مبدأها BFS تک‌منبعی (GraphSnapshot.shortest_path_tree) اجرا می‌کند و سطرهای
+نتیجه را مستقیم در یک فایل mmap می‌نویسد؛ پس ماتریس 50k×50k (حدود ۵ گیگابایت
+فاصله) در حافظه هیچ پروسه‌ای جمع نمی‌شود.
+
+فاصله‌ها uint16 ذخیره می‌شوند (UNREACHABLE برای جفت بدون مسیر). برچسب هر جفت
+همان برچسب relationship_map است؛ هر بلوک سطر جدول برچسب‌های خودش را دارد و
+ماتریس فقط اندیس برچسب (uint32) را نگه می‌دارد.
+"""
+
+import mmap
+import multiprocessing
+import os
+import tempfile
+from array import array
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from graph_snapshot import GraphSnapshot
+from persian_relations import RelationScan
+
+UNREACHABLE = 0xFFFF
+# مسیرهای طولانی‌تر با همین مقدار ثبت می‌شوند
+MAX_DISTANCE = UNREACHABLE - 1
+
+# تعداد سطرهای هر کار؛ کارهای کوچک بین workerها بهتر پخش می‌شوند
+BLOCK_ROWS = 64
+
+# (نام، نوع) بخش‌های حافظه مشترک؛ نوع‌های بزرگ‌تر اول تا هم‌ترازی حفظ شود
+_SECTIONS = (
+    ("offsets", "q"),
+    ("child_start", "q"),
+    ("spouse_start", "q"),
+    ("targets", "i"),
+    ("subset", "i"),
+    ("genders", "B"),
+)
+
+Layout = List[Tuple[str, str, int, int]]
+
+
+class SharedGraph:
+    """کپی فقط‌خواندنی گراف و زیرمجموعه در حافظه مشترک"""
+
+    def __init__(self, shm: shared_memory.SharedMemory, layout: Layout):
+        self.shm = shm
+        self.layout = layout
+
+    @classmethod
+    def create(cls, graph: GraphSnapshot, genders: bytes, subset: Sequence[int]) -> "SharedGraph":
+        sources = {
+            "offsets": graph.offsets,
+            "child_start": graph.child_start,
+            "spouse_start": graph.spouse_start,
+            "targets": graph.targets,
+            "subset": subset,
+            "genders": genders
+        }
+        layout, size = [], 0
+        for name, code in _SECTIONS:
+            length = len(sources[name])
+            layout.append((name, code, size, length))
+            size += length * array(code).itemsize
+
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        try:
+            for name, code, offset, length in layout:
+                values = sources[name]
+                if not (isinstance(values, array) and values.typecode == code):
+                    values = array(code, values)
+                shm.buf[offset:offset + len(values) * values.itemsize] = memoryview(values).cast("B")
+        except BaseException:
+            shm.close()
+            shm.unlink()
+            raise
+        return cls(shm, layout)
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def _label_offset(count: int) -> int:
+    # شناسه‌های برچسب پس از فاصله‌ها، هم‌تراز با 4 بایت
+    return (count * count * 2 + 3) & ~3
+
+
+class _RowWriter:
+    """محاسبه و نوشتن سطرهای ماتریس در یک پروسه"""
+
+    def __init__(self, shm: shared_memory.SharedMemory, layout: Layout, path: str, labels: bool):
+        self._shm = shm
+        self._views = {
+            name: shm.buf[offset:offset + length * array(code).itemsize].cast(code)
+            for name, code, offset, length in layout
+        }
+        views = self._views
+        self.genders = views["genders"]
+        self.subset = views["subset"].tolist()
+        self.graph = GraphSnapshot.from_buffers(
+            range(len(self.genders)), None,
+            views["offsets"], views["child_start"], views["spouse_start"], views["targets"]
+        )
+        self.labels = labels
+        with open(path, "r+b") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0)
+
+    def fill(self, start: int, end: int) -> Tuple[int, Optional[List[Optional[str]]]]:
+        """سطرهای start تا end؛ خروجی: (start، جدول برچسب‌های این بلوک)"""
+        subset = self.subset
+        count = len(subset)
+        genders = self.genders
+        labels = self.labels
+        # اندیس 0 یعنی مسیری نیست
+        table: List[Optional[str]] = [None]
+        codes: Dict[str, int] = {}
+        distances = array("H", [UNREACHABLE]) * count
+        label_ids = array("I", [0]) * count
+
+        for row in range(start, end):
+            source = subset[row]
+            previous, relation, _ = self.graph.shortest_path_tree(source, subset)
+            # فاصله و حالت طبقه‌بند فقط برای گره‌های روی مسیر ستون‌ها ساخته می‌شود
+            depth = {source: 0}
+            scans = {source: RelationScan(genders[source])}
+            for column, target in enumerate(subset):
+                if previous[target] == -1:
+                    distances[column] = UNREACHABLE
+                    label_ids[column] = 0
+                    continue
+                chain = []
+                node = target
+                while node not in depth:
+                    chain.append(node)
+                    node = previous[node]
+                distance = depth[node]
+                scan = scans[node] if labels else None
+                for node in reversed(chain):
+                    distance += 1
+                    depth[node] = distance
+                    if labels:
+                        scan = scan.advance(relation[node], genders[node])
+                        scans[node] = scan
+                distances[column] = min(depth[target], MAX_DISTANCE)
+                if labels:
+                    label = scans[target].label()
+                    code = codes.get(label)
+                    if code is None:
+                        code = codes[label] = len(table)
+                        table.append(label)
+                    label_ids[column] = code
+
+            position = row * count * 2
+            self._mmap[position:position + count * 2] = distances
+            if labels:
+                position = _label_offset(count) + row * count * 4
+                self._mmap[position:position + count * 4] = label_ids
+
+        return start, table if labels else None
+
+    def close(self):
+        self._mmap.close()
+        self.graph = None
+        for view in self._views.values():
+            view.release()
+        self._views.clear()
+
+
+_worker: Optional[_RowWriter] = None
+
+
+def _init_worker(name: str, layout: Layout, path: str, labels: bool):
+    global _worker
+    _worker = _RowWriter(shared_memory.SharedMemory(name=name), layout, path, labels)
+
+
+def _fill_rows(rows: Tuple[int, int]):
+    return _worker.fill(*rows)
+
+
+class DistanceMatrix:
+    """ماتریس فاصله و نسبت روی فایل mmap
+
+    با close (یا with) بسته می‌شود؛ فایل موقت (وقتی path داده نشده) هم حذف می‌شود.
+    """
+
+    def __init__(self, ids: Sequence[str], path: str,
+                 tables: Optional[List[List[Optional[str]]]], temporary: bool):
+        self.ids = list(ids)
+        self.path = path
+        self._index = {}
+        for i, person_id in enumerate(self.ids):
+            self._index.setdefault(person_id, i)
+        self._tables = tables
+        self._temporary = temporary
+        count = len(self.ids)
+        with open(path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        self._distances = view[:count * count * 2].cast("H")
+        self._label_ids = None
+        if tables is not None:
+            offset = _label_offset(count)
+            self._label_ids = view[offset:offset + count * count * 4].cast("I")
+        view.release()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __enter__(self) -> "DistanceMatrix":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _cell(self, person1_id: str, person2_id: str) -> Tuple[int, int]:
+        try:
+            row, column = self._index[person1_id], self._index[person2_id]
+        except KeyError as e:
+            raise ValueError(f"فرد {e.args[0]} در ماتریس نیست") from None
+        return row, row * len(self.ids) + column
+
+    def distance(self, person1_id: str, person2_id: str) -> Optional[int]:
+        """طول کوتاه‌ترین مسیر، یا None اگر مسیری نباشد"""
+        _, cell = self._cell(person1_id, person2_id)
+        distance = self._distances[cell]
+        return None if distance == UNREACHABLE else distance
+
+    def label(self, person1_id: str, person2_id: str) -> Optional[str]:
+        """نسبت ساده‌شده person2 از دید person1، یا None اگر مسیری نباشد"""
+        if self._label_ids is None:
+            raise ValueError("ماتریس بدون برچسب ساخته شده است")
+        row, cell = self._cell(person1_id, person2_id)
+        return self._tables[row // BLOCK_ROWS][self._label_ids[cell]]
+
+    def row(self, person_id: str) -> List[Optional[int]]:
+        """فاصله یک فرد با همه افراد ماتریس به ترتیب ids"""
+        count = len(self.ids)
+        start = self._cell(person_id, person_id)[0] * count
+        return [None if d == UNREACHABLE else d for d in self._distances[start:start + count]]
+
+    def close(self):
+        if self._mmap is None:
+            return
+        self._distances.release()
+        if self._label_ids is not None:
+            self._label_ids.release()
+        self._mmap.close()
+        self._mmap = None
+        if self._temporary:
+            os.unlink(self.path)
+
+
+def build_distance_matrix(shared: SharedGraph, ids: Sequence[str], path: Optional[str] = None,
+                          workers: Optional[int] = None, labels: bool = True) -> DistanceMatrix:
+    """پر کردن ماتریس با workers پروسه (پیش‌فرض تعداد هسته‌ها)
+
+    با workers=1 همه سطرها در همین پروسه محاسبه می‌شوند.
+    """
+    count = len(ids)
+    temporary = path is None
+    if temporary:
+        descriptor, path = tempfile.mkstemp(suffix=".matrix")
+        os.close(descriptor)
+    size = _label_offset(count) + count * count * 4 if labels else count * count * 2
+    try:
+        with open(path, "wb") as file:
+            # فایل تنک؛ فقط سطرهای نوشته‌شده روی دیسک جا می‌گیرند
+            file.truncate(max(size, 1))
+
+        blocks = [(start, min(start + BLOCK_ROWS, count)) for start in range(0, count, BLOCK_ROWS)]
+        tables = [None] * len(blocks)
+        workers = min(workers or os.cpu_count() or 1, len(blocks))
+        if workers <= 1:
+            writer = _RowWriter(shared.shm, shared.layout, path, labels)
+            try:
+                for block in blocks:
+                    start, table = writer.fill(*block)
+                    tables[start // BLOCK_ROWS] = table
+            finally:
+                writer.close()
+        else:
+            with multiprocessing.get_context().Pool(
+                    workers, initializer=_init_worker,
+                    initargs=(shared.shm.name, shared.layout, path, labels)) as pool:
+                for start, table in pool.imap_unordered(_fill_rows, blocks):
+                    tables[start // BLOCK_ROWS] = table
+        return DistanceMatrix(ids, path, tables if labels else None, temporary)
+    except BaseException:
+        if temporary:
+            os.unlink(path)
+        raise
@@ -2,10 +2,29 @@
 سیستم شجره‌نامه خانوادگی با الگوریتم‌های DFS و BFS
 """
 
-from collections import deque
-from typing import Optional, List, Dict, Tuple
+from array import array
+from bisect import bisect_right
+from contextlib import contextmanager
+from itertools import islice
+from typing import Callable, Collection, Iterable, Iterator, Optional, List, Dict, Sequence, Tuple
 from enum import Enum
+from functools import wraps
+import gc
 import json
+import sys
+import threading
+import uuid
+
+from ancestry import AncestorIndex
+from bulk_import import FORMATS, parse_person, parse_relationship, read_records
+from change_log import Change, ChangeLog
+from distance_matrix import DistanceMatrix, SharedGraph, build_distance_matrix
+from gedcom import iter_gedcom
+from graph_snapshot import GraphSnapshot
+from kinship import Pedigree
+from layout import GenerationIndex, layered_layout
+from persian_relations import FEMALE, MALE, RELATION_CODES, RelationScan
+from rw_lock import ReadWriteLock
 
 
 class Gender(Enum):
@@ -13,22 +32,36 @@ class Gender(Enum):
     FEMALE = "female"
 
 
+_GENDER_CODES = {Gender.MALE: MALE, Gender.FEMALE: FEMALE}
+
+
 class RelationType(Enum):
     PARENT = "parent"
     CHILD = "child"
     SPOUSE = "spouse"
 
 
+# تاپل خالی مشترک برای افرادی که والد یا فرزند ندارند؛ لیست فقط هنگام
+# افزودن اولین رابطه ساخته می‌شود
+_NO_RELATIVES: Tuple = ()
+
+# ظرف‌های کوچک لیست می‌مانند (جستجوی خطی با طول محدود)؛ بزرگ‌تر از این
+# اندازه به دیکشنری با حفظ ترتیب درج تبدیل می‌شوند تا افزودن و حذف O(1) بماند
+_LIST_LIMIT = 16
+
+
 class Person:
     """کلاس نمایش یک فرد در شجره‌نامه"""
     
+    __slots__ = ("id", "name", "gender", "birth_year", "parents", "children", "spouse")
+    
     def __init__(self, person_id: str, name: str, gender: Gender, birth_year: Optional[int] = None):
-        self.id = person_id
-        self.name = name
+        self.id = sys.intern(person_id)
+        self.name = sys.intern(name)
         self.gender = gender
         self.birth_year = birth_year
-        self.parents: List[Person] = []
-        self.children: List[Person] = []
+        self.parents: Collection[Person] = _NO_RELATIVES
+        self.children: Collection[Person] = _NO_RELATIVES
         self.spouse: Optional[Person] = None
     
     def to_dict(self):
@@ -43,12 +76,184 @@ class Person:
         }
 
 
+# فیلدهای قابل انتخاب در خروجی افراد (پارامتر fields)
+PERSON_FIELDS: Dict[str, Callable[[Person], object]] = {
+    "id": lambda p: p.id,
+    "name": lambda p: p.name,
+    "gender": lambda p: p.gender.value,
+    "birth_year": lambda p: p.birth_year,
+    "parents": lambda p: [parent.id for parent in p.parents],
+    "children": lambda p: [child.id for child in p.children],
+    "spouse": lambda p: p.spouse.id if p.spouse else None
+}
+
+
+def check_fields(fields: Optional[Collection[str]]) -> Optional[Tuple[str, ...]]:
+    """اعتبارسنجی فیلدهای درخواستی؛ None یعنی همه فیلدها"""
+    if fields is None:
+        return None
+    unknown = [field for field in fields if field not in PERSON_FIELDS]
+    if unknown:
+        raise ValueError(f"فیلد نامعتبر: {', '.join(unknown)}")
+    return tuple(fields)
+
+
+def _with_relative(relatives, person: "Person"):
+    """افزودن فرد به ظرف والدین/فرزندان و برگرداندن ظرف (ممکن است نوع ظرف عوض شود)"""
+    if not relatives:
+        return [person]
+    if type(relatives) is dict:
+        relatives[person] = None
+        return relatives
+    if len(relatives) < _LIST_LIMIT:
+        relatives.append(person)
+        return relatives
+    promoted = dict.fromkeys(relatives)
+    promoted[person] = None
+    return promoted
+
+
+def _relatives_from(relatives: List["Person"]):
+    """ظرف والدین/فرزندان برای لیستی که یک‌جا ساخته شده (بارگذاری از دیسک)"""
+    if not relatives:
+        return _NO_RELATIVES
+    if len(relatives) > _LIST_LIMIT:
+        return dict.fromkeys(relatives)
+    return relatives
+
+
+def _without_relative(relatives, person: "Person"):
+    """حذف فرد از ظرف والدین/فرزندان و برگرداندن ظرف"""
+    if type(relatives) is dict:
+        del relatives[person]
+    else:
+        relatives.remove(person)
+    return relatives if relatives else _NO_RELATIVES
+
+
+def _copy_relatives(relatives):
+    """کپی ظرف والدین/فرزندان با همان نوع"""
+    return type(relatives)(relatives) if relatives else _NO_RELATIVES
+
+
+# عملیاتی که در apply_batch مجازند
+BATCH_OPERATIONS = ("add_person", "remove_person", "add_parent_child", "add_spouse")
+
+
+@contextmanager
+def _gc_paused():
+    """توقف GC چرخه‌ای هنگام ساخت میلیون‌ها شیء
+
+    در غیر این صورت GC بارها کل اشیای تازه را پیمایش می‌کند و ساخت و بارگذاری
+    تصویر چند برابر کند می‌شود.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _reads(method):
+    """اجرای متد با قفل خواندن درخت"""
+    @wraps(method)
+    def locked(self, *args, **kwargs):
+        lock = self.lock
+        lock.acquire_read()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            lock.release_read()
+    return locked
+
+
+def _writes(method):
+    """اجرای متد با قفل نوشتن درخت
+
+    بدون context manager: add_person و add_parent_child در بارگذاری انبوه
+    میلیون‌ها بار به صورت تودرتو صدا زده می‌شوند.
+    """
+    @wraps(method)
+    def locked(self, *args, **kwargs):
+        lock = self.lock
+        lock.acquire_write()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            lock.release_write()
+    return locked
+
+
 class FamilyTree:
-    """کلاس اصلی درخت خانوادگی"""
+    """کلاس اصلی درخت خانوادگی
+    
+    متدهای عمومی برای استفاده هم‌زمان چند نخ امن هستند: پرس‌وجوها با قفل
+    خواندن و تغییرات با قفل نوشتن (lock) اجرا می‌شوند. کاری که چند فراخوانی
+    را باید یک‌جا ببیند (مثلاً پاک کردن و ساختن دوباره درخت) خودش lock را
+    می‌گیرد.
+    """
     
     def __init__(self):
         self.people: Dict[str, Person] = {}
+        # شمارنده تغییرات؛ با هر تغییر افزایش می‌یابد تا کش‌ها نتیجه کهنه برنگردانند
+        self.version = 0
+        # شناسه یکتای این منبع داده؛ همراه version وضعیت داده را مشخص می‌کند
+        # (نسخه درخت حافظه‌ای پس از راه‌اندازی دوباره از صفر شروع می‌شود)
+        self.instance_id = uuid.uuid4().hex
+        self._snapshot: Optional[GraphSnapshot] = None
+        # شجره نسل‌بندی‌شده برای ضرایب خویشاوندی؛ همراه تصویر CSR کهنه می‌شود
+        self._pedigree: Optional[Pedigree] = None
+        self._ancestry = AncestorIndex()
+        # نسل هر فرد برای چیدمان؛ مثل شاخص اجداد با هر یال به‌روز می‌شود
+        self._generations = GenerationIndex()
+        # چیدمان لایه‌ای برای نمایش: (نسخه، گره‌ها)
+        self._layout: Tuple[int, List[Dict]] = (-1, [])
+        self._listeners: List[Callable[[str, tuple], None]] = []
+        # حلقه محدود آخرین تغییرات برای فید تغییرات کلاینت‌ها
+        self.changes = ChangeLog()
+        # شناسه‌های مرتب برای صفحه‌بندی: (نسخه، لیست)
+        self._sorted_ids: Tuple[int, List[str]] = (-1, [])
+        # عملیات دسته در حال اجرا (apply_batch)؛ None یعنی خارج از دسته
+        self._batch: Optional[List[tuple]] = None
+        self.lock = ReadWriteLock()
+        # ساخت تنبل کش‌ها (CSR، شاخص اجداد، شناسه‌های مرتب) زیر قفل خواندن
+        # توسط چند خواننده هم‌زمان؛ فقط یکی می‌سازد
+        self._cache_lock = threading.Lock()
+    
+    def subscribe(self, listener: Callable[[str, tuple], None]):
+        """ثبت شنونده‌ای که پس از هر تغییر با (نام عملیات، آرگومان‌ها) صدا زده می‌شود"""
+        self._listeners.append(listener)
     
+    def unsubscribe(self, listener: Callable[[str, tuple], None]):
+        self._listeners.remove(listener)
+    
+    def changes_since(self, version: int) -> Optional[List[Change]]:
+        """تغییرات بعد از نسخه داده‌شده، یا None اگر کلاینت باید کل درخت را دوباره بگیرد"""
+        return self.changes.since(version, self.version)
+    
+    def etag(self) -> str:
+        """برچسب وضعیت فعلی داده برای ETag؛ با هر تغییر عوض می‌شود"""
+        return f"{self.instance_id}-{self.version}"
+    
+    def _changed(self, operation: str, *args):
+        """ثبت یک تغییر: افزایش نسخه، نامعتبر کردن تصویر CSR، ثبت در فید تغییرات و خبر دادن به شنونده‌ها"""
+        if self._batch is not None:
+            # درون دسته فقط جمع می‌شود؛ apply_batch در پایان یک تغییر ثبت می‌کند
+            self._batch.append((operation, *args))
+            self._snapshot = None
+            return
+        version = self.version + 1
+        self._snapshot = None
+        # اول ثبت در فید و بعد انتشار نسخه: خواننده بدون قفل (changes_since)
+        # هرگز نسخه‌ای را نمی‌بیند که تغییرش هنوز در حلقه نیست
+        self.changes.append(version, operation, args)
+        self.version = version
+        for listener in self._listeners:
+            listener(operation, args)
+    
+    @_writes
     def add_person(self, person_id: str, name: str, gender: str, birth_year: Optional[int] = None) -> Person:
         """افزودن فرد جدید"""
         if person_id in self.people:
@@ -56,8 +261,10 @@ class FamilyTree:
         
         person = Person(person_id, name, Gender(gender), birth_year)
         self.people[person_id] = person
+        self._changed("add_person", person.id, person.name, person.gender.value, birth_year)
         return person
     
+    @_writes
     def remove_person(self, person_id: str) -> bool:
         """حذف فرد از درخت"""
         if person_id not in self.people:
@@ -68,18 +275,22 @@ class FamilyTree:
         # حذف ارتباطات
         for parent in person.parents:
             if person in parent.children:
-                parent.children.remove(person)
+                parent.children = _without_relative(parent.children, person)
         
         for child in person.children:
             if person in child.parents:
-                child.parents.remove(person)
+                child.parents = _without_relative(child.parents, person)
         
         if person.spouse:
             person.spouse.spouse = None
         
         del self.people[person_id]
+        self._changed("remove_person", person_id)
+        self._ancestry.invalidate()
+        self._generations.invalidate()
         return True
     
+    @_writes
     def add_parent_child(self, parent_id: str, child_id: str):
         """افزودن رابطه والد-فرزند"""
         if parent_id not in self.people or child_id not in self.people:
@@ -87,12 +298,18 @@ class FamilyTree:
         
         parent = self.people[parent_id]
         child = self.people[child_id]
+        if parent is child:
+            raise ValueError("فرد نمی‌تواند والد خودش باشد")
         
         if parent not in child.parents:
-            child.parents.append(parent)
+            child.parents = _with_relative(child.parents, parent)
         if child not in parent.children:
-            parent.children.append(child)
+            parent.children = _with_relative(parent.children, child)
+        self._changed("add_parent_child", parent_id, child_id)
+        self._ancestry.add_edge(parent, child)
+        self._generations.add_edge(parent, child)
     
+    @_writes
     def add_spouse(self, person1_id: str, person2_id: str):
         """افزودن رابطه همسری"""
         if person1_id not in self.people or person2_id not in self.people:
@@ -100,288 +317,555 @@ class FamilyTree:
         
         person1 = self.people[person1_id]
         person2 = self.people[person2_id]
-        
+        if person1 is person2:
+            raise ValueError("فرد نمی‌تواند همسر خودش باشد")
+        
+        # همسر قبلی هر دو آزاد می‌شود تا رابطه همسری همیشه دوطرفه بماند
+        # (BFS دوطرفه روی تصویر CSR به تقارن یال‌ها تکیه دارد)
+        for person in (person1, person2):
+            previous = person.spouse
+            if previous is not None and previous.spouse is person:
+                previous.spouse = None
         person1.spouse = person2
         person2.spouse = person1
+        self._changed("add_spouse", person1_id, person2_id)
+    
+    @_writes
+    def apply_batch(self, operations: Iterable) -> int:
+        """اجرای اتمیک دنباله‌ای از عملیات (نام عملیات، *آرگومان‌ها)
+        
+        یا همه عملیات اعمال می‌شوند یا با اولین خطا همه به حالت قبل برمی‌گردند.
+        کل دسته یک تغییر «apply_batch» است: یک افزایش نسخه، یک نامعتبر شدن
+        کش‌ها، یک رکورد ژورنال و یک رویداد در فید تغییرات. تعداد عملیات
+        برگردانده می‌شود.
+        """
+        if self._batch is not None:
+            raise ValueError("دسته تودرتو پشتیبانی نمی‌شود")
+        undo: List[Callable[[], None]] = []
+        # ترتیب افراد پیش از اولین حذف؛ فرد برگردانده‌شده جای قبلی خودش را می‌گیرد
+        # نه انتهای people (ترتیب صادرات و get_all_people عوض نمی‌شود)
+        order: Optional[List[str]] = None
+        self._batch = []
+        count = 0
+        try:
+            for count, operation in enumerate(operations, 1):
+                if not operation or operation[0] not in BATCH_OPERATIONS:
+                    raise ValueError(f"عملیات نامعتبر: {operation[0] if operation else None}")
+                name, *args = operation
+                if name == "remove_person" and order is None:
+                    order = list(self.people)
+                step = self._undo_step(name, args)
+                try:
+                    result = getattr(self, name)(*args)
+                except TypeError as e:
+                    raise ValueError(f"آرگومان‌های نامعتبر برای {name}: {e}") from e
+                if result is False:
+                    # remove_person برای فرد ناموجود؛ در دسته اتمیک خطاست
+                    raise ValueError(f"فرد با شناسه {args[0]} یافت نشد")
+                undo.append(step)
+        except BaseException as e:
+            for step in reversed(undo):
+                step()
+            if order is not None:
+                people = self.people
+                # افرادی که خود دسته افزوده بود دیگر وجود ندارند
+                restored = [(person_id, people[person_id]) for person_id in order if person_id in people]
+                people.clear()
+                people.update(restored)
+            self._batch = None
+            self._snapshot = None
+            self._ancestry.invalidate()
+            self._generations.invalidate()
+            if isinstance(e, ValueError):
+                raise ValueError(f"عملیات شماره {count}: {e}") from e
+            raise
+        applied, self._batch = self._batch, None
+        if applied:
+            self._changed("apply_batch", applied)
+        return count
+    
+    def _undo_step(self, name: str, args: List) -> Callable[[], None]:
+        """تابعی که اثر عملیات name را (اگر اجرا شود) برمی‌گرداند؛ پیش از اجرا صدا زده می‌شود"""
+        people = self.people
+        if name == "add_person":
+            person_id = args[0] if args else None
+            return lambda: people.pop(person_id, None)
+        
+        if name == "remove_person":
+            person = people.get(args[0]) if args else None
+            if person is None:
+                return lambda: None
+            # ظرف‌های بستگان عیناً کپی می‌شوند تا ترتیب هم برگردد
+            parents = [(parent, _copy_relatives(parent.children)) for parent in person.parents]
+            children = [(child, _copy_relatives(child.parents)) for child in person.children]
+            spouse = person.spouse
+            partner = spouse.spouse if spouse is not None else None
+            
+            def restore():
+                people[person.id] = person
+                for parent, relatives in parents:
+                    parent.children = relatives
+                for child, relatives in children:
+                    child.parents = relatives
+                if spouse is not None:
+                    spouse.spouse = partner
+            return restore
+        
+        if name == "add_parent_child":
+            parent = people.get(args[0]) if len(args) == 2 else None
+            child = people.get(args[1]) if len(args) == 2 else None
+            if parent is None or child is None:
+                return lambda: None
+            had_parent = parent in child.parents
+            had_child = child in parent.children
+            
+            def unlink():
+                if not had_parent:
+                    child.parents = _without_relative(child.parents, parent)
+                if not had_child:
+                    parent.children = _without_relative(parent.children, child)
+            return unlink
+        
+        # add_spouse
+        person1 = people.get(args[0]) if len(args) == 2 else None
+        person2 = people.get(args[1]) if len(args) == 2 else None
+        if person1 is None or person2 is None:
+            return lambda: None
+        # همسر هر دو و همسر همسران قبلی‌شان
+        affected = dict.fromkeys(p for p in (person1, person2, person1.spouse, person2.spouse) if p is not None)
+        spouses = [(person, person.spouse) for person in affected]
+        
+        def unmarry():
+            for person, spouse in spouses:
+                person.spouse = spouse
+        return unmarry
+    
+    def sync(self) -> bool:
+        """همگام‌سازی با منبع ذخیره‌سازی؛ درخت حافظه‌ای چیزی برای همگام‌سازی ندارد"""
+        return False
+    
+    @_writes
+    def clear(self):
+        """پاک کردن تمام افراد و روابط"""
+        self.people.clear()
+        self._changed("clear")
+        self._ancestry.invalidate()
+        self._generations.invalidate()
+    
+    @_writes
+    def bulk_load(self, stream, fmt: str = "json", chunk_size: int = 1 << 20,
+                  max_errors: int = 1000) -> Dict:
+        """بارگذاری جریانی افراد و روابط از فایل JSON، NDJSON، CSV یا GEDCOM
+        
+        گذر اول افراد را می‌سازد و ارجاع‌های parents/children/spouse را فقط به
+        صورت شناسه نگه می‌دارد؛ گذر دوم پس از خوانده شدن کل ورودی روابط را
+        برقرار می‌کند، پس ارجاع به فردی که بعداً در فایل آمده مشکلی ندارد.
+        خطای هر رکورد ثبت می‌شود و بقیه ورودی ادامه پیدا می‌کند. اگر ساختار
+        خود فایل شکسته باشد (مثلاً JSON ناتمام) افراد افزوده‌شده برداشته
+        می‌شوند و ValueError بالا می‌رود؛ درخت دست‌نخورده می‌ماند.
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"قالب پشتیبانی نمی‌شود: {fmt}")
+        report = {
+            "people_added": 0,
+            "relationships_added": 0,
+            "error_count": 0,
+            "errors": []
+        }
+        
+        def fail(item: int, person_id: Optional[str], message: str):
+            report["error_count"] += 1
+            if len(report["errors"]) < max_errors:
+                report["errors"].append({"item": item, "id": person_id, "error": message})
+        
+        # ارجاع‌های معلق به صورت لیست‌های موازی (بدون تاپل برای هر رابطه)
+        link_parents: List[str] = []
+        link_children: List[str] = []
+        link_items = array("l")
+        spouse_firsts: List[str] = []
+        spouse_seconds: List[str] = []
+        spouse_items = array("l")
+        
+        # شاخص اجداد و نسل‌ها یک‌باره در اولین پرس‌وجو بازسازی می‌شوند نه برای هر یال
+        self._ancestry.invalidate()
+        self._generations.invalidate()
+        
+        # GC چرخه‌ای در میان ساخت میلیون‌ها فرد و تغییر فقط زمان هدر می‌دهد
+        with _gc_paused():
+            item = 0
+            try:
+                for record, error in read_records(stream, fmt, chunk_size):
+                    item += 1
+                    if error is not None:
+                        fail(item, None, error)
+                        continue
+                    try:
+                        if isinstance(record, dict) and "type" in record:
+                            kind, first, second = parse_relationship(record)
+                            if kind == "spouse":
+                                spouse_firsts.append(first)
+                                spouse_seconds.append(second)
+                                spouse_items.append(item)
+                            else:
+                                link_parents.append(first)
+                                link_children.append(second)
+                                link_items.append(item)
+                            continue
+                        
+                        person_id, name, gender, birth_year, parents, children, spouse = parse_person(record)
+                        person = self.add_person(person_id, name, gender, birth_year)
+                    except ValueError as e:
+                        fail(item, record.get("id") if isinstance(record, dict) else None, str(e))
+                        continue
+                    
+                    report["people_added"] += 1
+                    for parent_id in parents:
+                        link_parents.append(parent_id)
+                        link_children.append(person.id)
+                        link_items.append(item)
+                    for child_id in children:
+                        link_parents.append(person.id)
+                        link_children.append(child_id)
+                        link_items.append(item)
+                    if spouse is not None:
+                        spouse_firsts.append(person.id)
+                        spouse_seconds.append(sys.intern(spouse))
+                        spouse_items.append(item)
+            except ValueError:
+                # گذر اول هنوز رابطه‌ای نساخته و افراد تازه آخر people هستند
+                added = list(islice(reversed(self.people), report["people_added"]))
+                for person_id in added:
+                    self.remove_person(person_id)
+                raise
+            
+            people = self.people
+            for parent_id, child_id, item in zip(link_parents, link_children, link_items):
+                parent = people.get(parent_id)
+                child = people.get(child_id)
+                if parent is None or child is None:
+                    fail(item, None, f"فرد {parent_id if parent is None else child_id} یافت نشد")
+                elif parent is child:
+                    fail(item, parent_id, "فرد نمی‌تواند والد خودش باشد")
+                elif parent not in child.parents:
+                    self.add_parent_child(parent_id, child_id)
+                    report["relationships_added"] += 1
+            
+            for first_id, second_id, item in zip(spouse_firsts, spouse_seconds, spouse_items):
+                first = people.get(first_id)
+                second = people.get(second_id)
+                if first is None or second is None:
+                    fail(item, None, f"فرد {first_id if first is None else second_id} یافت نشد")
+                elif first.spouse is not second or second.spouse is not first:
+                    self.add_spouse(first_id, second_id)
+                    report["relationships_added"] += 1
+        
+        return report
+    
+    @_reads
+    def is_ancestor(self, ancestor_id: str, person_id: str) -> bool:
+        """آیا فرد اول از اجداد فرد دوم است؟"""
+        if ancestor_id not in self.people or person_id not in self.people:
+            raise ValueError("فرد مورد نظر یافت نشد")
+        
+        self._ensure_ancestry()
+        return self._ancestry.is_ancestor(self.people[ancestor_id], self.people[person_id])
+    
+    @_reads
+    def common_ancestors(self, person1_id: str, person2_id: str, closest_only: bool = True) -> List[Person]:
+        """اجداد مشترک دو فرد (پیش‌فرض: فقط نزدیک‌ترین‌ها)"""
+        if person1_id not in self.people or person2_id not in self.people:
+            raise ValueError("فرد مورد نظر یافت نشد")
+        
+        self._ensure_ancestry()
+        return self._ancestry.common_ancestors(self.people[person1_id], self.people[person2_id], closest_only)
+    
+    def _ensure_ancestry(self):
+        with self._cache_lock:
+            self._ancestry.ensure(self.people.values())
+    
+    def snapshot(self) -> GraphSnapshot:
+        """تصویر CSR درخت؛ پس از هر تغییر در اولین درخواست دوباره ساخته می‌شود"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._cache_lock:
+                if self._snapshot is None:
+                    self._snapshot = GraphSnapshot(self.people.values())
+                snapshot = self._snapshot
+        return snapshot
     
+    def _pedigree_of(self, graph: GraphSnapshot) -> Pedigree:
+        pedigree = self._pedigree
+        if pedigree is None or pedigree.graph is not graph:
+            with self._cache_lock:
+                if self._pedigree is None or self._pedigree.graph is not graph:
+                    self._pedigree = Pedigree(graph)
+                pedigree = self._pedigree
+        return pedigree
+    
+    @_reads
+    def kinship(self, pairs: Iterable[Tuple[str, str]]) -> List[Tuple[float, float]]:
+        """ضریب خویشاوندی φ و ضریب رابطه رایت r برای هر جفت (شناسه، شناسه)
+        
+        برخلاف مسیرها همه مسیرهای اجدادی شمرده می‌شوند (kinship.py).
+        """
+        pairs = list(pairs)
+        for pair in pairs:
+            for person_id in pair:
+                if person_id not in self.people:
+                    raise ValueError(f"فرد {person_id} یافت نشد")
+        graph = self.snapshot()
+        index = graph.index
+        return self._pedigree_of(graph).kinship([(index[a], index[b]) for a, b in pairs])
+    
+    @_reads
+    def inbreeding(self, person_ids: Optional[Iterable[str]] = None) -> Dict[str, float]:
+        """ضریب هم‌خونی افراد داده‌شده (یا همه افراد)"""
+        graph = self.snapshot()
+        if person_ids is None:
+            person_ids = [person.id for person in graph.people]
+        else:
+            person_ids = list(person_ids)
+            for person_id in person_ids:
+                if person_id not in self.people:
+                    raise ValueError(f"فرد {person_id} یافت نشد")
+        index = graph.index
+        coefficients = self._pedigree_of(graph).inbreeding([index[person_id] for person_id in person_ids])
+        return dict(zip(person_ids, coefficients))
+    
+    @_reads
+    def generation(self, person_id: str) -> int:
+        """نسل فرد: طول بلندترین زنجیره والدین تا یک بنیان‌گذار"""
+        if person_id not in self.people:
+            raise ValueError("فرد مورد نظر یافت نشد")
+        
+        with self._cache_lock:
+            self._generations.ensure(self.people.values())
+        return self._generations.generation(self.people[person_id])
+    
+    @_reads
+    def layout(self) -> List[Dict]:
+        """مختصات لایه‌ای همه افراد برای نمایش؛ پس از هر تغییر یک بار دوباره ساخته می‌شود"""
+        version, nodes = self._layout
+        if version != self.version:
+            with self._cache_lock:
+                version, nodes = self._layout
+                if version != self.version:
+                    self._generations.ensure(self.people.values())
+                    # صد هزار دیکشنری گره بدون پیمایش‌های GC روی کل درخت
+                    with _gc_paused():
+                        nodes = layered_layout(self.people.values(), self._generations)
+                    self._layout = (self.version, nodes)
+        return nodes
+    
+    @_reads
     def bfs_find_path(self, start_id: str, end_id: str) -> Optional[List[Tuple[Person, str]]]:
-        """پیدا کردن مسیر با الگوریتم BFS"""
+        """پیدا کردن مسیر با الگوریتم BFS دوطرفه (ملاقات در میانه)"""
         if start_id not in self.people or end_id not in self.people:
             return None
         
         if start_id == end_id:
             return [(self.people[start_id], "خود")]
         
-        visited = set()
-        queue = deque([(self.people[start_id], [(self.people[start_id], "شروع")])])
-        
-        while queue:
-            current, path = queue.popleft()
-            
-            if current.id in visited:
-                continue
-            visited.add(current.id)
-            
-            if current.id == end_id:
-                return path
-            
-            # بررسی والدین
-            for parent in current.parents:
-                if parent.id not in visited:
-                    new_path = path + [(parent, "والد")]
-                    queue.append((parent, new_path))
-            
-            # بررسی فرزندان
-            for child in current.children:
-                if child.id not in visited:
-                    new_path = path + [(child, "فرزند")]
-                    queue.append((child, new_path))
-            
-            # بررسی همسر
-            if current.spouse and current.spouse.id not in visited:
-                new_path = path + [(current.spouse, "همسر")]
-                queue.append((current.spouse, new_path))
+        graph = self.snapshot()
+        path = graph.shortest_path(graph.index[start_id], graph.index[end_id])
+        if path is None:
+            return None
+        return graph.to_person_path(path, "شروع")
+    
+    @_reads
+    def bfs_find_paths(self, start_id: str, end_ids: Iterable[str]) -> Dict[str, Optional[List[Tuple[Person, str]]]]:
+        """مسیرهای BFS از یک فرد به چند فرد با یک پیمایش
+        
+        نتیجه برای هر مقصد همان خروجی bfs_find_path است.
+        """
+        end_ids = list(end_ids)
+        results: Dict[str, Optional[List[Tuple[Person, str]]]] = dict.fromkeys(end_ids)
+        if start_id not in self.people:
+            return results
+        
+        graph = self.snapshot()
+        start = graph.index[start_id]
+        goals = {graph.index[end_id] for end_id in end_ids if end_id in graph.index}
+        previous, relation, _ = graph.shortest_path_tree(start, goals)
+        
+        for end_id in results:
+            if end_id == start_id:
+                results[end_id] = [(self.people[start_id], "خود")]
+            elif end_id in graph.index:
+                path = graph.path_in_tree(previous, relation, start, graph.index[end_id])
+                if path is not None:
+                    results[end_id] = graph.to_person_path(path, "شروع")
+        
+        return results
+    
+    @_reads
+    def relationship_map(self, source_id: str) -> List[Tuple[Person, int, str]]:
+        """نسبت همه افراد قابل دسترس با یک فرد، با یک پیمایش BFS
+        
+        خروجی به ترتیب فاصله است: (فرد، طول مسیر، نسبت ساده‌شده). برچسب هر فرد
+        همان نسبتی است که bfs_find_path و simplify_relationship می‌دادند.
+        """
+        if source_id not in self.people:
+            raise ValueError("فرد مورد نظر یافت نشد")
         
-        return None
+        graph = self.snapshot()
+        source = graph.index[source_id]
+        source_person = self.people[source_id]
+        previous, relation, order = graph.shortest_path_tree(source)
+        
+        # حالت طبقه‌بند هر گره از حالت والدش در درخت BFS ساخته می‌شود
+        people = graph.people
+        scans: List[Optional[RelationScan]] = [None] * len(people)
+        distances = [0] * len(people)
+        scans[source] = RelationScan(_GENDER_CODES[source_person.gender])
+        
+        relationships = []
+        for node in islice(order, 1, None):
+            parent = previous[node]
+            scan = scans[parent].advance(relation[node], _GENDER_CODES[people[node].gender])
+            scans[node] = scan
+            distances[node] = distances[parent] + 1
+            relationships.append((people[node], distances[node], scan.label()))
+        return relationships
+    
+    def distance_matrix(self, person_ids: Sequence[str], path: Optional[str] = None,
+                        workers: Optional[int] = None, labels: bool = True) -> DistanceMatrix:
+        """فاصله و نسبت همه جفت‌های person_ids با پروسه‌های موازی
+        
+        فقط کپی آرایه‌های CSR در حافظه مشترک زیر قفل خواندن انجام می‌شود؛
+        پیمایش‌ها روی همان کپی اجرا می‌شوند و تغییرات بعدی درخت را نمی‌بینند.
+        نتیجه در فایل path (یا یک فایل موقت) نوشته می‌شود و باید بسته شود.
+        """
+        with self.lock.read():
+            graph = self.snapshot()
+            for person_id in person_ids:
+                if person_id not in graph.index:
+                    raise ValueError(f"فرد {person_id} یافت نشد")
+            subset = [graph.index[person_id] for person_id in person_ids]
+            genders = bytes(_GENDER_CODES[person.gender] for person in graph.people)
+            shared = SharedGraph.create(graph, genders, subset)
+        try:
+            return build_distance_matrix(shared, person_ids, path, workers, labels)
+        finally:
+            shared.close()
     
+    @_reads
     def dfs_find_path(self, start_id: str, end_id: str) -> Optional[List[Tuple[Person, str]]]:
-        """پیدا کردن مسیر با الگوریتم DFS"""
+        """پیدا کردن مسیر با الگوریتم DFS (تکراری و بدون بازگشت)"""
         if start_id not in self.people or end_id not in self.people:
             return None
         
         if start_id == end_id:
             return [(self.people[start_id], "خود")]
         
-        visited = set()
-        
-        def dfs_recursive(current: Person, path: List[Tuple[Person, str]]) -> Optional[List[Tuple[Person, str]]]:
-            if current.id in visited:
-                return None
-            
-            visited.add(current.id)
-            
-            if current.id == end_id:
-                return path
-            
-            # بررسی والدین
-            for parent in current.parents:
-                result = dfs_recursive(parent, path + [(parent, "والد")])
-                if result:
-                    return result
-            
-            # بررسی فرزندان
-            for child in current.children:
-                result = dfs_recursive(child, path + [(child, "فرزند")])
-                if result:
-                    return result
-            
-            # بررسی همسر
-            if current.spouse:
-                result = dfs_recursive(current.spouse, path + [(current.spouse, "همسر")])
-                if result:
-                    return result
-            
+        graph = self.snapshot()
+        path = graph.dfs_path(graph.index[start_id], graph.index[end_id])
+        if path is None:
             return None
-        
-        return dfs_recursive(self.people[start_id], [(self.people[start_id], "شروع")])
+        return graph.to_person_path(path, "شروع")
     
     def simplify_relationship(self, path: List[Tuple[Person, str]], start_person: Person) -> str:
-        """ساده‌سازی مسیر به نسبت‌های فارسی"""
-        if not path or len(path) <= 1:
+        """ساده‌سازی مسیر به نسبت‌های فارسی با طبقه‌بند جدول‌محور"""
+        if not path or len(path) <= 1 or path[-1][0] is start_person:
             return "خود"
         
-        # حذف گره شروع
-        relations = [rel for _, rel in path[1:]]
-        people = [person for person, _ in path]
-        
-        # تحلیل مسیر
-        return self._analyze_persian_relationship(relations, people, start_person)
+        scan = RelationScan(_GENDER_CODES[start_person.gender])
+        for person, relation in islice(path, 1, None):
+            scan = scan.advance(RELATION_CODES[relation], _GENDER_CODES[person.gender])
+        return scan.label()
     
-    def _analyze_persian_relationship(self, relations: List[str], people: List[Person], start_person: Person) -> str:
-        """تحلیل و تبدیل مسیر به نسبت فارسی"""
-        if not relations:
-            return "خود"
-        
-        # ساده‌سازی مسیرهای مستقیم
-        if len(relations) == 1:
-            rel = relations[0]
-            target = people[-1]
-            
-            if rel == "والد":
-                if target.gender == Gender.MALE:
-                    return "پدر"
-                else:
-                    return "مادر"
-            elif rel == "فرزند":
-                if target.gender == Gender.MALE:
-                    return "پسر"
-                else:
-                    return "دختر"
-            elif rel == "همسر":
-                if target.gender == Gender.MALE:
-                    return "شوهر"
-                else:
-                    return "همسر"
-        
-        # ساده‌سازی مسیرهای دو مرحله‌ای
-        if len(relations) == 2:
-            return self._two_step_relationship(relations, people, start_person)
-        
-        # ساده‌سازی مسیرهای پیچیده‌تر
-        if len(relations) >= 3:
-            return self._multi_step_relationship(relations, people, start_person)
-        
-        return " -> ".join(relations)
-    
-    def _two_step_relationship(self, relations: List[str], people: List[Person], start_person: Person) -> str:
-        """تحلیل نسبت‌های دو مرحله‌ای"""
-        rel1, rel2 = relations
-        target = people[-1]
-        middle = people[1]
-        
-        # والد -> والد
-        if rel1 == "والد" and rel2 == "والد":
-            if target.gender == Gender.MALE:
-                return "پدربزرگ" if middle.gender == Gender.MALE else "پدربزرگ مادری"
-            else:
-                return "مادربزرگ" if middle.gender == Gender.MALE else "مادربزرگ مادری"
-        
-        # والد -> فرزند (برادر/خواهر)
-        if rel1 == "والد" and rel2 == "فرزند":
-            if target.id == start_person.id:
-                return "خود"
-            if target.gender == Gender.MALE:
-                return "برادر"
-            else:
-                return "خواهر"
-        
-        # فرزند -> فرزند (نوه)
-        if rel1 == "فرزند" and rel2 == "فرزند":
-            if target.gender == Gender.MALE:
-                return "نوه پسر"
-            else:
-                return "نوه دختر"
-        
-        # والد -> همسر
-        if rel1 == "والد" and rel2 == "همسر":
-            if middle.gender == Gender.MALE:
-                return "مادر" if target.gender == Gender.FEMALE else "پدر"
-            else:
-                return "پدر" if target.gender == Gender.MALE else "مادر"
-        
-        # همسر -> والد
-        if rel1 == "همسر" and rel2 == "والد":
-            if target.gender == Gender.MALE:
-                return "پدر همسر" if start_person.gender == Gender.MALE else "پدر شوهر"
-            else:
-                return "مادر همسر" if start_person.gender == Gender.MALE else "مادر شوهر"
-        
-        # همسر -> فرزند
-        if rel1 == "همسر" and rel2 == "فرزند":
-            if target.gender == Gender.MALE:
-                return "پسر همسر" if start_person.gender == Gender.MALE else "پسر شوهر"
-            else:
-                return "دختر همسر" if start_person.gender == Gender.MALE else "دختر شوهر"
-        
-        # فرزند -> همسر
-        if rel1 == "فرزند" and rel2 == "همسر":
-            child = middle
-            if child.gender == Gender.MALE:
-                return "عروس" if target.gender == Gender.FEMALE else "داماد"
-            else:
-                return "داماد" if target.gender == Gender.MALE else "عروس"
-        
-        return f"{rel1} -> {rel2}"
-    
-    def _multi_step_relationship(self, relations: List[str], people: List[Person], start_person: Person) -> str:
-        """تحلیل نسبت‌های چند مرحله‌ای پیچیده"""
-        target = people[-1]
-        
-        # والد -> والد -> فرزند (عمو، دایی، عمه، خاله)
-        if len(relations) == 3 and relations[0] == "والد" and relations[1] == "والد" and relations[2] == "فرزند":
-            grandparent = people[1]
-            parent_sibling = people[3]
-            
-            if grandparent.gender == Gender.MALE:  # پدربزرگ
-                if parent_sibling.gender == Gender.MALE:
-                    return "عمو"
-                else:
-                    return "عمه"
-            else:  # مادربزرگ
-                if parent_sibling.gender == Gender.MALE:
-                    return "دایی"
-                else:
-                    return "خاله"
-        
-        # والد -> فرزند -> فرزند (خواهرزاده، برادرزاده)
-        if len(relations) == 3 and relations[0] == "والد" and relations[1] == "فرزند" and relations[2] == "فرزند":
-            sibling = people[2]
-            
-            if sibling.gender == Gender.MALE:
-                if target.gender == Gender.MALE:
-                    return "پسر برادر"
-                else:
-                    return "دختر برادر"
-            else:
-                if target.gender == Gender.MALE:
-                    return "پسر خواهر"
-                else:
-                    return "دختر خواهر"
-        
-        # والد -> والد -> فرزند -> فرزند (پسر/دختر عمو، دایی، عمه، خاله)
-        if len(relations) == 4 and relations[:2] == ["والد", "والد"] and relations[2:] == ["فرزند", "فرزند"]:
-            grandparent = people[1]
-            parent_sibling = people[3]
-            
-            gender_prefix = "پسر" if target.gender == Gender.MALE else "دختر"
-            
-            if grandparent.gender == Gender.MALE:
-                if parent_sibling.gender == Gender.MALE:
-                    return f"{gender_prefix} عمو"
-                else:
-                    return f"{gender_prefix} عمه"
-            else:
-                if parent_sibling.gender == Gender.MALE:
-                    return f"{gender_prefix} دایی"
-                else:
-                    return f"{gender_prefix} خاله"
-        
-        # همسر -> والد -> فرزند (برادر/خواهر شوهر/زن)
-        if len(relations) == 3 and relations[0] == "همسر" and relations[1] == "والد" and relations[2] == "فرزند":
-            spouse_sibling = people[3]
-            spouse_gender = people[1].gender
-            
-            if spouse_gender == Gender.MALE:  # شوهر
-                if spouse_sibling.gender == Gender.MALE:
-                    return "برادر شوهر"
-                else:
-                    return "خواهر شوهر"
-            else:  # زن
-                if spouse_sibling.gender == Gender.MALE:
-                    return "برادر زن"
-                else:
-                    return "خواهر زن"
-        
-        # مسیر پیچیده - نمایش مرحله به مرحله
-        simple_path = []
-        for i, rel in enumerate(relations):
-            if i < len(people) - 1:
-                person = people[i + 1]
-                if rel == "والد":
-                    simple_path.append("پدر" if person.gender == Gender.MALE else "مادر")
-                elif rel == "فرزند":
-                    simple_path.append("پسر" if person.gender == Gender.MALE else "دختر")
-                elif rel == "همسر":
-                    simple_path.append("همسر")
-        
-        return " ← ".join(simple_path)
+    @_reads
+    def get_person(self, person_id: str) -> Optional[Dict]:
+        """یک فرد به صورت دیکشنری، یا None"""
+        person = self.people.get(person_id)
+        return person.to_dict() if person is not None else None
     
+    @_reads
     def get_all_people(self) -> List[Dict]:
         """دریافت لیست تمام افراد"""
         return [person.to_dict() for person in self.people.values()]
     
+    def iter_people(self, batch_size: int = 1000) -> Iterator[Dict]:
+        """افراد یکی‌یکی به صورت دیکشنری، بدون ساخت لیست کامل دیکشنری‌ها
+        
+        فقط فهرست Personها یک‌جا گرفته می‌شود و هر batch_size نفر با قفل خواندن
+        جداگانه ساخته می‌شوند، پس صادرات طولانی نویسنده‌ها را متوقف نمی‌کند.
+        """
+        with self.lock.read():
+            people = list(self.people.values())
+        for start in range(0, len(people), batch_size):
+            with self.lock.read():
+                batch = [person.to_dict() for person in people[start:start + batch_size]]
+            yield from batch
+    
+    @_reads
+    def people_page(self, after: Optional[str] = None, limit: Optional[int] = None,
+                    fields: Optional[Collection[str]] = None) -> Tuple[List[Dict], Optional[str]]:
+        """صفحه‌ای از افراد به ترتیب شناسه، از اولین شناسه بزرگ‌تر از after
+        
+        ترتیب بر اساس شناسه است، پس افزودن و حذف افراد بین دو درخواست باعث
+        تکرار یا جا افتادن افراد باقی‌مانده نمی‌شود. فقط افراد همین صفحه و
+        فقط فیلدهای خواسته‌شده ساخته می‌شوند. خروجی (افراد، شناسه آخرین فرد
+        صفحه یا None اگر صفحه بعدی وجود ندارد).
+        """
+        fields = check_fields(fields)
+        ids = self._ordered_ids()
+        start = bisect_right(ids, after) if after is not None else 0
+        end = len(ids) if limit is None else start + limit
+        page = ids[start:end]
+        last = page[-1] if page and end < len(ids) else None
+        return self._project(page, fields), last
+    
+    def _ordered_ids(self) -> List[str]:
+        """شناسه‌های مرتب؛ پس از هر تغییر یک بار دوباره ساخته می‌شود"""
+        version, ids = self._sorted_ids
+        if version != self.version:
+            with self._cache_lock:
+                version, ids = self._sorted_ids
+                if version != self.version:
+                    ids = sorted(self.people)
+                    self._sorted_ids = (self.version, ids)
+        return ids
+    
+    def _project(self, page: List[str], fields: Optional[Tuple[str, ...]]) -> List[Dict]:
+        people = self.people
+        if fields is None:
+            return [people[person_id].to_dict() for person_id in page]
+        getters = [(field, PERSON_FIELDS[field]) for field in fields]
+        result = []
+        for person_id in page:
+            person = people[person_id]
+            result.append({field: getter(person) for field, getter in getters})
+        return result
+    
     def export_to_dict(self) -> Dict:
         """صادرات درخت به فرمت دیکشنری"""
         return {
             "people": self.get_all_people()
         }
+    
+    def export_ndjson(self, batch_size: int = 1000) -> Iterator[str]:
+        """صادرات جریانی درخت: هر خط یک فرد، در تکه‌های batch_size خطی
+        
+        حافظه مصرفی ثابت است و اولین تکه بدون توجه به اندازه درخت آماده می‌شود.
+        """
+        lines = []
+        for person in self.iter_people():
+            lines.append(json.dumps(person, ensure_ascii=False))
+            if len(lines) == batch_size:
+                yield "\n".join(lines) + "\n"
+                lines = []
+        if lines:
+            yield "\n".join(lines) + "\n"
+    
+    def export_gedcom(self) -> Iterator[str]:
+        """صادرات جریانی درخت به GEDCOM (تکه‌های متن)
+        
+        شماره خانواده‌ها پیش از اولین تکه از روی همه روابط ساخته می‌شود، پس
+        خروجی از تصویر CSR همین نسخه (گرفته‌شده با یک قفل خواندن) نوشته
+        می‌شود. تصویر پس از ساخت تغییر نمی‌کند و بین صادرات‌ها و پیمایش‌های یک
+        نسخه مشترک است؛ تغییرات درخت در میان دانلود فقط تصویر بعدی را می‌سازند.
+        """
+        with self.lock.read():
+            graph = self.snapshot()
+        return iter_gedcom(graph)
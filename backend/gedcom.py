@@ -0,0 +1,193 @@
+"""
+خواندن و نوشتن جریانی GEDCOM
+
+خواننده فایل را خط به خط می‌خواند و هر رکورد سطح صفر را به محض تمام شدن
+تحویل می‌دهد، پس حافظه مصرفی به اندازه فایل بستگی ندارد. رکوردها به همان
+شکل رکوردهای bulk_import درمی‌آیند تا FamilyTree.bulk_load (و ارجاع جلورو و
+گزارش خطای هر رکورد آن) برای GEDCOM هم استفاده شود:
+
+    INDI  یک فرد: NAME (اسلش‌های نام خانوادگی حذف می‌شوند)، SEX و سال
+          DATE زیر BIRT
+    FAM   رابطه والد-فرزند برای هر HUSB/WIFE و هر CHIL، و رابطه همسری
+          بین HUSB و WIFE مگر اینکه خانواده «NO MARR» داشته باشد
+
+شناسه فرد همان xref بدون @ است (‎@I12@ -> I12). فقط UTF-8 پشتیبانی می‌شود.
+
+نویسنده افراد را به ترتیب درخت و سپس خانواده‌ها را می‌نویسد. هر مجموعه
+والدین یک خانواده است؛ زوج‌های بدون فرزند هم خانواده جداگانه دارند.
+"""
+
+import re
+from typing import Any, Collection, Dict, Iterator, List, Optional, Tuple
+
+from graph_snapshot import NO_SPOUSE
+
+# (رکورد، پیام خطا)؛ یکی از این دو None است
+Record = Tuple[Optional[Any], Optional[str]]
+
+_SEXES = {"M": "male", "F": "female"}
+_SEX_CODES = {"male": "M", "female": "F"}
+_YEAR = re.compile(r"\b(\d{3,4})\b")
+_SAFE_XREF = re.compile(r"[A-Za-z0-9_]+")
+
+# تعداد خطوطی که نویسنده در هر تکه خروجی جمع می‌کند
+_CHUNK_LINES = 4096
+
+
+def read_gedcom(stream) -> Iterator[Record]:
+    """رکوردهای فرد و رابطه به ترتیب فایل؛ stream یک جریان متنی است"""
+    record: Optional[Dict[str, Any]] = None
+    event = None
+    for number, line in enumerate(stream, 1):
+        parts = line.rstrip("\r\n").split(None, 2)
+        if not parts:
+            continue
+        if len(parts) < 2 or not parts[0].isdigit():
+            yield None, f"خط {number} GEDCOM نامعتبر است"
+            continue
+        level = int(parts[0])
+        if parts[1].startswith("@"):
+            xref = parts[1].strip("@")
+            tag, _, value = (parts[2] if len(parts) > 2 else "").partition(" ")
+        else:
+            xref = None
+            tag = parts[1]
+            value = parts[2] if len(parts) > 2 else ""
+
+        if level == 0:
+            if record is not None:
+                yield from _finish(record)
+            event = None
+            if tag == "INDI":
+                record = {"id": xref, "name": None, "gender": None, "birth_year": None}
+            elif tag == "FAM":
+                record = {"type": "FAM", "parents": [], "children": [], "married": True}
+            else:
+                record = None
+            continue
+        if record is None:
+            continue
+
+        if level == 1:
+            event = tag
+            if record.get("type") == "FAM":
+                if tag in ("HUSB", "WIFE"):
+                    record["parents"].append(value.strip("@ "))
+                elif tag == "CHIL":
+                    record["children"].append(value.strip("@ "))
+                elif tag == "NO" and value.strip() == "MARR":
+                    record["married"] = False
+            elif tag == "NAME" and record["name"] is None:
+                record["name"] = " ".join(value.replace("/", " ").split())
+            elif tag == "SEX":
+                record["gender"] = _SEXES.get(value.strip(), value.strip())
+        elif level == 2 and event == "BIRT" and tag == "DATE" and "birth_year" in record:
+            match = _YEAR.search(value)
+            if match is not None:
+                record["birth_year"] = int(match.group(1))
+
+    if record is not None:
+        yield from _finish(record)
+
+
+def _finish(record: Dict[str, Any]) -> Iterator[Record]:
+    if record.get("type") != "FAM":
+        yield record, None
+        return
+    parents = record["parents"]
+    if len(parents) == 2 and record["married"]:
+        yield {"type": "spouse", "person1": parents[0], "person2": parents[1]}, None
+    for child in record["children"]:
+        for parent in parents:
+            yield {"type": "parent-child", "parent": parent, "child": child}, None
+
+
+def iter_gedcom(graph) -> Iterator[str]:
+    """متن GEDCOM 5.5.1 از یک تصویر CSR (GraphSnapshot) به صورت تکه‌های چند هزار خطی
+
+    روابط فقط از آرایه‌های تصویر خوانده می‌شوند که پس از ساخت تغییر نمی‌کنند؛
+    جز خود تصویر فقط نگاشت خانواده‌ها به شماره در حافظه نگه داشته می‌شود.
+    """
+    people = graph.people
+    ids = graph.index
+    parents_of, children_of, spouse_of = graph.parents, graph.children, graph.spouse
+    xrefs: Dict[int, str] = {}
+    generated = 0
+
+    def xref(i: int) -> str:
+        nonlocal generated
+        person_id = people[i].id
+        if _SAFE_XREF.fullmatch(person_id):
+            return f"@{person_id}@"
+        # شناسه‌هایی که در xref مجاز نیستند شماره جدید می‌گیرند
+        value = xrefs.get(i)
+        if value is None:
+            while True:
+                generated += 1
+                if f"I{generated}" not in ids:
+                    break
+            value = xrefs[i] = f"@I{generated}@"
+        return value
+
+    def family_key(parents: Collection[int]) -> Tuple[int, ...]:
+        """کلید یکتای خانواده: والدین به ترتیب مرد، زن و سپس شناسه"""
+        return tuple(sorted(parents, key=lambda i: (people[i].gender.value != "male", people[i].id)))
+
+    count = len(graph)
+    families: Dict[Tuple[int, ...], int] = {}
+    for i in range(count):
+        spouse = spouse_of(i)
+        if spouse != NO_SPOUSE:
+            families.setdefault(family_key((i, spouse)), len(families) + 1)
+        parents = parents_of(i)
+        if parents:
+            families.setdefault(family_key(parents), len(families) + 1)
+
+    lines: List[str] = ["0 HEAD", "1 SOUR FAMILY_TREE", "1 GEDC", "2 VERS 5.5.1",
+                        "2 FORM LINEAGE-LINKED", "1 CHAR UTF-8"]
+    for i in range(count):
+        person = people[i]
+        lines.append(f"0 {xref(i)} INDI")
+        lines.append(f"1 NAME {' '.join(person.name.split())}")
+        lines.append(f"1 SEX {_SEX_CODES[person.gender.value]}")
+        if person.birth_year is not None:
+            lines.append("1 BIRT")
+            lines.append(f"2 DATE {person.birth_year}")
+        parents = parents_of(i)
+        if parents:
+            lines.append(f"1 FAMC @F{families[family_key(parents)]}@")
+        own = []
+        spouse = spouse_of(i)
+        if spouse != NO_SPOUSE:
+            own.append(families[family_key((i, spouse))])
+        for child in children_of(i):
+            family = families[family_key(parents_of(child))]
+            if family not in own:
+                own.append(family)
+        for family in own:
+            lines.append(f"1 FAMS @F{family}@")
+        if len(lines) >= _CHUNK_LINES:
+            yield "\n".join(lines) + "\n"
+            lines = []
+
+    for key, family in families.items():
+        lines.append(f"0 @F{family}@ FAM")
+        for parent in key:
+            lines.append(f"1 {'HUSB' if people[parent].gender.value == 'male' else 'WIFE'} {xref(parent)}")
+        if len(key) == 2:
+            lines.append("1 MARR Y" if spouse_of(key[0]) == key[1] else "1 NO MARR")
+        for child in children_of(key[0]):
+            if family_key(parents_of(child)) == key:
+                lines.append(f"1 CHIL {xref(child)}")
+        if len(lines) >= _CHUNK_LINES:
+            yield "\n".join(lines) + "\n"
+            lines = []
+
+    lines.append("0 TRLR")
+    yield "\n".join(lines) + "\n"
+
+
+def write_gedcom(graph, stream):
+    """نوشتن GEDCOM یک تصویر CSR در یک جریان متنی"""
+    for chunk in iter_gedcom(graph):
+        stream.write(chunk)
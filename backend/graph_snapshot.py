@@ -0,0 +1,322 @@
+"""
+نمای فشرده CSR از درخت خانوادگی برای پیمایش‌های سریع
+
+شناسه افراد به اعداد صحیح پیوسته نگاشت می‌شوند و یال‌های والد، فرزند و همسر
+در آرایه‌های نوع‌دار (array) نگهداری می‌شوند. پیمایش‌ها به جای دنبال کردن
+اشاره‌گرهای Person و هش کردن شناسه‌های رشته‌ای، روی همین آرایه‌ها و
+علامت‌های bytearray اجرا می‌شوند.
+"""
+
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+PARENT = 0
+CHILD = 1
+SPOUSE = 2
+
+RELATION_NAMES = ("والد", "فرزند", "همسر")
+
+NO_SPOUSE = -1
+
+
+class GraphSnapshot:
+    """تصویر فقط‌خواندنی از گراف خانواده در قالب CSR
+
+    همسایه‌های گره i در targets[offsets[i]:offsets[i + 1]] به ترتیب والدین،
+    فرزندان و همسر قرار دارند. child_start[i] و spouse_start[i] مرز این سه
+    بخش را مشخص می‌کنند، پس پیمایش‌هایی که نوع رابطه برایشان مهم نیست فقط
+    یک برش از آرایه را می‌خوانند.
+    """
+
+    def __init__(self, people: Iterable):
+        self.people: List = list(people)
+        self.index: Dict[str, int] = {}
+        for i, person in enumerate(self.people):
+            self.index[person.id] = i
+
+        position = {person: i for i, person in enumerate(self.people)}
+
+        offsets = array("l", [0])
+        child_start = array("l")
+        spouse_start = array("l")
+        targets = array("i")
+        for person in self.people:
+            targets.extend([position[parent] for parent in person.parents])
+            child_start.append(len(targets))
+            targets.extend([position[child] for child in person.children])
+            spouse_start.append(len(targets))
+            if person.spouse is not None:
+                targets.append(position[person.spouse])
+            offsets.append(len(targets))
+
+        self.offsets = offsets
+        self.child_start = child_start
+        self.spouse_start = spouse_start
+        self.targets = targets
+
+    @classmethod
+    def from_buffers(cls, people, index, offsets, child_start, spouse_start, targets) -> "GraphSnapshot":
+        """ساخت تصویر از آرایه‌های آماده (مثلاً memoryviewهای یک فایل mmap شده)
+
+        people و index می‌توانند دنباله و نگاشت تنبل باشند؛ پیمایش‌ها فقط از
+        len(people)، people[i] و index[id] استفاده می‌کنند.
+        """
+        graph = cls.__new__(cls)
+        graph.people = people
+        graph.index = index
+        graph.offsets = offsets
+        graph.child_start = child_start
+        graph.spouse_start = spouse_start
+        graph.targets = targets
+        return graph
+
+    def __len__(self) -> int:
+        return len(self.people)
+
+    @property
+    def edge_count(self) -> int:
+        """تعداد یال‌های جهت‌دار ذخیره‌شده (والد، فرزند و همسر)"""
+        return len(self.targets)
+
+    def nbytes(self) -> int:
+        """حجم آرایه‌های CSR به بایت (بدون جدول شناسه‌ها)"""
+        arrays = (self.offsets, self.child_start, self.spouse_start, self.targets)
+        return sum(len(a) * a.itemsize for a in arrays)
+
+    def parents(self, i: int) -> array:
+        return self.targets[self.offsets[i]:self.child_start[i]]
+
+    def children(self, i: int) -> array:
+        return self.targets[self.child_start[i]:self.spouse_start[i]]
+
+    def spouse(self, i: int) -> int:
+        """اندیس همسر یا NO_SPOUSE"""
+        position = self.spouse_start[i]
+        return self.targets[position] if position < self.offsets[i + 1] else NO_SPOUSE
+
+    def neighbours(self, i: int) -> array:
+        """همه همسایه‌های گره i بدون نوع رابطه"""
+        return self.targets[self.offsets[i]:self.offsets[i + 1]]
+
+    def relatives(self, i: int):
+        """همسایه‌های گره i به ترتیب والدین، فرزندان و همسر همراه با کد رابطه"""
+        targets = self.targets
+        child_start = self.child_start[i]
+        spouse_start = self.spouse_start[i]
+        for j in targets[self.offsets[i]:child_start]:
+            yield j, PARENT
+        for j in targets[child_start:spouse_start]:
+            yield j, CHILD
+        if spouse_start < self.offsets[i + 1]:
+            yield targets[spouse_start], SPOUSE
+
+    def shortest_path(self, start: int, end: int) -> Optional[List[Tuple[int, int]]]:
+        """کوتاه‌ترین مسیر با BFS دوطرفه؛ خروجی لیست (گره، کد رابطه)
+
+        گره اول کد رابطه -1 دارد. از بین کوتاه‌ترین مسیرها همان مسیری برگردانده
+        می‌شود که BFS یک‌طرفه با ترتیب والدین، فرزندان و همسر پیدا می‌کرد.
+        """
+        if start == end:
+            return [(start, -1)]
+
+        search = self._bidirectional_search(start, end)
+        if search is None:
+            return None
+        return self._rebuild_shortest_path(start, end, *search)
+
+    def _bidirectional_search(self, start: int, end: int):
+        """گسترش سطح به سطح از دو سر مسیر تا رسیدن دو جبهه به هم
+
+        در هر دور جبهه کوچک‌تر یک سطح کامل گسترش می‌یابد. نقشه فاصله‌ها
+        دیکشنری است تا هزینه هر پرس‌وجو به ناحیه پیمایش‌شده محدود بماند و
+        به اندازه کل درخت وابسته نباشد.
+        """
+        forward = {start: 0}
+        backward = {end: 0}
+        forward_layers = [[start]]
+        forward_frontier = [start]
+        backward_frontier = [end]
+        offsets = self.offsets
+        targets = self.targets
+
+        while forward_frontier and backward_frontier:
+            if len(forward_frontier) <= len(backward_frontier):
+                depth = len(forward_layers)
+                next_frontier = []
+                meeting = []
+                for node in forward_frontier:
+                    for relative in targets[offsets[node]:offsets[node + 1]]:
+                        if relative not in forward:
+                            forward[relative] = depth
+                            next_frontier.append(relative)
+                            if relative in backward:
+                                meeting.append(relative)
+                forward_layers.append(next_frontier)
+                forward_frontier = next_frontier
+            else:
+                depth = backward[backward_frontier[0]] + 1
+                next_frontier = []
+                meeting = []
+                for node in backward_frontier:
+                    for relative in targets[offsets[node]:offsets[node + 1]]:
+                        if relative not in backward:
+                            backward[relative] = depth
+                            next_frontier.append(relative)
+                            if relative in forward:
+                                meeting.append(relative)
+                backward_frontier = next_frontier
+
+            if meeting:
+                return forward, forward_layers, backward, meeting
+
+        return None
+
+    def _rebuild_shortest_path(self, start: int, end: int, forward: Dict[int, int],
+                               forward_layers: List[List[int]], backward: Dict[int, int],
+                               meeting: List[int]) -> List[Tuple[int, int]]:
+        """بازسازی یک‌باره مسیر از روی نقشه فاصله‌ها"""
+        relatives = self.relatives
+        neighbours = self.neighbours
+        meet_depth = forward[meeting[0]]
+
+        # گره‌هایی از نیمه جلویی که روی یک کوتاه‌ترین مسیر قرار دارند
+        on_path = set(meeting)
+        for depth in range(meet_depth - 1, 0, -1):
+            for node in forward_layers[depth]:
+                for relative in neighbours(node):
+                    if relative in on_path and forward.get(relative) == depth + 1:
+                        on_path.add(node)
+                        break
+
+        path = [(start, -1)]
+        current = start
+        step = 0
+        while current != end:
+            for relative, relation in relatives(current):
+                if step < meet_depth:
+                    if relative in on_path and forward.get(relative) == step + 1:
+                        break
+                elif backward.get(relative) == backward[current] - 1:
+                    break
+            path.append((relative, relation))
+            current = relative
+            step += 1
+
+        return path
+
+    def shortest_path_tree(self, start: int,
+                           goals: Optional[Iterable[int]] = None) -> Tuple[array, bytearray, List[int]]:
+        """BFS تک‌منبعی با نگهداری والد هر گره در درخت کوتاه‌ترین مسیر
+
+        خروجی آرایه previous (برای گره‌های دیده‌نشده -1 و برای start خودش)،
+        کد رابطه هر گره با والدش و ترتیب بازدید گره‌ها است. چون اولین کاشف هر گره به عنوان والد
+        ثبت می‌شود، مسیر بازسازی‌شده همان مسیر shortest_path است. اگر goals
+        داده شود، جستجو پس از یافتن همه آن‌ها متوقف می‌شود.
+        """
+        previous = array("i", [-1]) * len(self.people)
+        relation = bytearray(len(self.people))
+        previous[start] = start
+
+        remaining = None
+        if goals is not None:
+            remaining = set(goals)
+            remaining.discard(start)
+            if not remaining:
+                return previous, relation, [start]
+
+        offsets = self.offsets
+        child_start = self.child_start
+        spouse_start = self.spouse_start
+        targets = self.targets
+        order = [start]
+        append = order.append
+        for node in order:
+            first = offsets[node]
+            middle = child_start[node]
+            last = spouse_start[node]
+            for position in range(first, offsets[node + 1]):
+                relative = targets[position]
+                if previous[relative] != -1:
+                    continue
+                previous[relative] = node
+                relation[relative] = PARENT if position < middle else CHILD if position < last else SPOUSE
+                append(relative)
+                if remaining is not None:
+                    remaining.discard(relative)
+                    if not remaining:
+                        return previous, relation, order
+
+        return previous, relation, order
+
+    @staticmethod
+    def path_in_tree(previous: array, relation: bytearray, start: int, end: int) -> Optional[List[Tuple[int, int]]]:
+        """بازسازی مسیر start تا end از خروجی shortest_path_tree"""
+        if previous[end] == -1:
+            return None
+        path = []
+        node = end
+        while node != start:
+            path.append((node, relation[node]))
+            node = previous[node]
+        path.append((start, -1))
+        path.reverse()
+        return path
+
+    def dfs_path(self, start: int, end: int) -> Optional[List[Tuple[int, int]]]:
+        """مسیر DFS با پشته صریح و علامت‌گذاری bytearray"""
+        if start == end:
+            return [(start, -1)]
+
+        visited = bytearray(len(self.people))
+        visited[start] = 1
+        # پشته همزمان زنجیره والدِ جستجو و مسیر جاری است
+        stack = [(start, -1, self.relatives(start))]
+
+        while stack:
+            for relative, relation in stack[-1][2]:
+                if visited[relative]:
+                    continue
+                visited[relative] = 1
+                if relative == end:
+                    path = [(node, rel) for node, rel, _ in stack]
+                    path.append((relative, relation))
+                    return path
+                stack.append((relative, relation, self.relatives(relative)))
+                break
+            else:
+                stack.pop()
+
+        return None
+
+    def bfs_order(self, start: int, visited: Optional[bytearray] = None) -> List[int]:
+        """ترتیب بازدید BFS کامل از یک گره (برای تحلیل‌های کل‌گراف)"""
+        if visited is None:
+            visited = bytearray(len(self.people))
+        visited[start] = 1
+        offsets = self.offsets
+        targets = self.targets
+        order = [start]
+        append = order.append
+        # لیست در حین پیمایش بزرگ می‌شود و نقش صف را دارد
+        for node in order:
+            for relative in targets[offsets[node]:offsets[node + 1]]:
+                if not visited[relative]:
+                    visited[relative] = 1
+                    append(relative)
+        return order
+
+    def connected_components(self) -> List[List[int]]:
+        """مؤلفه‌های همبند گراف (با احتساب هر سه نوع رابطه)"""
+        seen = bytearray(len(self.people))
+        components = []
+        for i in range(len(self.people)):
+            if not seen[i]:
+                components.append(self.bfs_order(i, seen))
+        return components
+
+    def to_person_path(self, path: List[Tuple[int, int]], first_relation: str) -> List[Tuple]:
+        """تبدیل مسیر عددی به لیست (Person، رابطه) مورد انتظار API"""
+        people = self.people
+        result = [(people[path[0][0]], first_relation)]
+        result.extend((people[node], RELATION_NAMES[relation]) for node, relation in path[1:])
+        return result
@@ -1,9 +1,15 @@
 import multiprocessing
 import os
 
+# همه workerها یک پایگاه داده SQLite مشترک را می‌خوانند و می‌نویسند
+os.environ.setdefault('FAMILY_TREE_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'family_tree.db'))
+
 bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
 workers = 2
-worker_class = 'sync'
+# FamilyTree با قفل خواندن-نوشتن امن است؛ هر worker چند درخواست را هم‌زمان
+# با نخ‌های جداگانه پاسخ می‌دهد (پرس‌وجوها موازی، تغییرات به نوبت)
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', '8'))
 timeout = 120
 accesslog = '-'
 errorlog = '-'
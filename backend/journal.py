@@ -0,0 +1,296 @@
+"""
+ژورنال فقط‌افزودنی تغییرات درخت همراه تصویر فشرده دوره‌ای
+
+هر تغییر FamilyTree به صورت یک خط JSON با شماره نسخه درخت به فایل ژورنال
+افزوده می‌شود. نوشتن هر خط بلافاصله به سیستم‌عامل می‌رسد، پس کرش پروسه چیزی
+را از دست نمی‌دهد. با sync_interval=0 (پیش‌فرض) هر رکورد پیش از پایان تغییر
+fsync می‌شود و تغییر تأییدشده قطع برق را هم تحمل می‌کند. با sync_interval
+مثبت fsync با تأخیر انجام می‌شود (پس از sync_batch رکورد یا حداکثر
+sync_interval ثانیه، هر کدام زودتر برسد)؛ این ماندگاری تأخیری است نه commit
+گروهی: تغییر پیش از fsync تأیید می‌شود و قطع برق یا کرش سیستم‌عامل تا
+sync_interval ثانیه (حداکثر sync_batch رکورد) آخر را از دست می‌دهد.
+
+پس از snapshot_every رکورد یک نخ پس‌زمینه کپی فشرده درخت را زیر قفل خواندن
+می‌گیرد و تصویر را بیرون از همه قفل‌ها در snapshot.json می‌نویسد؛ سپس فقط
+بخشی از ژورنال که تصویر پوشش می‌دهد حذف می‌شود و رکوردهای رسیده در این
+فاصله می‌مانند. بازیابی تصویر را مستقیم بارگذاری می‌کند و فقط دنباله ژورنال
+(رکوردهای با نسخه بزرگ‌تر از نسخه تصویر) را دوباره اجرا می‌کند.
+
+ژورنال برای یک پروسه نویسنده طراحی شده؛ برای چند worker از SQLiteFamilyTree
+استفاده کنید.
+"""
+
+import json
+import os
+import threading
+from typing import Dict, Iterator, Optional
+
+from family_tree import FamilyTree, Gender, Person, _gc_paused, _relatives_from
+
+SNAPSHOT_FILE = "snapshot.json"
+JOURNAL_FILE = "journal.ndjson"
+
+_SNAPSHOT_FORMAT = 1
+
+# تعداد افراد هر تکه JSON تصویر
+_ENCODE_CHUNK = 50_000
+
+
+def snapshot_data(tree: FamilyTree) -> Dict:
+    """کپی فشرده درخت برای تصویر (باید زیر قفل درخت گرفته شود)
+
+    روابط با اندیس افراد ذخیره می‌شوند و ترتیب والدین و فرزندان هر فرد حفظ
+    می‌شود تا مسیرهای BFS پس از بارگذاری تغییر نکنند.
+    """
+    people = list(tree.people.values())
+    with _gc_paused():
+        index = {person: i for i, person in enumerate(people)}
+        return {
+            "format": _SNAPSHOT_FORMAT,
+            "version": tree.version,
+            "people": [[p.id, p.name, p.gender.value, p.birth_year] for p in people],
+            "spouses": [index[p.spouse] if p.spouse is not None else -1 for p in people],
+            "parents": [[index[parent] for parent in p.parents] for p in people],
+            "children": [[index[child] for child in p.children] for p in people],
+        }
+
+
+def _encode_snapshot(data: Dict) -> Iterator[bytes]:
+    """JSON تصویر به صورت تکه‌ها
+
+    هر تکه با رمزگذار C ساخته می‌شود؛ بین تکه‌ها نخ‌های دیگر GIL را می‌گیرند،
+    پس فشرده‌سازی پس‌زمینه درخواست‌ها را چند ثانیه متوقف نمی‌کند.
+    """
+    def encode(value) -> bytes:
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    yield encode({"format": data["format"], "version": data["version"]})[:-1]
+    for key in ("people", "spouses", "parents", "children"):
+        values = data[key]
+        yield f',"{key}":['.encode("utf-8")
+        for start in range(0, len(values), _ENCODE_CHUNK):
+            if start:
+                yield b","
+            yield encode(values[start:start + _ENCODE_CHUNK])[1:-1]
+        yield b"]"
+    yield b"}"
+
+
+def _write_snapshot_data(data: Dict, path: str):
+    """نوشتن اتمیک تصویر (فایل موقت، fsync و جایگزینی)"""
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as f:
+        for chunk in _encode_snapshot(data):
+            f.write(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+    _fsync_directory(os.path.dirname(os.path.abspath(path)))
+
+
+def write_snapshot(tree: FamilyTree, path: str):
+    """نوشتن تصویر فشرده درخت به صورت اتمیک"""
+    _write_snapshot_data(snapshot_data(tree), path)
+
+
+def load_snapshot(tree: FamilyTree, path: str):
+    """جایگزینی محتوای درخت با تصویر ذخیره‌شده"""
+    with open(path, "rb") as f:
+        raw = f.read()
+
+    with _gc_paused():
+        data = json.loads(raw)
+        del raw
+        if data.get("format") != _SNAPSHOT_FORMAT:
+            raise ValueError(f"قالب تصویر پشتیبانی نمی‌شود: {data.get('format')}")
+
+        people = [Person(person_id, name, Gender(gender), birth_year)
+                  for person_id, name, gender, birth_year in data["people"]]
+        for person, spouse, parents, children in zip(people, data["spouses"], data["parents"], data["children"]):
+            if spouse >= 0:
+                person.spouse = people[spouse]
+            person.parents = _relatives_from([people[i] for i in parents])
+            person.children = _relatives_from([people[i] for i in children])
+
+    tree.people = {person.id: person for person in people}
+    tree.version = data["version"]
+    tree.changes.reset(tree.version)
+    tree._snapshot = None
+    tree._ancestry.invalidate()
+    tree._generations.invalidate()
+
+
+def _fsync_directory(directory: str):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class MutationJournal:
+    """ژورنال تغییرات یک درخت در یک پوشه (snapshot.json و journal.ndjson)"""
+
+    def __init__(self, directory: str, sync_interval: float = 0.0, sync_batch: int = 256,
+                 snapshot_every: int = 100_000):
+        if sync_interval < 0 or sync_batch < 1 or snapshot_every < 1:
+            raise ValueError("تنظیمات ژورنال نامعتبر است")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.sync_interval = sync_interval
+        self.sync_batch = sync_batch
+        self.snapshot_every = snapshot_every
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+        self.journal_path = os.path.join(directory, JOURNAL_FILE)
+
+        self._tree: Optional[FamilyTree] = None
+        self._file = None
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self._since_snapshot = 0
+        self._closed = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        # فشرده‌سازی پس‌زمینه در حال اجرا؛ compact هم‌زمان منتظر آن می‌ماند
+        self._compactor: Optional[threading.Thread] = None
+        self._compact_lock = threading.Lock()
+
+    def attach(self, tree: FamilyTree) -> int:
+        """بازیابی درخت (تصویر و دنباله ژورنال) و ثبت تغییرات بعدی آن
+
+        درخت باید تازه ساخته شده باشد. خروجی تعداد رکوردهای اجراشده از ژورنال است.
+        """
+        if self._tree is not None:
+            raise ValueError("ژورنال قبلاً به درختی متصل شده است")
+
+        if os.path.exists(self.snapshot_path):
+            load_snapshot(tree, self.snapshot_path)
+        replayed = self._replay(tree)
+
+        self._tree = tree
+        self._since_snapshot = replayed
+        self._file = open(self.journal_path, "ab", buffering=0)
+        tree.subscribe(self.record)
+        if self.sync_interval > 0:
+            self._flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+            self._flusher.start()
+        return replayed
+
+    def _replay(self, tree: FamilyTree) -> int:
+        """اجرای رکوردهای جدیدتر از تصویر؛ خط ناقص انتهای فایل (کرش حین نوشتن) بریده می‌شود"""
+        if not os.path.exists(self.journal_path):
+            return 0
+
+        replayed = 0
+        good_until = 0
+        with open(self.journal_path, "rb") as f, _gc_paused():
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    version, operation, *args = json.loads(line)
+                except ValueError:
+                    break
+                good_until += len(line)
+                if version <= tree.version:
+                    continue
+                getattr(tree, operation)(*args)
+                tree.version = version
+                replayed += 1
+
+        if good_until < os.path.getsize(self.journal_path):
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(good_until)
+        return replayed
+
+    def record(self, operation: str, args: tuple):
+        """شنونده تغییرات درخت: افزودن یک رکورد به ژورنال"""
+        line = json.dumps([self._tree.version, operation, *args], ensure_ascii=False,
+                          separators=(",", ":"))
+        with self._lock:
+            self._file.write(line.encode("utf-8") + b"\n")
+            self._unsynced += 1
+            self._since_snapshot += 1
+            if self.sync_interval == 0 or self._unsynced >= self.sync_batch:
+                self._sync_locked()
+            if self._since_snapshot >= self.snapshot_every and self._compactor is None:
+                # record درون قفل نوشتن درخت اجرا می‌شود؛ تصویر در نخ جدا ساخته می‌شود
+                self._compactor = threading.Thread(target=self._compact_in_background, daemon=True)
+                self._compactor.start()
+
+    def flush(self):
+        """fsync رکوردهای نوشته‌شده"""
+        with self._lock:
+            self._sync_locked()
+
+    def compact(self):
+        """نوشتن تصویر کامل و حذف بخشی از ژورنال که تصویر پوشش می‌دهد
+
+        فقط کپی درخت زیر قفل خواندن گرفته می‌شود؛ نوشتن تصویر تغییرات را متوقف
+        نمی‌کند.
+        """
+        with self._compact_lock:
+            with self._tree.lock.read():
+                data = snapshot_data(self._tree)
+                # ترتیب قفل‌ها مثل record (که درون قفل نوشتن درخت صدا زده می‌شود)
+                with self._lock:
+                    covered = os.fstat(self._file.fileno()).st_size
+                    self._since_snapshot = 0
+            _write_snapshot_data(data, self.snapshot_path)
+            del data
+            # کرش پیش از این مرحله بی‌خطر است: بازیابی رکوردهای قدیمی‌تر از تصویر را نادیده می‌گیرد
+            with self._lock:
+                self._drop_prefix_locked(covered)
+
+    def _compact_in_background(self):
+        try:
+            self.compact()
+        finally:
+            with self._lock:
+                self._compactor = None
+
+    def _sync_locked(self):
+        if self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def _drop_prefix_locked(self, covered: int):
+        """جایگزینی اتمیک ژورنال با رکوردهای بعد از بایت covered"""
+        with open(self.journal_path, "rb") as f:
+            f.seek(covered)
+            tail = f.read()
+        temporary = self.journal_path + ".tmp"
+        with open(temporary, "wb") as f:
+            f.write(tail)
+            f.flush()
+            os.fsync(f.fileno())
+        self._file.close()
+        os.replace(temporary, self.journal_path)
+        _fsync_directory(self.directory)
+        self._file = open(self.journal_path, "ab", buffering=0)
+        self._unsynced = 0
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.sync_interval):
+            self.flush()
+
+    def close(self):
+        """توقف ثبت، fsync نهایی و بستن فایل"""
+        if self._tree is None or self._closed.is_set():
+            return
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self._tree.unsubscribe(self.record)
+        # پس از لغو ثبت فشرده‌سازی تازه‌ای شروع نمی‌شود
+        with self._lock:
+            compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+        with self._lock:
+            self._sync_locked()
+            self._file.close()
@@ -0,0 +1,274 @@
+"""
+ضریب خویشاوندی (kinship) و ضریب هم‌خونی (inbreeding) رایت
+
+φ(a, b) احتمال هم‌منشأ بودن دو ژن تصادفی از a و b است:
+    φ(a, a) = ½ (1 + φ(پدر a، مادر a))
+    φ(a, b) = ½ (φ(والد اول a، b) + φ(والد دوم a، b))   اگر a جد b نباشد
+والد ناموجود بنیان‌گذار نامرتبط حساب می‌شود (سهم صفر). ضریب هم‌خونی هر فرد
+F(a) = φ(والدین a) و ضریب رابطه رایت r = φ(a, b) / √(φ(a, a) φ(b, b)) است؛
+برخلاف مسیر BFS/DFS همه مسیرهای اجدادی شمرده می‌شوند.
+
+افراد بر اساس نسل (عمق توپولوژیک روی والدین) شماره‌گذاری می‌شوند. جفت‌های لازم
+نسل به نسل از بالا باز می‌شوند: عضوی که شماره بزرگ‌تری دارد (پس جد دیگری
+نیست) جایش را به والدینش می‌دهد. سپس مقدارها از نسل صفر به بالا دسته‌ای حساب
+می‌شوند؛ در هر نسل اول جفت‌هایی که عضو دیگرشان از نسل پایین‌تر است (و جفت فرد
+با خودش) و بعد جفت‌هایی که هر دو عضو در همین نسل‌اند. هر دسته با numpy
+(از requirements.txt) برداری اجرا می‌شود: جفت‌ها کلید int64 مرتب‌اند و با
+searchsorted پیدا می‌شوند. فقط اگر numpy نصب نباشد همین الگوریتم با دیکشنری و
+حلقه پایتون اجرا می‌شود؛ این مسیر جایگزین کندتر است و برای مقایسه در تست‌ها
+و بنچمارک هم به کار می‌رود.
+"""
+
+from math import sqrt
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from graph_snapshot import GraphSnapshot
+
+try:
+    import numpy
+except ImportError:  # مسیر جایگزین بدون numpy
+    numpy = None
+
+NO_PARENT = -1
+
+
+def _sorted_unique(chunks: list, empty):
+    # مرتب‌سازی و حذف تکراری‌های مجاور؛ برای کلیدهای int64 سریع‌تر از numpy.unique
+    if not chunks:
+        return empty
+    keys = numpy.sort(numpy.concatenate(chunks))
+    if keys.size:
+        keys = keys[numpy.concatenate(([True], keys[1:] != keys[:-1]))]
+    return keys
+
+
+class Pedigree:
+    """شجره نسل‌بندی‌شده یک تصویر CSR برای محاسبه ضرایب خویشاوندی
+
+    همه اندیس‌های داخلی «رتبه» هستند: جایگاه فرد در ترتیب (نسل، اندیس تصویر).
+    """
+
+    def __init__(self, graph: GraphSnapshot):
+        self.graph = graph
+        count = len(graph)
+        offsets, child_start, spouse_start = graph.offsets, graph.child_start, graph.spouse_start
+        targets = graph.targets
+
+        # ترتیب توپولوژیک؛ نسل هر فرد یکی بیشتر از بیشترین نسل والدینش
+        generation = [0] * count
+        pending = [child_start[i] - offsets[i] for i in range(count)]
+        order = [i for i in range(count) if not pending[i]]
+        for node in order:
+            below = generation[node] + 1
+            for child in targets[child_start[node]:spouse_start[node]]:
+                if generation[child] < below:
+                    generation[child] = below
+                pending[child] -= 1
+                if not pending[child]:
+                    order.append(child)
+        if len(order) < count:
+            raise ValueError("روابط والد-فرزند چرخه دارند")
+
+        self.nodes = sorted(range(count), key=generation.__getitem__)
+        self.rank = [0] * count
+        for position, node in enumerate(self.nodes):
+            self.rank[node] = position
+        self.level_of = [generation[node] for node in self.nodes]
+        self.levels = self.level_of[-1] + 1 if count else 0
+
+        self.first_parent = [NO_PARENT] * count
+        self.second_parent = [NO_PARENT] * count
+        for position, node in enumerate(self.nodes):
+            parents = targets[offsets[node]:child_start[node]]
+            if len(parents) > 2:
+                raise ValueError(f"فرد {graph.people[node].id} بیش از دو والد دارد")
+            if parents:
+                self.first_parent[position] = self.rank[parents[0]]
+            if len(parents) == 2:
+                self.second_parent[position] = self.rank[parents[1]]
+
+        if numpy is not None:
+            self._arrays = (numpy.asarray(self.first_parent, dtype=numpy.int64),
+                            numpy.asarray(self.second_parent, dtype=numpy.int64),
+                            numpy.asarray(self.level_of, dtype=numpy.int64))
+
+    def kinship(self, pairs: Sequence[Tuple[int, int]],
+                vectorized: Optional[bool] = None) -> List[Tuple[float, float]]:
+        """(φ، r) برای هر جفت اندیس تصویر"""
+        rank = self.rank
+        members = sorted({rank[i] for pair in pairs for i in pair})
+        queries = [(rank[a], rank[b]) for a, b in pairs] + [(m, m) for m in members]
+        values = self.coefficients(queries, vectorized)
+        selves = dict(zip(members, values[len(pairs):]))
+        return [
+            (phi, phi / sqrt(selves[a] * selves[b]))
+            for phi, (a, b) in zip(values[:len(pairs)], queries)
+        ]
+
+    def inbreeding(self, indices: Sequence[int], vectorized: Optional[bool] = None) -> List[float]:
+        """ضریب هم‌خونی هر اندیس تصویر؛ صفر برای افراد با کمتر از دو والد"""
+        ranks = [self.rank[i] for i in indices]
+        inbred = [r for r in ranks if self.second_parent[r] != NO_PARENT]
+        values = self.coefficients([(self.first_parent[r], self.second_parent[r]) for r in inbred], vectorized)
+        coefficients = dict(zip(inbred, values))
+        return [coefficients.get(r, 0.0) for r in ranks]
+
+    def coefficients(self, queries: Sequence[Tuple[int, int]], vectorized: Optional[bool] = None) -> List[float]:
+        """φ برای جفت‌های رتبه؛ vectorized=None یعنی numpy اگر نصب باشد"""
+        if vectorized is None:
+            vectorized = numpy is not None
+        if not queries:
+            return []
+        if vectorized:
+            if numpy is None:
+                raise ValueError("numpy نصب نیست")
+            return self._coefficients_numpy(queries)
+        return self._coefficients_python(queries)
+
+    def _coefficients_python(self, queries: Sequence[Tuple[int, int]]) -> List[float]:
+        count = len(self.nodes)
+        level_of = self.level_of
+        parents = (self.first_parent, self.second_parent)
+        first, second = parents
+        within = [set() for _ in range(self.levels)]
+        cross = [set() for _ in range(self.levels)]
+
+        def add(a: int, b: int):
+            high, low = (a, b) if a >= b else (b, a)
+            level = level_of[high]
+            group = within if high != low and level_of[low] == level else cross
+            group[level].add(high * count + low)
+
+        for a, b in queries:
+            add(a, b)
+
+        # باز کردن جفت‌ها از بالاترین نسل
+        for level in reversed(range(self.levels)):
+            for key in within[level]:
+                high, low = divmod(key, count)
+                for parent in parents:
+                    if parent[high] != NO_PARENT:
+                        # parent در نسل پایین‌تر است، پس جفت (low، parent) همین نسل
+                        cross[level].add(low * count + parent[high])
+            for key in cross[level]:
+                high, low = divmod(key, count)
+                if high == low:
+                    if second[high] != NO_PARENT:
+                        add(first[high], second[high])
+                    continue
+                for parent in parents:
+                    if parent[high] != NO_PARENT:
+                        add(parent[high], low)
+
+        phi: Dict[int, float] = {}
+
+        def lookup(a: int, b: int) -> float:
+            return phi[a * count + b if a >= b else b * count + a]
+
+        for level in range(self.levels):
+            for group in (cross[level], within[level]):
+                for key in group:
+                    high, low = divmod(key, count)
+                    if high == low:
+                        inbreeding = lookup(first[high], second[high]) if second[high] != NO_PARENT else 0.0
+                        phi[key] = 0.5 * (1.0 + inbreeding)
+                    else:
+                        total = 0.0
+                        for parent in parents:
+                            if parent[high] != NO_PARENT:
+                                total += lookup(parent[high], low)
+                        phi[key] = 0.5 * total
+
+        return [lookup(a, b) for a, b in queries]
+
+    def _coefficients_numpy(self, queries: Sequence[Tuple[int, int]]) -> List[float]:
+        np = numpy
+        count = len(self.nodes)
+        first, second, level_of = self._arrays
+        parents = (first, second)
+        empty = np.empty(0, dtype=np.int64)
+        within: List[list] = [[] for _ in range(self.levels)]
+        cross: List[list] = [[] for _ in range(self.levels)]
+
+        def add(a, b):
+            high, low = np.maximum(a, b), np.minimum(a, b)
+            level = level_of[high]
+            inside = (high != low) & (level_of[low] == level)
+            keys = high * count + low
+            for mask, groups in ((inside, within), (~inside, cross)):
+                selected, levels = keys[mask], level[mask]
+                if not selected.size:
+                    continue
+                order = np.argsort(levels, kind="stable")
+                selected, levels = selected[order], levels[order]
+                bounds = np.flatnonzero(np.diff(levels)) + 1
+                for chunk, chunk_level in zip(np.split(selected, bounds), levels[np.r_[0, bounds]]):
+                    groups[chunk_level].append(chunk)
+
+        query = np.asarray(queries, dtype=np.int64).reshape(-1, 2)
+        add(query[:, 0], query[:, 1])
+
+        # باز کردن جفت‌ها از بالاترین نسل؛ هر گروه در پایان آرایه مرتب یکتاست
+        for level in reversed(range(self.levels)):
+            keys = _sorted_unique(within[level], empty)
+            within[level] = keys
+            high, low = np.divmod(keys, count)
+            for parent in parents:
+                ancestor = parent[high]
+                mask = ancestor != NO_PARENT
+                cross[level].append(low[mask] * count + ancestor[mask])
+
+            keys = _sorted_unique(cross[level], empty)
+            cross[level] = keys
+            high, low = np.divmod(keys, count)
+            selves = high[high == low]
+            mask = second[selves] != NO_PARENT
+            add(first[selves][mask], second[selves][mask])
+            others = high != low
+            high, low = high[others], low[others]
+            for parent in parents:
+                ancestor = parent[high]
+                mask = ancestor != NO_PARENT
+                add(ancestor[mask], low[mask])
+
+        # کلید جفت‌های هر نسل از نسل‌های پایین‌تر بزرگ‌تر است، پس الحاق مرتب می‌ماند
+        all_keys = np.concatenate(
+            [np.sort(np.concatenate((cross[level], within[level]))) for level in range(self.levels)])
+        phi = np.zeros(all_keys.size)
+
+        def position(keys):
+            # searchsorted با کلیدهای مرتب حافظه نهان را بهتر استفاده می‌کند
+            order = np.argsort(keys)
+            found = np.empty(keys.size, dtype=np.int64)
+            found[order] = np.searchsorted(all_keys, keys[order])
+            return found
+
+        def lookup(a, b):
+            return phi[position(np.maximum(a, b) * count + np.minimum(a, b))]
+
+        def parent_sum(high, low):
+            total = np.zeros(high.size)
+            for parent in parents:
+                ancestor = parent[high]
+                mask = ancestor != NO_PARENT
+                total[mask] += lookup(ancestor[mask], low[mask])
+            return total
+
+        for level in range(self.levels):
+            keys = cross[level]
+            high, low = np.divmod(keys, count)
+            values = np.empty(keys.size)
+            selves = high == low
+            person = high[selves]
+            inbreeding = np.zeros(person.size)
+            mask = second[person] != NO_PARENT
+            inbreeding[mask] = lookup(first[person][mask], second[person][mask])
+            values[selves] = 0.5 * (1.0 + inbreeding)
+            values[~selves] = 0.5 * parent_sum(high[~selves], low[~selves])
+            phi[np.searchsorted(all_keys, keys)] = values
+
+            keys = within[level]
+            high, low = np.divmod(keys, count)
+            phi[np.searchsorted(all_keys, keys)] = 0.5 * parent_sum(high, low)
+
+        return lookup(query[:, 0], query[:, 1]).tolist()
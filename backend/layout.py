@@ -0,0 +1,140 @@
+"""
+نسل افراد و چیدمان لایه‌ای درخت برای نمایش
+
+نسل هر فرد طول بلندترین زنجیره والدین تا یک بنیان‌گذار است (بنیان‌گذار 0،
+فرزند یکی بیشتر از بیشترین نسل والدینش). شاخص نسل‌ها با هر رابطه والد-فرزند
+به‌روز می‌شود: فقط نوادگانی که نسلشان واقعاً بزرگ‌تر شده دوباره دیده می‌شوند.
+حذف فرد مثل شاخص اجداد فقط شاخص را برای بازسازی در اولین پرس‌وجو علامت
+می‌زند.
+
+چیدمان همان فاصله‌گذاری کلاینت را دارد (هر نسل یک ردیف و افراد هر ردیف در
+مرکز). ترتیب هر ردیف بر اساس میانگین x والدین است تا فرزندان زیر والدینشان
+بیایند و زن و شوهر کنار هم قرار می‌گیرند؛ همسری که والد ثبت‌شده ندارد در
+ردیف همسرش کشیده می‌شود نه در ردیف بنیان‌گذاران. «generation» هر گره همان
+ردیفی است که در آن کشیده شده (پس همیشه با y هم‌خوان است)؛ نسل شجره‌ای چنین
+همسری (0) از FamilyTree.generation گرفته می‌شود.
+"""
+
+from typing import Dict, Iterable, List
+
+HORIZONTAL_SPACING = 250
+VERTICAL_SPACING = 200
+
+
+class GenerationIndex:
+    """نسل هر فرد، به‌روز شده با هر رابطه والد-فرزند"""
+
+    def __init__(self):
+        self._generation: Dict = {}
+        self._stale = False
+
+    def invalidate(self):
+        """علامت‌گذاری برای بازسازی کامل در اولین پرس‌وجو (مثلاً پس از حذف فرد)"""
+        self._stale = True
+
+    def ensure(self, people: Iterable):
+        """بازسازی شاخص در صورت نامعتبر بودن"""
+        if self._stale:
+            self.rebuild(people)
+
+    def generation(self, person) -> int:
+        return self._generation.get(person, 0)
+
+    def rebuild(self, people: Iterable):
+        """ساخت کامل شاخص با ترتیب توپولوژیک روی گراف والدین"""
+        people = list(people)
+        generation = {}
+        self._stale = False
+
+        pending = {person: len(person.parents) for person in people}
+        order = [person for person in people if not pending[person]]
+        # لیست در حین پیمایش بزرگ می‌شود و نقش صف را دارد
+        for person in order:
+            below = generation.get(person, 0) + 1
+            for child in person.children:
+                if generation.get(child, 0) < below:
+                    generation[child] = below
+                pending[child] -= 1
+                if not pending[child]:
+                    order.append(child)
+
+        # افرادی که در چرخه (داده نامعتبر) گیر کرده‌اند یک نسل پایین‌تر از
+        # والدین بیرون چرخه قرار می‌گیرند
+        if len(order) < len(people):
+            for person in people:
+                if pending[person]:
+                    generation[person] = 1 + max(
+                        (generation.get(parent, 0) for parent in person.parents if not pending[parent]),
+                        default=-1)
+        self._generation = generation
+
+    def add_edge(self, parent, child):
+        """به‌روزرسانی افزایشی پس از افزودن رابطه والد-فرزند"""
+        if self._stale:
+            return
+
+        generation = self._generation
+        stack = [(child, generation.get(parent, 0) + 1)]
+        while stack:
+            person, depth = stack.pop()
+            if generation.get(person, 0) >= depth:
+                continue
+            if person is parent:
+                # یال تازه چرخه ساخته؛ بازسازی کامل چرخه را جدا می‌کند
+                self._stale = True
+                return
+            generation[person] = depth
+            depth += 1
+            stack.extend((descendant, depth) for descendant in person.children)
+
+
+def layered_layout(people: Iterable, index: GenerationIndex) -> List[Dict]:
+    """مختصات هر فرد: لیست {"id"، "x"، "y"، "generation"} به ترتیب ردیف (generation = ردیف)"""
+    # دسترسی مستقیم به دیکشنری؛ برای صدها هزار فرد هزینه فراخوانی متد محسوس است
+    depth = index._generation.get
+    rows: Dict[int, List] = {}
+    row_of = {}
+    for person in people:
+        row = depth(person, 0)
+        spouse = person.spouse
+        if not person.parents and spouse is not None and spouse.parents:
+            row = depth(spouse, 0)
+        row_of[person] = row
+        rows.setdefault(row, []).append(person)
+
+    x: Dict = {}
+    nodes = []
+    for row in sorted(rows):
+        # میانگین x والدینی که در ردیف‌های بالاتر جا گرفته‌اند؛ بقیه به ترتیب ورود در انتها
+        anchored = []
+        free = []
+        for person in rows[row]:
+            placed = [x[parent] for parent in person.parents if parent in x]
+            if placed:
+                anchored.append((sum(placed) / len(placed), person))
+            else:
+                free.append(person)
+        anchored.sort(key=_first)
+
+        ordered = []
+        seen = set()
+        for person in [person for _, person in anchored] + free:
+            if person in seen:
+                continue
+            ordered.append(person)
+            seen.add(person)
+            spouse = person.spouse
+            if spouse is not None and spouse not in seen and row_of.get(spouse) == row:
+                ordered.append(spouse)
+                seen.add(spouse)
+
+        start = -(len(ordered) - 1) * HORIZONTAL_SPACING / 2
+        y = row * VERTICAL_SPACING
+        for position, person in enumerate(ordered):
+            x[person] = left = start + position * HORIZONTAL_SPACING
+            nodes.append({"id": person.id, "x": left, "y": y, "generation": row})
+    return nodes
+
+
+def _first(item):
+    return item[0]
@@ -0,0 +1,218 @@
+"""
+طبقه‌بند جدول‌محور نسبت‌های خانوادگی فارسی
+
+مسیر به صورت دنباله‌ای از نشانه‌های (رابطه، جنسیت) در یک گذر خوانده می‌شود.
+یک ماشین حالت کوچک که هنگام import ساخته می‌شود شکل مسیر را تشخیص می‌دهد:
+همسرِ ابتدای مسیر، u گام بالا (والد)، d گام پایین (فرزند) و همسرِ انتهای مسیر.
+برچسب‌های واسط (جد، خواهر/برادرِ جد، ...) هم‌زمان با خواندن ساخته می‌شوند، پس
+برچسب‌گذاری O(طول مسیر) است و هر پیشوند مسیر یک حالت مستقل دارد؛ پیمایش‌های
+تک‌منبعی می‌توانند حالت هر گره را از حالت والدش در درخت BFS بسازند.
+
+الگوهای عمومی: جد در هر فاصله (پدر پدربزرگ، ...)، نواده در هر فاصله (نوه،
+نتیجه، نبیره، ...)، خواهر/برادرِ هر جد و نوادگان آن‌ها (پسر عمو، نوه برادر،
+پسر برادر پدربزرگ، ...) و نسبت‌های سببی در دو سر مسیر (عموی همسر، زن دایی،
+جاری، باجناق، ...). مسیرهایی که در این شکل نمی‌گنجند گام به گام نمایش داده
+می‌شوند.
+"""
+
+from typing import Iterable, Tuple
+
+PARENT = 0
+CHILD = 1
+SPOUSE = 2
+
+RELATION_CODES = {"والد": PARENT, "فرزند": CHILD, "همسر": SPOUSE}
+
+MALE = 0
+FEMALE = 1
+
+# فازهای ماشین حالت
+_START = 0
+_LEAD_SPOUSE = 1
+_UP = 2
+_DOWN = 3
+_TRAIL_SPOUSE = 4
+_REJECT = 5
+
+# _TRANSITIONS[فاز فعلی][رابطه] -> فاز بعدی
+_TRANSITIONS = (
+    (_UP, _DOWN, _LEAD_SPOUSE),            # _START
+    (_UP, _DOWN, _REJECT),                 # _LEAD_SPOUSE
+    (_UP, _DOWN, _TRAIL_SPOUSE),           # _UP
+    (_REJECT, _DOWN, _TRAIL_SPOUSE),       # _DOWN
+    (_REJECT, _REJECT, _REJECT),           # _TRAIL_SPOUSE
+    (_REJECT, _REJECT, _REJECT),           # _REJECT
+)
+
+# جدول واژه‌ها بر اساس جنسیت [مرد، زن]
+_PARENT_TERM = ("پدر", "مادر")
+_CHILD_TERM = ("پسر", "دختر")
+_SIBLING_TERM = ("برادر", "خواهر")
+_GRANDPARENT_TERM = ("پدربزرگ", "مادربزرگ")
+_PARTNER_TERM = ("شوهر", "زن")
+_SPOUSE_TERM = ("شوهر", "همسر")
+_CHILD_IN_LAW_TERM = ("داماد", "عروس")
+
+# _UNCLE_TERM[جنسیت والد][جنسیت خواهر/برادر والد]
+_UNCLE_TERM = (("عمو", "عمه"), ("دایی", "خاله"))
+
+# نام نوادگان بر اساس فاصله نسلی
+_DESCENDANT_NOUN = {2: "نوه", 3: "نتیجه", 4: "نبیره", 5: "ندیده"}
+
+# واژه‌های نمایش گام به گام (مسیرهای خارج از الگو)
+_STEP_TERM = (_PARENT_TERM, _CHILD_TERM, ("همسر", "همسر"))
+
+
+def _ezafe(term: str) -> str:
+    """افزودن «ی» اضافه به واژه‌های مختوم به مصوت (عمو -> عموی)"""
+    return term + "ی" if term.endswith(("و", "ا")) else term
+
+
+def _descendant_noun(generations: int) -> str:
+    return _DESCENDANT_NOUN.get(generations) or f"نواده نسل {generations}"
+
+
+class RelationScan:
+    """حالت طبقه‌بند پس از خواندن یک پیشوند از مسیر
+
+    حالت‌ها تغییرناپذیرند؛ advance حالت جدیدی برمی‌گرداند.
+    """
+
+    __slots__ = ("phase", "lead", "up", "down", "start_gender", "lead_gender",
+                 "first_up_gender", "ancestor", "below_top", "pivot", "end_gender",
+                 "target_gender", "previous", "word")
+
+    def __init__(self, start_gender: int):
+        self.phase = _START
+        self.lead = False
+        self.up = 0
+        self.down = 0
+        self.start_gender = start_gender
+        self.lead_gender = start_gender
+        self.first_up_gender = start_gender
+        self.ancestor = ""      # برچسب بالاترین جد دیده‌شده
+        self.below_top = ""     # برچسب جد یک نسل پایین‌تر از بالاترین جد
+        self.pivot = ""         # خواهر/برادرِ جد (یا خود فرد) در اولین گام پایین
+        self.end_gender = start_gender
+        self.target_gender = start_gender
+        # حالت قبلی و واژه آخرین گام؛ متن گام به گام فقط برای مسیر خارج از الگو ساخته می‌شود
+        self.previous = None
+        self.word = ""
+
+    def advance(self, relation: int, gender: int) -> "RelationScan":
+        """حالت پس از یک گام دیگر با رابطه و جنسیت فرد مقصد آن گام"""
+        scan = RelationScan.__new__(RelationScan)
+        scan.phase = phase = _TRANSITIONS[self.phase][relation]
+        scan.lead = self.lead
+        scan.up = self.up
+        scan.down = self.down
+        scan.start_gender = self.start_gender
+        scan.lead_gender = self.lead_gender
+        scan.first_up_gender = self.first_up_gender
+        scan.ancestor = self.ancestor
+        scan.below_top = self.below_top
+        scan.pivot = self.pivot
+        scan.end_gender = self.end_gender
+        scan.target_gender = gender
+        scan.previous = self
+        scan.word = _STEP_TERM[relation][gender]
+
+        if phase == _UP:
+            scan.up += 1
+            scan.end_gender = gender
+            scan.below_top = self.ancestor
+            if scan.up == 1:
+                scan.first_up_gender = gender
+                scan.ancestor = _PARENT_TERM[gender]
+            elif scan.up == 2:
+                grandparent = _GRANDPARENT_TERM[gender]
+                scan.ancestor = f"{grandparent} مادری" if self.first_up_gender == FEMALE else grandparent
+            else:
+                scan.ancestor = f"{_PARENT_TERM[gender]} {self.ancestor}"
+        elif phase == _DOWN:
+            if scan.down == 0 and scan.up:
+                if scan.up == 1:
+                    scan.pivot = _SIBLING_TERM[gender]
+                elif scan.up == 2:
+                    scan.pivot = _UNCLE_TERM[self.first_up_gender][gender]
+                else:
+                    scan.pivot = f"{_SIBLING_TERM[gender]} {self.below_top}"
+            scan.down += 1
+            scan.end_gender = gender
+        elif phase == _LEAD_SPOUSE:
+            scan.lead = True
+            scan.lead_gender = gender
+
+        return scan
+
+    def _blood_label(self) -> str:
+        """نسبت خونی بخش والد/فرزند مسیر نسبت به اولین فرد این بخش"""
+        up, down = self.up, self.down
+        if not down:
+            return self.ancestor
+        if not up:
+            if down == 1:
+                return _CHILD_TERM[self.end_gender]
+            return f"{_descendant_noun(down)} {_CHILD_TERM[self.end_gender]}"
+        if down == 1:
+            return self.pivot
+        if down == 2:
+            return f"{_CHILD_TERM[self.end_gender]} {self.pivot}"
+        return f"{_descendant_noun(down - 1)} {self.pivot}"
+
+    def _steps(self) -> str:
+        """نمایش گام به گام مسیر از فرد شروع"""
+        words = []
+        scan = self
+        while scan.previous is not None:
+            words.append(scan.word)
+            scan = scan.previous
+        return " ← ".join(reversed(words))
+
+    def label(self) -> str:
+        """برچسب نهایی نسبت برای مسیر خوانده‌شده"""
+        phase = self.phase
+        if phase == _START:
+            return "خود"
+        if phase == _REJECT:
+            return self._steps()
+
+        special = _SPECIAL_LABELS.get((self.lead, self.up, self.down, phase == _TRAIL_SPOUSE))
+        if special is not None:
+            return special(self)
+
+        label = self._blood_label()
+        if self.lead:
+            label = f"{_ezafe(label)} {_SPOUSE_TERM[self.lead_gender]}"
+        if phase == _TRAIL_SPOUSE:
+            label = f"{_PARTNER_TERM[self.target_gender]} {label}"
+        return label
+
+
+def _in_law_sibling(scan: RelationScan) -> str:
+    # همسرِ خواهر/برادرِ همسر: جاری (زنِ برادرشوهر) و باجناق (شوهرِ خواهرزن)
+    if scan.lead_gender == MALE and scan.end_gender == MALE and scan.target_gender == FEMALE:
+        return "جاری"
+    if scan.lead_gender == FEMALE and scan.end_gender == FEMALE and scan.target_gender == MALE:
+        return "باجناق"
+    return f"{_PARTNER_TERM[scan.target_gender]} {_SIBLING_TERM[scan.end_gender]} {_PARTNER_TERM[scan.lead_gender]}"
+
+
+# الگوهای کوتاه با واژه اختصاصی؛ کلید: (همسر در ابتدا، u، d، همسر در انتها)
+_SPECIAL_LABELS = {
+    (True, 0, 0, False): lambda s: "شوهر" if s.target_gender == MALE else "همسر",
+    (True, 1, 0, False): lambda s: f"{_PARENT_TERM[s.target_gender]} {'همسر' if s.start_gender == MALE else 'شوهر'}",
+    (True, 0, 1, False): lambda s: f"{_CHILD_TERM[s.target_gender]} {'همسر' if s.start_gender == MALE else 'شوهر'}",
+    (True, 1, 1, False): lambda s: f"{_SIBLING_TERM[s.target_gender]} {_PARTNER_TERM[s.lead_gender]}",
+    (False, 1, 0, True): lambda s: _PARENT_TERM[s.target_gender],
+    (False, 0, 1, True): lambda s: _CHILD_IN_LAW_TERM[s.target_gender],
+    (True, 1, 1, True): _in_law_sibling,
+}
+
+
+def classify(start_gender: int, steps: Iterable[Tuple[int, int]]) -> str:
+    """برچسب نسبت برای دنباله (رابطه، جنسیت) گام‌ها از دید فرد شروع"""
+    scan = RelationScan(start_gender)
+    for relation, gender in steps:
+        scan = scan.advance(relation, gender)
+    return scan.label()
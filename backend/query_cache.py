@@ -0,0 +1,75 @@
+"""
+کش LRU محدود برای نتایج پرس‌وجوهای نسبت خانوادگی
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class RelationshipCache:
+    """کش LRU وابسته به نسخه درخت
+
+    هر مقدار همراه نسخه درختی که از روی آن محاسبه شده ذخیره می‌شود. به محض
+    دیدن نسخه جدید کل کش دور ریخته می‌شود، پس نتیجه کهنه هرگز برگردانده
+    نمی‌شود. برای استفاده هم‌زمان چند نخ امن است.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        if capacity < 0:
+            raise ValueError("ظرفیت کش نمی‌تواند منفی باشد")
+        self.capacity = capacity
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._version: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def _sync(self, version: int):
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+                self._entries.clear()
+            self._version = version
+
+    def get(self, key: Hashable, version: int, default: Any = None) -> Any:
+        """مقدار ذخیره‌شده برای key در نسخه داده‌شده یا default"""
+        with self._lock:
+            self._sync(version)
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, version: int, value: Any):
+        """ذخیره مقدار و بیرون انداختن قدیمی‌ترین مورد در صورت پر بودن"""
+        with self._lock:
+            self._sync(version)
+            if self.capacity == 0:
+                return
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """آمار کش برای نمایش در API"""
+        return {
+            "capacity": self.capacity,
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
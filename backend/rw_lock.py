@@ -0,0 +1,139 @@
+"""
+قفل خواندن-نوشتن برای دسترسی هم‌زمان نخ‌ها به درخت
+
+چند خواننده (پرس‌وجوهای مسیر، نسبت و فهرست افراد) هم‌زمان اجرا می‌شوند و
+نویسنده (افزودن/حذف و بارگذاری دوباره) به تنهایی. نویسنده‌ای که منتظر است بر
+خواننده‌های تازه اولویت دارد تا زیر بار خواندن گرسنه نماند.
+
+قفل برای هر نخ بازگشتی است: متدی که قفل نوشتن دارد می‌تواند متدهای خواندن یا
+نوشتن دیگر را صدا بزند (bulk_load -> add_person) و خواندن تودرتو هم مسدود
+نمی‌شود. ارتقای خواندن به نوشتن در همان نخ بن‌بست است و RuntimeError می‌دهد.
+"""
+
+import threading
+from threading import get_ident
+from typing import Optional
+
+
+class _ReadDepth(threading.local):
+    # مقدار پیش‌فرض کلاسی: getattr با پیش‌فرض روی threading.local (با استثنای
+    # AttributeError) چند برابر کندتر است
+    depth = 0
+
+
+class ReadWriteLock:
+    """قفل خواندن-نوشتن بازگشتی با اولویت نویسنده"""
+
+    def __init__(self):
+        # with روی خود Lock سریع‌تر از with روی Condition است
+        self._mutex = threading.Lock()
+        self._condition = threading.Condition(self._mutex)
+        # تعداد نخ‌هایی که قفل خواندن دارند
+        self._readers = 0
+        # notify فقط وقتی کسی منتظر است
+        self._waiting_readers = 0
+        self._waiting_writers = 0
+        self._writer: Optional[int] = None
+        self._write_depth = 0
+        # عمق قفل خواندن هر نخ (برای خواندن تودرتو)
+        self._local = _ReadDepth()
+        self._read_guard = _ReadGuard(self)
+        self._write_guard = _WriteGuard(self)
+
+    def read(self) -> "_ReadGuard":
+        """with lock.read(): ..."""
+        return self._read_guard
+
+    def write(self) -> "_WriteGuard":
+        """with lock.write(): ..."""
+        return self._write_guard
+
+    def acquire_read(self, blocking: bool = True) -> bool:
+        """گرفتن قفل خواندن؛ با blocking=False اگر نویسنده‌ای فعال یا منتظر باشد False"""
+        if self._writer == get_ident():
+            # نویسنده خودش می‌تواند بخواند
+            self._write_depth += 1
+            return True
+        local = self._local
+        depth = local.depth
+        if depth:
+            local.depth = depth + 1
+            return True
+        with self._mutex:
+            if self._writer is not None or self._waiting_writers:
+                if not blocking:
+                    return False
+                self._waiting_readers += 1
+                try:
+                    while self._writer is not None or self._waiting_writers:
+                        self._condition.wait()
+                finally:
+                    self._waiting_readers -= 1
+            self._readers += 1
+        local.depth = 1
+        return True
+
+    def release_read(self):
+        if self._writer == get_ident():
+            self._write_depth -= 1
+            return
+        local = self._local
+        local.depth -= 1
+        if local.depth:
+            return
+        with self._mutex:
+            self._readers -= 1
+            if not self._readers and self._waiting_writers:
+                self._condition.notify_all()
+
+    def acquire_write(self):
+        ident = get_ident()
+        if self._writer == ident:
+            self._write_depth += 1
+            return
+        if self._local.depth:
+            raise RuntimeError("ارتقای قفل خواندن به نوشتن ممکن نیست")
+        with self._mutex:
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._condition.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = ident
+            self._write_depth = 1
+
+    def release_write(self):
+        self._write_depth -= 1
+        if self._write_depth:
+            return
+        with self._mutex:
+            self._writer = None
+            if self._waiting_readers or self._waiting_writers:
+                self._condition.notify_all()
+
+
+class _ReadGuard:
+    __slots__ = ("_lock",)
+
+    def __init__(self, lock: ReadWriteLock):
+        self._lock = lock
+
+    def __enter__(self):
+        self._lock.acquire_read()
+
+    def __exit__(self, *exc_info):
+        self._lock.release_read()
+
+
+class _WriteGuard:
+    __slots__ = ("_lock",)
+
+    def __init__(self, lock: ReadWriteLock):
+        self._lock = lock
+
+    def __enter__(self):
+        self._lock.acquire_write()
+
+    def __exit__(self, *exc_info):
+        self._lock.release_write()
@@ -0,0 +1,95 @@
+"""
+استخر محدود برای پیمایش‌های سنگین (مسیر، نسبت و اجداد)
+
+هر پیمایش در یکی از workers نخ استخر اجرا می‌شود و حداکثر max_queue پیمایش
+دیگر منتظر می‌مانند. وقتی صف پر است submit بلافاصله PoolSaturated می‌دهد
+(پاسخ 503) به جای اینکه درخواست‌ها پشت هم جمع شوند و همه نخ‌های سرور را
+بگیرند. پس چند پرس‌وجوی سنگین روی درخت بزرگ فقط همین استخر را پر می‌کنند و
+درخواست‌های دیگر (سلامت، فهرست افراد، تغییرات) جواب می‌گیرند.
+
+پیمایش‌ها روی درخت حافظه‌ای همین پروسه اجرا می‌شوند، پس استخر از نخ ساخته
+شده نه پروسه؛ GIL موازی‌سازی CPU نمی‌دهد ولی هر نخ هر چند میلی‌ثانیه نوبت
+را به نخ‌های دیگر می‌دهد.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+
+class PoolSaturated(Exception):
+    """صف استخر پیمایش پر است"""
+
+
+class TraversalPool:
+    """استخر نخ با تعداد محدود کار در حال اجرا و در صف"""
+
+    def __init__(self, workers: int = 4, max_queue: int = 32):
+        if workers < 1 or max_queue < 0:
+            raise ValueError("تنظیمات استخر پیمایش نامعتبر است")
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="traversal")
+        # هر کار یک جایگاه از workers + max_queue می‌گیرد تا پایان اجرا
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """فرستادن کار به استخر، یا PoolSaturated اگر صف پر باشد"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PoolSaturated(f"حداکثر {self.workers + self.max_queue} پیمایش هم‌زمان مجاز است")
+        with self._lock:
+            self._pending += 1
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._done(None)
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future: Optional[Future]):
+        with self._lock:
+            self._pending -= 1
+            if future is not None:
+                self.completed += 1
+        self._slots.release()
+
+    def run(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs):
+        """اجرا در استخر و انتظار برای نتیجه
+
+        پس از timeout ثانیه TimeoutError داده می‌شود. کاری که هنوز شروع نشده لغو
+        می‌شود؛ کار در حال اجرا تا پایان جایگاهش را نگه می‌دارد.
+        """
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    async def run_async(self, fn: Callable, *args, **kwargs):
+        """اجرا در استخر بدون مسدود کردن event loop"""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stats(self) -> Dict[str, int]:
+        """آمار استخر برای نمایش در API"""
+        with self._lock:
+            pending = self._pending
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "running": min(pending, self.workers),
+            "queued": max(pending - self.workers, 0),
+            "completed": self.completed,
+            "rejected": self.rejected
+        }
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
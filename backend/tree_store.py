@@ -0,0 +1,304 @@
+"""
+ذخیره‌سازی پایدار درخت خانوادگی روی SQLite
+
+درخت کامل همچنان در حافظه هر پروسه نگه داشته می‌شود تا مسیریابی‌ها روی همان
+ساختارهای سریع حافظه‌ای اجرا شوند؛ SQLite منبع اصلی داده و نقطه هماهنگی بین
+workerهای gunicorn است. پایگاه داده در حالت WAL باز می‌شود تا خواننده‌ها
+نویسنده را متوقف نکنند.
+
+هر تغییر در یک تراکنش BEGIN IMMEDIATE انجام می‌شود: قفل نوشتن گرفته می‌شود،
+درخت حافظه‌ای در صورت نیاز با آخرین داده همگام می‌شود، اعتبارسنجی روی همان
+داده تازه انجام می‌شود و تغییر همراه شمارنده نسخه و رکورد جدول changes ذخیره
+می‌شود. پیش از هر خواندن، sync فقط PRAGMA data_version را می‌خواند (چند
+میکروثانیه) و تنها اگر پروسه دیگری چیزی نوشته باشد تغییرات بعد از نسخه محلی
+را از جدول changes روی درخت حافظه‌ای اجرا می‌کند؛ پس نوشتن‌های نوبتی workerها
+برای بقیه به اندازه همان تغییرات هزینه دارد نه اندازه درخت. فقط وقتی تغییرات
+لازم دیگر در جدول نیستند (عقب‌تر از CHANGE_FEED_SIZE تغییر، مثلاً پس از یک
+بارگذاری انبوه) کل درخت دوباره بارگذاری می‌شود.
+"""
+
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+from change_log import Change
+from family_tree import FamilyTree, Gender, Person, _with_relative
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS people (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    gender TEXT NOT NULL,
+    birth_year INTEGER,
+    spouse_id TEXT REFERENCES people(id) ON DELETE SET NULL
+);
+CREATE INDEX IF NOT EXISTS people_spouse ON people(spouse_id);
+
+CREATE TABLE IF NOT EXISTS parent_child (
+    parent_id TEXT NOT NULL REFERENCES people(id) ON DELETE CASCADE,
+    child_id TEXT NOT NULL REFERENCES people(id) ON DELETE CASCADE,
+    UNIQUE (parent_id, child_id)
+);
+CREATE INDEX IF NOT EXISTS parent_child_child ON parent_child(child_id);
+
+-- آخرین تغییرات برای فید تغییرات؛ همه workerها همین جدول را می‌خوانند
+CREATE TABLE IF NOT EXISTS changes (
+    version INTEGER PRIMARY KEY,
+    operation TEXT NOT NULL,
+    args TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('instance', random() & 9223372036854775807);
+"""
+
+
+class SQLiteFamilyTree(FamilyTree):
+    """درخت خانوادگی با ذخیره‌سازی SQLite، قابل اشتراک بین چند پروسه
+
+    رابط همان FamilyTree است. نسخه درخت و instance_id در پایگاه داده ذخیره
+    می‌شوند، پس همه پروسه‌ها برای یک وضعیت داده نسخه یکسانی می‌بینند.
+    """
+
+    def __init__(self, path: str, timeout: float = 30.0):
+        super().__init__()
+        self.path = path
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, timeout=timeout, isolation_level=None,
+                                   check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.executescript(_SCHEMA)
+        # شناسه ذخیره‌شده در فایل: همه workerها برای یک داده ETag یکسان می‌دهند
+        instance = self._db.execute("SELECT value FROM meta WHERE key = 'instance'").fetchone()[0]
+        self.instance_id = format(instance, "x")
+        self._data_version: Optional[int] = None
+        self._writing = False
+        self.sync()
+
+    def close(self):
+        """بستن اتصال پایگاه داده"""
+        with self._lock:
+            self._db.close()
+
+    def sync(self) -> bool:
+        """همگام‌سازی درخت اگر پروسه دیگری پایگاه داده را تغییر داده باشد
+
+        بررسی بدون قفل نوشتن درخت انجام می‌شود؛ فقط اجرای تغییرات (یا بارگذاری
+        دوباره) خواننده‌ها را متوقف می‌کند. ترتیب قفل‌ها همیشه اول lock درخت و بعد قفل اتصال است.
+        """
+        with self._lock:
+            # data_version فقط با commit اتصال‌های دیگر تغییر می‌کند
+            if self._db.execute("PRAGMA data_version").fetchone()[0] == self._data_version:
+                return False
+        with self.lock.write(), self._lock:
+            data_version = self._db.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self._data_version:
+                return False
+            if self._db.in_transaction:
+                self._refresh()
+            else:
+                # همه SELECTها باید یک تصویر سازگار از پایگاه داده ببینند
+                self._db.execute("BEGIN")
+                try:
+                    self._refresh()
+                finally:
+                    self._db.execute("COMMIT")
+            self._data_version = data_version
+            return True
+
+    def _refresh(self):
+        """رساندن درخت حافظه‌ای به پایگاه داده: اجرای تغییرات تازه یا بارگذاری کامل"""
+        db = self._db
+        current = db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+        # بار اول (و پس از تراکنش برگشت‌خورده) درخت از جدول‌ها ساخته می‌شود
+        if self._data_version is not None and current >= self.version:
+            rows = db.execute(
+                "SELECT version, operation, args FROM changes WHERE version > ? AND version <= ? "
+                "ORDER BY version", (self.version, current)).fetchall()
+            if len(rows) == current - self.version and self._apply_changes(rows):
+                return
+        self._load()
+
+    def _apply_changes(self, rows: List) -> bool:
+        """اجرای تغییرات workerهای دیگر فقط روی درخت حافظه‌ای
+
+        متدهای FamilyTree مستقیم صدا زده می‌شوند تا چیزی دوباره در پایگاه داده
+        نوشته نشود؛ نسخه‌ها و فید تغییرات همان ترتیب پایگاه داده را می‌گیرند.
+        خروجی False یعنی تغییرات با درخت نمی‌خوانند و بارگذاری کامل لازم است.
+        """
+        try:
+            for version, operation, args in rows:
+                args = json.loads(args)
+                if operation == "apply_batch":
+                    # همان قرارداد apply_batch: عملیات جمع و یک تغییر ثبت می‌شود
+                    self._batch = []
+                    try:
+                        for name, *batch_args in args[0]:
+                            getattr(FamilyTree, name)(self, *batch_args)
+                    finally:
+                        applied, self._batch = self._batch, None
+                    self._changed("apply_batch", applied)
+                else:
+                    getattr(FamilyTree, operation)(self, *args)
+                if self.version != version:
+                    return False
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return False
+        return True
+
+    def _load(self):
+        """ساخت کامل درخت حافظه‌ای از جدول‌ها با حفظ ترتیب درج"""
+        db = self._db
+        people = {}
+        for person_id, name, gender, birth_year in db.execute(
+                "SELECT id, name, gender, birth_year FROM people ORDER BY rowid"):
+            people[person_id] = Person(person_id, name, Gender(gender), birth_year)
+
+        for person_id, spouse_id in db.execute(
+                "SELECT id, spouse_id FROM people WHERE spouse_id IS NOT NULL"):
+            people[person_id].spouse = people[spouse_id]
+
+        for parent_id, child_id in db.execute(
+                "SELECT parent_id, child_id FROM parent_child ORDER BY rowid"):
+            parent = people[parent_id]
+            child = people[child_id]
+            child.parents = _with_relative(child.parents, parent)
+            parent.children = _with_relative(parent.children, child)
+
+        self.people = people
+        self.version = db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+        self.changes.reset(self.version)
+        self._snapshot = None
+        self._ancestry.invalidate()
+        self._generations.invalidate()
+
+    @contextmanager
+    def _write(self):
+        """تراکنش نوشتن: قفل سراسری، همگام‌سازی، تغییر و ذخیره نسخه
+
+        فراخوانی‌های تودرتو (مثلاً add_person درون bulk_load) در تراکنش بیرونی
+        انجام می‌شوند.
+        """
+        with self.lock.write(), self._lock:
+            db = self._db
+            if self._writing:
+                yield db
+                return
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                self.sync()
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            version = self.version
+            self._writing = True
+            try:
+                yield db
+            except BaseException:
+                self._writing = False
+                db.execute("ROLLBACK")
+                if self.version != version:
+                    # درخت حافظه‌ای تغییر کرده ولی ذخیره نشده؛ از پایگاه داده بازسازی شود
+                    self.changes.truncate(version)
+                    self._data_version = None
+                    self.sync()
+                raise
+            self._writing = False
+            if self.version == version:
+                db.execute("ROLLBACK")
+                return
+            db.execute("UPDATE meta SET value = ? WHERE key = 'version'", (self.version,))
+            self._store_changes(db, version)
+            db.execute("COMMIT")
+
+    def _store_changes(self, db: sqlite3.Connection, version: int):
+        """ذخیره تغییرات این تراکنش و نگه داشتن فقط آخرین capacity تغییر
+
+        تغییرات تراکنش در حلقه حافظه‌ای جمع شده‌اند؛ در یک بارگذاری انبوه فقط
+        آخرین capacity تغییر نوشته می‌شود چون قدیمی‌ترها به هر حال حذف می‌شدند.
+        """
+        db.executemany("INSERT OR REPLACE INTO changes (version, operation, args) VALUES (?, ?, ?)",
+                       [(change_version, operation, json.dumps(args, ensure_ascii=False))
+                        for change_version, operation, args in self.changes.after(version)])
+        db.execute("DELETE FROM changes WHERE version <= ?", (self.version - self.changes.capacity,))
+
+    def changes_since(self, version: int) -> Optional[List[Change]]:
+        """تغییرات از جدول مشترک، پس تغییرات workerهای دیگر هم دیده می‌شوند"""
+        with self._lock:
+            current = self.version
+            if version == current:
+                return []
+            db = self._db
+            nested = db.in_transaction
+            if not nested:
+                db.execute("BEGIN")
+            try:
+                oldest = db.execute("SELECT MIN(version) FROM changes").fetchone()[0]
+                rows = db.execute(
+                    "SELECT version, operation, args FROM changes WHERE version > ? AND version <= ? "
+                    "ORDER BY version", (version, current)).fetchall()
+            finally:
+                if not nested:
+                    db.execute("COMMIT")
+        if oldest is None or version < oldest - 1 or version > current:
+            return None
+        return [(change_version, operation, tuple(json.loads(args))) for change_version, operation, args in rows]
+
+    def bulk_load(self, stream, fmt: str = "json", chunk_size: int = 1 << 20,
+                  max_errors: int = 1000) -> Dict:
+        """کل بارگذاری در یک تراکنش"""
+        with self._write():
+            return super().bulk_load(stream, fmt, chunk_size, max_errors)
+
+    def apply_batch(self, operations: Iterable) -> int:
+        """کل دسته در یک تراکنش؛ خطا پایگاه داده را هم برمی‌گرداند"""
+        with self._write():
+            return super().apply_batch(operations)
+
+    def add_person(self, person_id: str, name: str, gender: str, birth_year: Optional[int] = None) -> Person:
+        with self._write() as db:
+            person = super().add_person(person_id, name, gender, birth_year)
+            db.execute("INSERT INTO people (id, name, gender, birth_year) VALUES (?, ?, ?, ?)",
+                       (person.id, person.name, person.gender.value, person.birth_year))
+        return person
+
+    def remove_person(self, person_id: str) -> bool:
+        with self._write() as db:
+            person = self.people.get(person_id)
+            spouse = person.spouse if person is not None else None
+            removed = super().remove_person(person_id)
+            if removed:
+                if spouse is not None:
+                    db.execute("UPDATE people SET spouse_id = NULL WHERE id = ?", (spouse.id,))
+                db.execute("DELETE FROM people WHERE id = ?", (person_id,))
+        return removed
+
+    def add_parent_child(self, parent_id: str, child_id: str):
+        with self._write() as db:
+            super().add_parent_child(parent_id, child_id)
+            db.execute("INSERT OR IGNORE INTO parent_child (parent_id, child_id) VALUES (?, ?)",
+                       (parent_id, child_id))
+
+    def add_spouse(self, person1_id: str, person2_id: str):
+        with self._write() as db:
+            super().add_spouse(person1_id, person2_id)
+            # همسران قبلی آزاد می‌شوند
+            db.execute("UPDATE people SET spouse_id = NULL WHERE spouse_id IN (?, ?) AND id NOT IN (?, ?)",
+                       (person1_id, person2_id, person1_id, person2_id))
+            db.executemany("UPDATE people SET spouse_id = ? WHERE id = ?",
+                           [(person2_id, person1_id), (person1_id, person2_id)])
+
+    def clear(self):
+        with self._write() as db:
+            super().clear()
+            db.execute("DELETE FROM parent_child")
+            db.execute("UPDATE people SET spouse_id = NULL")
+            db.execute("DELETE FROM people")
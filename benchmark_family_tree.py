@@ -0,0 +1,772 @@
+"""
+اسکریپت بنچمارک برای اندازه‌گیری کارایی سیستم شجره‌نامه روی درخت‌های بزرگ
+
+اجرا:
+    python benchmark_family_tree.py            # اجرای همه بنچمارک‌ها
+    python benchmark_family_tree.py bfs        # فقط یک بنچمارک
+"""
+
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+from family_tree import FamilyTree
+from binary_snapshot import MappedFamilyTree, save_binary_snapshot
+from bulk_import import read_records
+from graph_snapshot import GraphSnapshot
+from journal import MutationJournal, load_snapshot, write_snapshot
+from tree_store import SQLiteFamilyTree
+
+
+def build_synthetic_tree(size, seed=1, tree=None):
+    """ساخت درخت چند نسلی مصنوعی با حدود size نفر (در tree اگر داده شود)"""
+    rng = random.Random(seed)
+    if tree is None:
+        tree = FamilyTree()
+    counter = 0
+
+    def new_person(gender):
+        nonlocal counter
+        person_id = f"p{counter}"
+        counter += 1
+        tree.add_person(person_id, f"فرد{person_id}", gender, 1800 + rng.randint(0, 200))
+        return person_id
+
+    husband, wife = new_person("male"), new_person("female")
+    tree.add_spouse(husband, wife)
+    generation = [(husband, wife)]
+
+    while counter < size and generation:
+        next_generation = []
+        for father, mother in generation:
+            for _ in range(rng.randint(1, 4)):
+                if counter >= size:
+                    break
+                gender = rng.choice(["male", "female"])
+                child = new_person(gender)
+                tree.add_parent_child(father, child)
+                tree.add_parent_child(mother, child)
+                if counter < size and rng.random() < 0.8:
+                    partner = new_person("female" if gender == "male" else "male")
+                    tree.add_spouse(child, partner)
+                    couple = (child, partner) if gender == "male" else (partner, child)
+                    next_generation.append(couple)
+        generation = next_generation
+
+    return tree
+
+
+def _legacy_bfs_find_path(tree, start_id, end_id):
+    """نسخه قبلی BFS با کپی مسیر در هر گام؛ خروجی: (مسیر، تعداد گره‌های گسترش‌یافته)"""
+    visited = set()
+    queue = deque([(tree.people[start_id], [(tree.people[start_id], "شروع")])])
+
+    while queue:
+        current, path = queue.popleft()
+        if current.id in visited:
+            continue
+        visited.add(current.id)
+        if current.id == end_id:
+            return path, len(visited)
+        for parent in current.parents:
+            if parent.id not in visited:
+                queue.append((parent, path + [(parent, "والد")]))
+        for child in current.children:
+            if child.id not in visited:
+                queue.append((child, path + [(child, "فرزند")]))
+        if current.spouse and current.spouse.id not in visited:
+            queue.append((current.spouse, path + [(current.spouse, "همسر")]))
+
+    return None, len(visited)
+
+
+def _random_pairs(tree, count, seed=2):
+    rng = random.Random(seed)
+    ids = list(tree.people)
+    return [(rng.choice(ids), rng.choice(ids)) for _ in range(count)]
+
+
+def benchmark_bfs(size=100_000, queries=20):
+    """مقایسه BFS یک‌طرفه قبلی با BFS دوطرفه"""
+    print(f"📊 BFS: یک‌طرفه در برابر دوطرفه ({size:,} نفر، {queries} پرس‌وجو)")
+    print("=" * 50)
+
+    tree = build_synthetic_tree(size)
+    pairs = _random_pairs(tree, queries)
+    tree.snapshot()
+
+    legacy_time = 0.0
+    legacy_expanded = 0
+    new_time = 0.0
+    new_expanded = 0
+
+    for start_id, end_id in pairs:
+        started = time.perf_counter()
+        legacy_path, expanded = _legacy_bfs_find_path(tree, start_id, end_id)
+        legacy_time += time.perf_counter() - started
+        legacy_expanded += expanded
+
+        started = time.perf_counter()
+        path = tree.bfs_find_path(start_id, end_id)
+        new_time += time.perf_counter() - started
+
+        if start_id != end_id:
+            graph = tree.snapshot()
+            search = graph._bidirectional_search(graph.index[start_id], graph.index[end_id])
+            new_expanded += len(search[0]) + len(search[2])
+
+        if legacy_path is not None and start_id != end_id:
+            assert len(path) == len(legacy_path), "طول مسیرها برابر نیست"
+
+    print(f"  یک‌طرفه: {legacy_time * 1000 / queries:10.2f} ms/پرس‌وجو  {legacy_expanded // queries:>10,} گره بازدیدشده")
+    print(f"  دوطرفه:  {new_time * 1000 / queries:10.2f} ms/پرس‌وجو  {new_expanded // queries:>10,} گره بازدیدشده")
+    print()
+
+
+def _pointer_sweep(tree, start_id):
+    """BFS کامل روی اشاره‌گرهای Person با مجموعه visited رشته‌ای (روش قبلی)"""
+    visited = {start_id}
+    queue = deque([tree.people[start_id]])
+    while queue:
+        current = queue.popleft()
+        relatives = list(current.parents) + list(current.children)
+        if current.spouse:
+            relatives.append(current.spouse)
+        for relative in relatives:
+            if relative.id not in visited:
+                visited.add(relative.id)
+                queue.append(relative)
+    return len(visited)
+
+
+def benchmark_snapshot(size=1_000_000, queries=20):
+    """حافظه و توان عملیاتی تصویر CSR"""
+    print(f"📊 تصویر CSR ({size:,} نفر)")
+    print("=" * 50)
+
+    tracemalloc.start()
+    tree = build_synthetic_tree(size)
+    tree_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    graph = tree.snapshot()
+    build_time = time.perf_counter() - started
+
+    tracemalloc.start()
+    retained = GraphSnapshot(tree.people.values())
+    snapshot_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del retained
+
+    print(f"  گراف Person:        {tree_bytes / 2**20:10.1f} MiB")
+    print(f"  تصویر CSR (کل):     {snapshot_bytes / 2**20:10.1f} MiB  (آرایه‌ها: {graph.nbytes() / 2**20:.1f} MiB)")
+    print(f"  زمان ساخت تصویر:    {build_time:10.2f} s  ({graph.edge_count:,} یال)")
+
+    started = time.perf_counter()
+    reached = _pointer_sweep(tree, "p0")
+    pointer_time = time.perf_counter() - started
+    started = time.perf_counter()
+    graph.bfs_order(graph.index["p0"])
+    csr_time = time.perf_counter() - started
+    print(f"  پیمایش کامل Person: {reached / pointer_time:10,.0f} گره/s")
+    print(f"  پیمایش کامل CSR:    {reached / csr_time:10,.0f} گره/s")
+
+    pairs = _random_pairs(tree, queries)
+    for name, method in (("BFS", tree.bfs_find_path), ("DFS", tree.dfs_find_path)):
+        started = time.perf_counter()
+        for start_id, end_id in pairs:
+            method(start_id, end_id)
+        elapsed = time.perf_counter() - started
+        print(f"  {name} روی CSR:         {queries / elapsed:10,.1f} پرس‌وجو/s")
+    print()
+
+
+class _LegacyPerson:
+    """نمایش قبلی Person با __dict__ و دو لیست جدا برای هر نفر"""
+
+    def __init__(self, person_id, name, gender, birth_year=None):
+        self.id = person_id
+        self.name = name
+        self.gender = gender
+        self.birth_year = birth_year
+        self.parents = []
+        self.children = []
+        self.spouse = None
+
+
+def _person_overhead(person):
+    """بایت‌های اختصاصی یک فرد: شیء، __dict__ و ظرف‌های والد/فرزند (بدون رشته‌های مشترک)"""
+    size = sys.getsizeof(person)
+    if hasattr(person, "__dict__"):
+        size += sys.getsizeof(person.__dict__)
+    for relatives in (person.parents, person.children):
+        if relatives:
+            size += sys.getsizeof(relatives)
+    return size
+
+
+def benchmark_person_memory(size=200_000):
+    """بایت به ازای هر فرد: Person قبلی در برابر Person فشرده"""
+    print(f"📊 حافظه Person ({size:,} نفر)")
+    print("=" * 50)
+
+    tree = build_synthetic_tree(size)
+
+    legacy = {}
+    for person in tree.people.values():
+        legacy[person.id] = _LegacyPerson(person.id, person.name, person.gender, person.birth_year)
+    for person in tree.people.values():
+        copy = legacy[person.id]
+        copy.parents.extend(legacy[p.id] for p in person.parents)
+        copy.children.extend(legacy[c.id] for c in person.children)
+        copy.spouse = legacy[person.spouse.id] if person.spouse else None
+
+    before = sum(_person_overhead(p) for p in legacy.values()) / len(legacy)
+    after = sum(_person_overhead(p) for p in tree.people.values()) / len(tree.people)
+    leaves = sum(1 for p in tree.people.values() if not p.children) / len(tree.people)
+
+    print(f"  قبل (__dict__ + دو لیست): {before:8.1f} بایت/نفر")
+    print(f"  بعد (__slots__ + تاپل مشترک): {after:8.1f} بایت/نفر")
+    print(f"  افراد بدون فرزند: {leaves:.0%}")
+    print()
+
+
+def _legacy_add_parent_child(parent, child):
+    """نسخه قبلی افزودن رابطه با جستجوی خطی در لیست‌ها"""
+    if parent not in child.parents:
+        child.parents.append(parent)
+    if child not in parent.children:
+        parent.children.append(child)
+
+
+def _legacy_remove_person(people, person_id):
+    """نسخه قبلی حذف فرد با list.remove برای هر همسایه"""
+    person = people[person_id]
+    for parent in person.parents:
+        if person in parent.children:
+            parent.children.remove(person)
+    for child in person.children:
+        if person in child.parents:
+            child.parents.remove(person)
+    if person.spouse:
+        person.spouse.spouse = None
+    del people[person_id]
+
+
+def benchmark_edge_insertion(heads=1_000, children_per_head=1_000):
+    """درج انبوه یال والد-فرزند و حذف فرزندان: لیست با جستجوی خطی در برابر ظرف O(1)"""
+    edges = heads * children_per_head
+    print(f"📊 درج انبوه {edges:,} یال ({heads:,} والد × {children_per_head:,} فرزند)")
+    print("=" * 50)
+
+    legacy_heads = [_LegacyPerson(f"h{i}", "سرخاندان", "male") for i in range(heads)]
+    legacy_children = [_LegacyPerson(f"c{i}", "فرزند", "female") for i in range(edges)]
+    started = time.perf_counter()
+    for i, child in enumerate(legacy_children):
+        _legacy_add_parent_child(legacy_heads[i % heads], child)
+    legacy_insert = time.perf_counter() - started
+
+    legacy_people = {p.id: p for p in legacy_heads + legacy_children}
+    started = time.perf_counter()
+    for i in range(edges - 1, -1, -10):
+        _legacy_remove_person(legacy_people, f"c{i}")
+    legacy_remove = time.perf_counter() - started
+
+    tree = FamilyTree()
+    for i in range(heads):
+        tree.add_person(f"h{i}", "سرخاندان", "male")
+    for i in range(edges):
+        tree.add_person(f"c{i}", "فرزند", "female")
+    started = time.perf_counter()
+    for i in range(edges):
+        tree.add_parent_child(f"h{i % heads}", f"c{i}")
+    insert = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for i in range(edges - 1, -1, -10):
+        tree.remove_person(f"c{i}")
+    remove = time.perf_counter() - started
+
+    print(f"  درج، لیست قبلی:   {legacy_insert:8.2f} s  ({edges / legacy_insert:12,.0f} یال/s)")
+    print(f"  درج، ظرف جدید:    {insert:8.2f} s  ({edges / insert:12,.0f} یال/s)")
+    print(f"  حذف ۱۰٪ فرزندان (از انتها)، قبلی: {legacy_remove:8.2f} s")
+    print(f"  حذف ۱۰٪ فرزندان (از انتها)، جدید: {remove:8.2f} s")
+    print()
+
+
+def benchmark_ancestry(size=100_000, queries=10_000):
+    """زمان پاسخ شاخص اجداد در برابر BFS روی کل گراف"""
+    print(f"📊 شاخص اجداد ({size:,} نفر، {queries:,} پرس‌وجو)")
+    print("=" * 50)
+
+    tree = build_synthetic_tree(size)
+    pairs = _random_pairs(tree, queries)
+
+    tree.remove_person(f"p{size - 1}")
+    started = time.perf_counter()
+    tree.is_ancestor("p0", "p1")
+    print(f"  بازسازی کامل پس از حذف: {time.perf_counter() - started:.3f} s")
+
+    started = time.perf_counter()
+    for first, second in pairs:
+        tree.is_ancestor(first, second)
+    elapsed = time.perf_counter() - started
+    print(f"  is_ancestor:      {elapsed * 1e6 / queries:8.2f} µs/پرس‌وجو")
+
+    started = time.perf_counter()
+    for first, second in pairs:
+        tree.common_ancestors(first, second)
+    elapsed = time.perf_counter() - started
+    print(f"  common_ancestors: {elapsed * 1e6 / queries:8.2f} µs/پرس‌وجو")
+
+    sample = pairs[:100]
+    tree.snapshot()
+    started = time.perf_counter()
+    for first, second in sample:
+        tree.bfs_find_path(first, second)
+    elapsed = time.perf_counter() - started
+    print(f"  bfs_find_path:    {elapsed * 1e6 / len(sample):8.2f} µs/پرس‌وجو")
+    print()
+
+
+def benchmark_relationship_map(size=20_000):
+    """نسبت همه افراد با یک فرد: یک پیمایش در برابر N پرس‌وجوی جدا"""
+    print(f"📊 نقشه نسبت‌ها ({size:,} نفر)")
+    print("=" * 50)
+
+    tree = build_synthetic_tree(size)
+    source_id = f"p{size // 2}"
+    source = tree.people[source_id]
+    tree.snapshot()
+
+    started = time.perf_counter()
+    mapping = tree.relationship_map(source_id)
+    single = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for person_id in tree.people:
+        if person_id != source_id:
+            path = tree.bfs_find_path(source_id, person_id)
+            tree.simplify_relationship(path, source)
+    separate = time.perf_counter() - started
+
+    print(f"  یک پیمایش:         {single:8.2f} s  ({len(mapping):,} نفر)")
+    print(f"  {size - 1:,} پرس‌وجوی جدا: {separate:8.2f} s")
+    print()
+
+
+def _journal_writes(directory, count, **settings):
+    journal = MutationJournal(directory, **settings)
+    tree = FamilyTree()
+    journal.attach(tree)
+    started = time.perf_counter()
+    for i in range(count):
+        tree.add_person(f"w{i}", "فرد", "male")
+    journal.close()
+    return time.perf_counter() - started
+
+
+def benchmark_journal(size=1_000_000, writes=5_000):
+    """هزینه ژورنال در نوشتن و زمان بازیابی پس از راه‌اندازی دوباره"""
+    print(f"📊 ژورنال و تصویر ({size:,} نفر)")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as directory:
+        each = _journal_writes(os.path.join(directory, "each"), writes, sync_interval=0)
+        grouped = _journal_writes(os.path.join(directory, "grouped"), writes, sync_interval=0.05)
+        print(f"  fsync برای هر تغییر: {writes / each:10,.0f} نوشتن/ثانیه")
+        print(f"  fsync تأخیری 0.05 s: {writes / grouped:10,.0f} نوشتن/ثانیه")
+
+        # کل درخت فقط در ژورنال (بدون تصویر)
+        path = os.path.join(directory, "recovery")
+        tree = FamilyTree()
+        journal = MutationJournal(path, snapshot_every=10 ** 9)
+        journal.attach(tree)
+        build_synthetic_tree(size, tree=tree)
+        edges = sum(len(person.children) for person in tree.people.values())
+        journal.close()
+
+        started = time.perf_counter()
+        MutationJournal(path).attach(FamilyTree())
+        replay = time.perf_counter() - started
+
+        snapshot_path = os.path.join(directory, "snapshot.json")
+        started = time.perf_counter()
+        write_snapshot(tree, snapshot_path)
+        write = time.perf_counter() - started
+        snapshot_mb = os.path.getsize(snapshot_path) / 2 ** 20
+
+        started = time.perf_counter()
+        load_snapshot(FamilyTree(), snapshot_path)
+        load = time.perf_counter() - started
+
+    print(f"  {edges:,} رابطه والد-فرزند، تصویر {snapshot_mb:.0f} MB")
+    print(f"  بازیابی از کل ژورنال: {replay:8.2f} s")
+    print(f"  نوشتن تصویر:          {write:8.2f} s")
+    print(f"  بازیابی از تصویر:     {load:8.2f} s")
+    print()
+
+
+def benchmark_binary_snapshot(size=1_000_000, queries=20):
+    """راه‌اندازی از تصویر دودویی mmap در برابر تصویر JSON"""
+    print(f"📊 تصویر دودویی ({size:,} نفر)")
+    print("=" * 50)
+
+    tree = build_synthetic_tree(size)
+    pairs = _random_pairs(tree, queries)
+
+    with tempfile.TemporaryDirectory() as directory:
+        json_path = os.path.join(directory, "snapshot.json")
+        binary_path = os.path.join(directory, "snapshot.bin")
+        write_snapshot(tree, json_path)
+        started = time.perf_counter()
+        save_binary_snapshot(tree, binary_path)
+        save = time.perf_counter() - started
+        del tree
+
+        started = time.perf_counter()
+        loaded = FamilyTree()
+        load_snapshot(loaded, json_path)
+        loaded.bfs_find_path(*pairs[0])
+        json_startup = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for start_id, end_id in pairs:
+            loaded.bfs_find_path(start_id, end_id)
+        in_memory = (time.perf_counter() - started) / queries
+        del loaded
+
+        started = time.perf_counter()
+        mapped = MappedFamilyTree(binary_path)
+        opened = time.perf_counter() - started
+        mapped.bfs_find_path(*pairs[0])
+        mapped_startup = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for start_id, end_id in pairs:
+            mapped.bfs_find_path(start_id, end_id)
+        mapped_query = (time.perf_counter() - started) / queries
+
+        started = time.perf_counter()
+        mapped.materialize()
+        materialize = time.perf_counter() - started
+
+        json_mb = os.path.getsize(json_path) / 2 ** 20
+        binary_mb = os.path.getsize(binary_path) / 2 ** 20
+
+    print(f"  حجم: JSON {json_mb:.0f} MB، دودویی {binary_mb:.0f} MB (نوشتن {save:.2f} s)")
+    print(f"  JSON تا اولین پاسخ:        {json_startup:8.2f} s")
+    print(f"  mmap تا اولین پاسخ:        {mapped_startup:8.3f} s  (باز کردن {opened * 1000:.1f} ms)")
+    print(f"  BFS روی حافظه:             {in_memory * 1000:8.1f} ms")
+    print(f"  BFS روی mmap:              {mapped_query * 1000:8.1f} ms")
+    print(f"  ساخت کامل درخت از mmap:    {materialize:8.2f} s")
+    print()
+
+
+def _import_sources(tree):
+    """متن ورودی سه قالب از روی یک درخت"""
+    people = tree.get_all_people()
+    ndjson = "".join(json.dumps(person, ensure_ascii=False) + "\n" for person in people)
+    rows = ["id,name,gender,birth_year,parents,children,spouse"]
+    for person in people:
+        rows.append(",".join([person["id"], person["name"], person["gender"], str(person["birth_year"]),
+                              ";".join(person["parents"]), ";".join(person["children"]),
+                              person["spouse"] or ""]))
+    return {
+        "json": json.dumps({"people": people}, ensure_ascii=False),
+        "ndjson": ndjson,
+        "csv": "\n".join(rows) + "\n",
+    }
+
+
+def benchmark_import(size=1_000_000):
+    """سرعت وارد کردن جریانی در هر سه قالب"""
+    print(f"📊 وارد کردن جریانی ({size:,} نفر)")
+    print("=" * 50)
+
+    sources = _import_sources(build_synthetic_tree(size))
+    for fmt, text in sources.items():
+        data = text.encode("utf-8")
+        tree = FamilyTree()
+        started = time.perf_counter()
+        report = tree.bulk_load(io.BytesIO(data), fmt)
+        elapsed = time.perf_counter() - started
+        assert report["error_count"] == 0 and report["people_added"] == size
+        per_minute = size / elapsed * 60
+        print(f"  {fmt:7s} {len(data) / 2 ** 20:6.0f} MB  {elapsed:7.2f} s  "
+              f"({per_minute / 1e6:.2f} میلیون نفر در دقیقه، "
+              f"{report['relationships_added']:,} رابطه)")
+        del tree
+    print()
+
+
+def benchmark_gedcom(size=1_000_000):
+    """صادرات و وارد کردن GEDCOM و حافظه خواننده جریانی"""
+    print(f"📊 GEDCOM ({size:,} نفر)")
+    print("=" * 50)
+
+    tree = build_synthetic_tree(size)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "tree.ged")
+        started = time.perf_counter()
+        with open(path, "w", encoding="utf-8") as f:
+            for chunk in tree.export_gedcom():
+                f.write(chunk)
+        elapsed = time.perf_counter() - started
+        file_size = os.path.getsize(path)
+        print(f"  صادرات:       {elapsed:7.2f} s  ({file_size / 2 ** 20:.0f} MB)")
+        del tree
+
+        # فقط خواننده، بدون ساخت درخت: حافظه نباید با اندازه فایل رشد کند
+        tracemalloc.start()
+        with open(path, "rb") as f:
+            records = sum(1 for _ in read_records(f, "gedcom"))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"  اوج حافظه خواننده: {peak / 2 ** 20:.2f} MB برای {records:,} رکورد")
+
+        tree = FamilyTree()
+        started = time.perf_counter()
+        with open(path, "rb") as f:
+            report = tree.bulk_load(f, "gedcom")
+        elapsed = time.perf_counter() - started
+        assert report["error_count"] == 0 and report["people_added"] == size
+        print(f"  وارد کردن:    {elapsed:7.2f} s  ({size / elapsed * 60 / 1e6:.2f} میلیون نفر در دقیقه، "
+              f"{report['relationships_added']:,} رابطه)")
+    print()
+
+
+def benchmark_export(size=1_000_000):
+    """زمان رسیدن اولین بایت و اوج حافظه صادرات JSON و NDJSON"""
+    print(f"📊 صادرات ({size:,} نفر)")
+    print("=" * 50)
+
+    tree = build_synthetic_tree(size)
+
+    def export_json():
+        yield json.dumps(tree.export_to_dict(), ensure_ascii=False)
+
+    for name, export in (("json", export_json), ("ndjson", tree.export_ndjson)):
+        tracemalloc.start()
+        started = time.perf_counter()
+        chunks = export()
+        first_byte = None
+        total = 0
+        for chunk in chunks:
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+            total += len(chunk)
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"  {name:7s} اولین بایت {first_byte * 1000:9.2f} ms  کل {elapsed:6.2f} s  "
+              f"اوج حافظه {peak / 2 ** 20:8.1f} MB  ({total / 2 ** 20:.0f} MB متن)")
+    print()
+
+
+def benchmark_people_page(size=500_000, limit=100):
+    """هزینه سرور و حجم پاسخ: کل افراد در برابر یک صفحه با fields=id,name"""
+    print(f"📊 صفحه‌بندی /api/people ({size:,} نفر، صفحه {limit})")
+    print("=" * 50)
+
+    tree = build_synthetic_tree(size)
+    started = time.perf_counter()
+    body = json.dumps(tree.get_all_people(), ensure_ascii=False)
+    elapsed = time.perf_counter() - started
+    print(f"  همه افراد:              {elapsed * 1000:9.1f} ms  {len(body) / 2 ** 20:7.1f} MB")
+
+    tree.add_person("bench-new", "تازه", "male")
+    for label in ("صفحه اول پس از تغییر", "صفحه بعد"):
+        started = time.perf_counter()
+        people, after = tree.people_page(None if label.startswith("صفحه اول") else "p5", limit, ["id", "name"])
+        body = json.dumps(people, ensure_ascii=False)
+        elapsed = time.perf_counter() - started
+        print(f"  {label:22s} {elapsed * 1000:9.1f} ms  {len(body) / 2 ** 10:7.1f} KB")
+    print()
+
+
+def _batch_operations(count):
+    """عملیات یک خانواده دودویی: افزودن هر فرد و اتصال به والدش"""
+    operations = []
+    for i in range(count):
+        operations.append({"op": "add_person", "id": f"b{i}", "name": "فرد",
+                           "gender": "male" if i % 2 else "female", "birth_year": 1900 + i % 100})
+        if i:
+            operations.append({"op": "add_parent_child", "parent_id": f"b{(i - 1) // 2}", "child_id": f"b{i}"})
+    return operations
+
+
+def benchmark_batch(count=2_500):
+    """توان عملیاتی /api/batch در برابر یک درخواست برای هر تغییر"""
+    import app
+
+    operations = _batch_operations(count)
+    print(f"📊 دسته تغییرات ({len(operations):,} عملیات)")
+    print("=" * 50)
+
+    client = app.app.test_client()
+    routes = {"add_person": "/api/person", "add_parent_child": "/api/relationship/parent-child"}
+    with tempfile.TemporaryDirectory() as directory:
+        for label, make_tree in (("حافظه", FamilyTree),
+                                 ("SQLite", lambda: SQLiteFamilyTree(os.path.join(directory, f"{time.time_ns()}.db")))):
+            app.family_tree = make_tree()
+            version = app.family_tree.version
+            started = time.perf_counter()
+            for operation in operations:
+                client.post(routes[operation["op"]], json=operation)
+            single = time.perf_counter() - started
+            single_versions = app.family_tree.version - version
+
+            app.family_tree = make_tree()
+            version = app.family_tree.version
+            started = time.perf_counter()
+            for first in range(0, len(operations), app.BATCH_MAX_OPERATIONS):
+                chunk = operations[first:first + app.BATCH_MAX_OPERATIONS]
+                assert client.post("/api/batch", json={"operations": chunk}).status_code == 200
+            batched = time.perf_counter() - started
+            batch_versions = app.family_tree.version - version
+
+            print(f"  {label:7s} تکی: {len(operations) / single:10,.0f} عملیات/ثانیه  ({single_versions:,} نسخه)")
+            print(f"  {label:7s} دسته: {len(operations) / batched:9,.0f} عملیات/ثانیه  ({batch_versions:,} نسخه)"
+                  f"  {single / batched:5.1f}x")
+    print()
+
+
+def benchmark_distance_matrix(size=20_000, subset=1_000, sample=200):
+    """ماتریس فاصله و نسبت همه جفت‌ها در برابر bfs_find_path برای هر جفت"""
+    print(f"📊 ماتریس فاصله ({subset:,} از {size:,} نفر)")
+    print("=" * 50)
+
+    tree = build_synthetic_tree(size)
+    ids = random.Random(3).sample(list(tree.people), subset)
+    tree.snapshot()
+    pairs = subset * subset
+
+    started = time.perf_counter()
+    for start_id, end_id in zip(ids[:sample], reversed(ids[:sample])):
+        path = tree.bfs_find_path(start_id, end_id)
+        if path is not None:
+            tree.simplify_relationship(path, tree.people[start_id])
+    per_pair = (time.perf_counter() - started) / sample
+    print(f"  bfs_find_path برای هر جفت: {1 / per_pair:12,.0f} جفت/ثانیه  (تخمین کل: {per_pair * pairs:,.0f} s)")
+
+    counts = sorted({1, os.cpu_count() or 1})
+    for workers in counts:
+        for labels in (False, True):
+            started = time.perf_counter()
+            with tree.distance_matrix(ids, workers=workers, labels=labels):
+                elapsed = time.perf_counter() - started
+            kind = "با نسبت" if labels else "فقط فاصله"
+            print(f"  {workers} پروسه، {kind:9s}: {pairs / elapsed:12,.0f} جفت/ثانیه  ({elapsed:,.1f} s)"
+                  f"  {per_pair * pairs / elapsed:6.0f}x")
+    print()
+
+
+def _random_pedigree(size, seed=1):
+    """جمعیت با ازدواج‌های تصادفی بین زوج‌های قبلی (پس با هم‌خونی)"""
+    rng = random.Random(seed)
+    tree = FamilyTree()
+    couples = []
+    for i in range(size):
+        tree.add_person(f"k{i}", f"فرد{i}", rng.choice(["male", "female"]))
+        if couples and rng.random() < 0.7:
+            father, mother = rng.choice(couples)
+            tree.add_parent_child(father, f"k{i}")
+            tree.add_parent_child(mother, f"k{i}")
+        if i > 0 and rng.random() < 0.4 and tree.people[f"k{i - 1}"].spouse is None:
+            tree.add_spouse(f"k{i - 1}", f"k{i}")
+            couples.append((f"k{i - 1}", f"k{i}"))
+    return tree
+
+
+def benchmark_kinship(size=300_000):
+    """ضریب هم‌خونی همه افراد: با numpy و بدون آن"""
+    from kinship import Pedigree, numpy
+
+    print(f"📊 ضریب هم‌خونی ({size:,} نفر)")
+    print("=" * 50)
+
+    graph = _random_pedigree(size).snapshot()
+    started = time.perf_counter()
+    pedigree = Pedigree(graph)
+    print(f"  نسل‌بندی:     {time.perf_counter() - started:8.2f} s  ({pedigree.levels} نسل)")
+
+    for vectorized in ([True, False] if numpy is not None else [False]):
+        started = time.perf_counter()
+        values = pedigree.inbreeding(range(len(graph)), vectorized)
+        elapsed = time.perf_counter() - started
+        label = "numpy" if vectorized else "پایتون"
+        print(f"  {label:7s} {elapsed:10.2f} s  ({sum(1 for value in values if value > 0):,} فرد هم‌خون)")
+    print()
+
+
+def benchmark_layout(size=100_000, edges=10_000):
+    """چیدمان لایه‌ای سمت سرور: ساخت کامل و به‌روزرسانی افزایشی نسل‌ها"""
+    print(f"📊 چیدمان لایه‌ای ({size:,} نفر)")
+    print("=" * 50)
+
+    tree = build_synthetic_tree(size)
+    tree.remove_person(f"p{size - 1}")
+    started = time.perf_counter()
+    tree.generation("p0")
+    print(f"  بازسازی نسل‌ها پس از حذف: {time.perf_counter() - started:8.3f} s")
+
+    started = time.perf_counter()
+    nodes = tree.layout()
+    elapsed = time.perf_counter() - started
+    rows = 1 + max(node["generation"] for node in nodes)
+    print(f"  layout (کامل):            {elapsed:8.3f} s  ({rows} نسل)")
+
+    started = time.perf_counter()
+    tree.layout()
+    print(f"  layout (از کش):           {(time.perf_counter() - started) * 1e6:8.2f} µs")
+
+    started = time.perf_counter()
+    body = json.dumps({"success": True, "data": {"nodes": nodes}}, ensure_ascii=False)
+    print(f"  JSON پاسخ:                {time.perf_counter() - started:8.3f} s  ({len(body) / 1e6:.1f} MB)")
+
+    # هر فرد تازه فرزند یک فرد تصادفی است؛ فقط نسل او محاسبه می‌شود
+    rng = random.Random(3)
+    ids = list(tree.people)
+    started = time.perf_counter()
+    for i in range(edges):
+        tree.add_person(f"n{i}", f"فرد{i}", "male")
+        tree.add_parent_child(rng.choice(ids), f"n{i}")
+    elapsed = time.perf_counter() - started
+    print(f"  افزودن فرزند (افزایشی):   {elapsed * 1e6 / edges:8.2f} µs/یال")
+    print()
+
+
+BENCHMARKS = {
+    "bfs": benchmark_bfs,
+    "snapshot": benchmark_snapshot,
+    "person-memory": benchmark_person_memory,
+    "edges": benchmark_edge_insertion,
+    "ancestry": benchmark_ancestry,
+    "relationship-map": benchmark_relationship_map,
+    "journal": benchmark_journal,
+    "binary-snapshot": benchmark_binary_snapshot,
+    "import": benchmark_import,
+    "gedcom": benchmark_gedcom,
+    "export": benchmark_export,
+    "people-page": benchmark_people_page,
+    "batch": benchmark_batch,
+    "distance-matrix": benchmark_distance_matrix,
+    "kinship": benchmark_kinship,
+    "layout": benchmark_layout,
+}
+
+
+if __name__ == "__main__":
+    selected = sys.argv[1:] or list(BENCHMARKS)
+    for name in selected:
+        BENCHMARKS[name]()
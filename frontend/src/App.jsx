@@ -9,6 +9,7 @@ const API_BASE_URL = 'https://family-tree-builder-1.onrender.com/api';
 
 function App() {
   const [people, setPeople] = useState([]);
+  const [layout, setLayout] = useState(null);
   const [loading, setLoading] = useState(false);
   const [notification, setNotification] = useState(null);
 
@@ -16,13 +17,28 @@ function App() {
     fetchPeople();
   }, []);
 
+  const fetchLayout = async () => {
+    // خطای چیدمان لیست افراد را از کار نمی‌اندازد؛ null یعنی چیدمان سمت کلاینت
+    try {
+      const response = await fetch(`${API_BASE_URL}/layout`);
+      const data = await response.json();
+      return data.success ? data.data.nodes : null;
+    } catch (error) {
+      return null;
+    }
+  };
+
   const fetchPeople = async () => {
     try {
       setLoading(true);
+      // مختصات گره‌ها را سرور حساب می‌کند؛ هر دو درخواست هم‌زمان
+      const layoutRequest = fetchLayout();
       const response = await fetch(`${API_BASE_URL}/people`);
       const data = await response.json();
+      const nodes = await layoutRequest;
       if (data.success) {
         setPeople(data.data);
+        setLayout(nodes);
       }
     } catch (error) {
       showNotification('خطا در دریافت اطلاعات: ' + error.message, 'error');
@@ -155,6 +171,7 @@ function App() {
         <div className="right-panel">
           <FamilyTreeVisualization 
             people={people}
+            layout={layout}
             loading={loading}
           />
         </div>
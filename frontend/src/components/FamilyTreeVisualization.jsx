@@ -31,7 +31,7 @@ function PersonNode({ data }) {
   );
 }
 
-function FamilyTreeVisualization({ people, loading }) {
+function FamilyTreeVisualization({ people, layout, loading }) {
   const [nodes, setNodes, onNodesChange] = useNodesState([]);
   const [edges, setEdges, onEdgesChange] = useEdgesState([]);
 
@@ -42,20 +42,38 @@ function FamilyTreeVisualization({ people, loading }) {
       return;
     }
 
-    // ایجاد نودها
-    const newNodes = generateNodes(people);
+    // ایجاد نودها در مختصاتی که سرور حساب کرده (GET /api/layout)؛ اگر چیدمان
+    // نرسیده یا همه افراد را ندارد، همان چیدمان نسلی سمت کلاینت
+    const serverPositions = layout && new Map(layout.map(({ id, x, y }) => [id, { x, y }]));
+    const positions = serverPositions && people.every(person => serverPositions.has(person.id))
+      ? serverPositions
+      : calculatePositions(people);
+    const newNodes = generateNodes(people, positions);
     const newEdges = generateEdges(people);
 
     setNodes(newNodes);
     setEdges(newEdges);
-  }, [people]);
+  }, [people, layout]);
 
-  const generateNodes = (people) => {
+  const generateNodes = (people, positions) => {
+    return people.map(person => ({
+      id: person.id,
+      type: 'person',
+      position: positions.get(person.id),
+      data: {
+        name: person.name,
+        id: person.id,
+        gender: person.gender,
+        birth_year: person.birth_year,
+      },
+    }));
+  };
+
+  const calculatePositions = (people) => {
     // گروه‌بندی افراد بر اساس نسل (عمق در درخت)
     const generations = calculateGenerations(people);
     const nodesPerGeneration = {};
 
-    // شمارش تعداد افراد در هر نسل
     people.forEach(person => {
       const gen = generations[person.id];
       if (!nodesPerGeneration[gen]) {
@@ -64,7 +82,7 @@ function FamilyTreeVisualization({ people, loading }) {
       nodesPerGeneration[gen].push(person);
     });
 
-    const nodes = [];
+    const positions = new Map();
     const verticalSpacing = 200;
     const horizontalSpacing = 250;
 
@@ -74,29 +92,20 @@ function FamilyTreeVisualization({ people, loading }) {
       const startX = -totalWidth / 2;
 
       personsInGen.forEach((person, index) => {
-        nodes.push({
-          id: person.id,
-          type: 'person',
-          position: {
-            x: startX + index * horizontalSpacing,
-            y: genIndex * verticalSpacing,
-          },
-          data: {
-            name: person.name,
-            id: person.id,
-            gender: person.gender,
-            birth_year: person.birth_year,
-          },
+        positions.set(person.id, {
+          x: startX + index * horizontalSpacing,
+          y: genIndex * verticalSpacing,
         });
       });
     });
 
-    return nodes;
+    return positions;
   };
 
   const calculateGenerations = (people) => {
     const generations = {};
     const visited = new Set();
+    const peopleById = new Map(people.map(person => [person.id, person]));
 
     // پیدا کردن ریشه‌های درخت (افرادی که والد ندارند)
     const roots = people.filter(p => !p.parents || p.parents.length === 0);
@@ -112,7 +121,7 @@ function FamilyTreeVisualization({ people, loading }) {
 
       generations[personId] = generation;
 
-      const person = people.find(p => p.id === personId);
+      const person = peopleById.get(personId);
       if (!person) return;
 
       // فرزندان
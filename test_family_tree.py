@@ -2,8 +2,9 @@
 اسکریپت تست برای بررسی عملکرد صحیح سیستم شجره‌نامه
 """
 
+import os
 import sys
-sys.path.insert(0, '/home/claude/backend')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
 
 from family_tree import FamilyTree, Gender
 
@@ -208,6 +209,1651 @@ def test_bfs_vs_dfs():
     print("\n✅ تست 4 موفق!\n")
 
 
+def _reference_bfs_path(tree, start_id, end_id):
+    """BFS یک‌طرفه ساده برای مقایسه"""
+    from collections import deque
+    start = tree.people[start_id]
+    previous = {start: None}
+    queue = deque([start])
+    while queue:
+        current = queue.popleft()
+        if current.id == end_id:
+            break
+        neighbours = [(p, "والد") for p in current.parents]
+        neighbours += [(c, "فرزند") for c in current.children]
+        if current.spouse:
+            neighbours.append((current.spouse, "همسر"))
+        for relative, relation in neighbours:
+            if relative not in previous:
+                previous[relative] = (current, relation)
+                queue.append(relative)
+    target = tree.people[end_id]
+    if target not in previous:
+        return None
+    path = []
+    while previous[target] is not None:
+        prev, relation = previous[target]
+        path.append((target, relation))
+        target = prev
+    path.append((start, "شروع"))
+    return path[::-1]
+
+
+def _random_tree(size, seed):
+    """ساخت یک درخت تصادفی چند نسلی"""
+    import random
+    rng = random.Random(seed)
+    tree = FamilyTree()
+    couples = []
+    for i in range(size):
+        tree.add_person(f"r{i}", f"فرد{i}", rng.choice(["male", "female"]))
+        if couples and rng.random() < 0.7:
+            father, mother = rng.choice(couples)
+            tree.add_parent_child(father, f"r{i}")
+            tree.add_parent_child(mother, f"r{i}")
+        if i > 0 and rng.random() < 0.4 and tree.people[f"r{i - 1}"].spouse is None:
+            tree.add_spouse(f"r{i - 1}", f"r{i}")
+            couples.append((f"r{i - 1}", f"r{i}"))
+    return tree
+
+
+def test_bidirectional_bfs():
+    """BFS دوطرفه همان کوتاه‌ترین مسیر BFS یک‌طرفه را برمی‌گرداند"""
+    print("🧪 تست 5: BFS دوطرفه")
+    print("=" * 50)
+    
+    import random
+    tree = _random_tree(400, seed=7)
+    rng = random.Random(11)
+    ids = list(tree.people)
+    
+    for _ in range(300):
+        start_id, end_id = rng.choice(ids), rng.choice(ids)
+        path = tree.bfs_find_path(start_id, end_id)
+        expected = _reference_bfs_path(tree, start_id, end_id)
+        if start_id == end_id:
+            continue
+        if expected is None:
+            assert path is None, "خطا: مسیری نباید پیدا شود"
+            continue
+        got = [(p.id, r) for p, r in path]
+        want = [(p.id, r) for p, r in expected]
+        assert got == want, f"خطا: انتظار {want} ولی {got} دریافت شد"
+    
+    print("  ✅ موفق")
+    print("\n✅ تست 5 موفق!\n")
+
+
+def _reference_dfs_path(tree, start_id, end_id):
+    """DFS بازگشتی ساده برای مقایسه"""
+    visited = set()
+
+    def visit(current, path):
+        if current.id in visited:
+            return None
+        visited.add(current.id)
+        if current.id == end_id:
+            return path
+        neighbours = [(p, "والد") for p in current.parents]
+        neighbours += [(c, "فرزند") for c in current.children]
+        if current.spouse:
+            neighbours.append((current.spouse, "همسر"))
+        for relative, relation in neighbours:
+            result = visit(relative, path + [(relative, relation)])
+            if result:
+                return result
+        return None
+
+    start = tree.people[start_id]
+    return visit(start, [(start, "شروع")])
+
+
+def test_iterative_dfs():
+    """DFS تکراری همان مسیر DFS بازگشتی را می‌دهد و در زنجیره‌های عمیق از کار نمی‌افتد"""
+    print("🧪 تست 6: DFS تکراری")
+    print("=" * 50)
+    
+    import random
+    tree = _random_tree(300, seed=3)
+    rng = random.Random(5)
+    ids = list(tree.people)
+    
+    for _ in range(200):
+        start_id, end_id = rng.choice(ids), rng.choice(ids)
+        if start_id == end_id:
+            continue
+        path = tree.dfs_find_path(start_id, end_id)
+        expected = _reference_dfs_path(tree, start_id, end_id)
+        if expected is None:
+            assert path is None, "خطا: مسیری نباید پیدا شود"
+            continue
+        got = [(p.id, r) for p, r in path]
+        want = [(p.id, r) for p, r in expected]
+        assert got == want, f"خطا: انتظار {want} ولی {got} دریافت شد"
+    
+    # زنجیره اجدادی طولانی‌تر از محدودیت بازگشت پایتون
+    depth = sys.getrecursionlimit() * 3
+    chain = FamilyTree()
+    chain.add_person("a0", "جد", "male")
+    for i in range(1, depth):
+        chain.add_person(f"a{i}", f"نسل{i}", "male")
+        chain.add_parent_child(f"a{i - 1}", f"a{i}")
+    
+    print(f"\n📍 مسیر در زنجیره {depth} نسلی:")
+    path = chain.dfs_find_path(f"a{depth - 1}", "a0")
+    assert path is not None and len(path) == depth, "خطا: مسیر کامل پیدا نشد"
+    print(f"  طول مسیر DFS: {len(path) - 1}")
+    print("  ✅ موفق")
+    print("\n✅ تست 6 موفق!\n")
+
+
+def test_graph_snapshot():
+    """تصویر CSR پس از هر تغییر دوباره ساخته می‌شود"""
+    print("🧪 تست 7: تصویر CSR")
+    print("=" * 50)
+    
+    tree = FamilyTree()
+    tree.add_person("f", "پدر", "male")
+    tree.add_person("m", "مادر", "female")
+    tree.add_person("c", "فرزند", "female")
+    tree.add_spouse("f", "m")
+    tree.add_parent_child("f", "c")
+    
+    graph = tree.snapshot()
+    assert tree.snapshot() is graph, "خطا: تصویر بدون تغییر نباید دوباره ساخته شود"
+    assert len(graph) == 3 and graph.edge_count == 4
+    assert tree.bfs_find_path("c", "m")[-1][1] == "همسر"
+    
+    tree.add_parent_child("m", "c")
+    assert tree.snapshot() is not graph, "خطا: تصویر پس از تغییر باید نامعتبر شود"
+    assert [r for _, r in tree.bfs_find_path("c", "m")] == ["شروع", "والد"]
+    
+    tree.add_person("x", "غریبه", "male")
+    assert len(tree.snapshot().connected_components()) == 2
+    tree.remove_person("x")
+    assert len(tree.snapshot().connected_components()) == 1
+    
+    print("  ✅ موفق")
+    print("\n✅ تست 7 موفق!\n")
+
+
+def test_compact_person():
+    """Person فشرده بدون __dict__ و با تاپل مشترک برای افراد بدون رابطه"""
+    print("🧪 تست 8: Person فشرده")
+    print("=" * 50)
+    
+    tree = FamilyTree()
+    parent = tree.add_person("p", "والد", "female", 1960)
+    child = tree.add_person("c", "فرزند", "male", 1990)
+    assert not hasattr(parent, "__dict__"), "خطا: Person نباید __dict__ داشته باشد"
+    assert parent.children is child.children, "خطا: ظرف خالی باید مشترک باشد"
+    
+    tree.add_parent_child("p", "c")
+    assert child.to_dict() == {
+        "id": "c", "name": "فرزند", "gender": "male", "birth_year": 1990,
+        "parents": ["p"], "children": [], "spouse": None
+    }
+    
+    tree.remove_person("c")
+    assert parent.children == () and parent.to_dict()["children"] == []
+    
+    # فرزندان زیاد: ظرف به دیکشنری تبدیل می‌شود ولی ترتیب درج حفظ می‌شود
+    tree.add_person("c", "فرزند", "male", 1990)
+    for i in range(40):
+        tree.add_person(f"k{i}", f"نوه{i}", "female")
+        tree.add_parent_child("c", f"k{i}")
+        tree.add_parent_child("c", f"k{i}")
+    tree.remove_person("k3")
+    expected = [f"k{i}" for i in range(40) if i != 3]
+    assert tree.people["c"].to_dict()["children"] == expected, "خطا: ترتیب فرزندان حفظ نشده"
+    
+    print("  ✅ موفق")
+    print("\n✅ تست 8 موفق!\n")
+
+
+def _brute_force_ancestors(person):
+    """اجداد یک فرد با پیمایش مستقیم والدین"""
+    found = set()
+    stack = list(person.parents)
+    while stack:
+        current = stack.pop()
+        if current.id not in found:
+            found.add(current.id)
+            stack.extend(current.parents)
+    return found
+
+
+def test_ancestor_index():
+    """شاخص اجداد با پیمایش مستقیم والدین هم‌خوانی دارد"""
+    print("🧪 تست 9: شاخص اجداد و جد مشترک")
+    print("=" * 50)
+    
+    tree = FamilyTree()
+    tree.add_person("gf", "پدربزرگ", "male")
+    tree.add_person("gm", "مادربزرگ", "female")
+    tree.add_person("f", "پدر", "male")
+    tree.add_person("u", "عمو", "male")
+    tree.add_person("c1", "فرزند", "male")
+    tree.add_person("c2", "پسرعمو", "male")
+    for parent, child in [("gf", "f"), ("gm", "f"), ("gf", "u"), ("gm", "u"), ("f", "c1"), ("u", "c2")]:
+        tree.add_parent_child(parent, child)
+    
+    slots = dict(tree._ancestry._slot)
+    assert tree.is_ancestor("gf", "c1") and not tree.is_ancestor("c1", "gf")
+    assert not tree.is_ancestor("c1", "c1")
+    assert {p.id for p in tree.common_ancestors("c1", "c2")} == {"gf", "gm"}
+    assert [p.id for p in tree.common_ancestors("f", "c1")] == ["f"]
+    assert [p.id for p in tree.common_ancestors("c1", "c1")] == ["c1"]
+    assert [p.id for p in tree.common_ancestors("c1", "c1", closest_only=False)] == ["gf", "gm", "f", "c1"]
+    # پرس‌وجوها زیر قفل خواندن شاخص را تغییر نمی‌دهند
+    assert tree._ancestry._slot == slots
+    
+    # فرد والد خودش نمی‌شود و شاخص دست نمی‌خورد
+    version = tree.version
+    try:
+        tree.add_parent_child("c1", "c1")
+        assert False, "خطا: رابطه والد-فرزند با خود باید رد شود"
+    except ValueError:
+        pass
+    assert not tree.is_ancestor("c1", "c1") and not tree.people["c1"].children
+    assert tree.version == version
+    
+    import random
+    tree = _random_tree(300, seed=9)
+    rng = random.Random(4)
+    ids = list(tree.people)
+    for step in range(3):
+        for person_id in ids:
+            expected = _brute_force_ancestors(tree.people[person_id])
+            for other_id in rng.sample(ids, 10) + list(expected):
+                assert tree.is_ancestor(other_id, person_id) == (other_id in expected), \
+                    f"خطا در is_ancestor({other_id}, {person_id})"
+        # تغییرات افزایشی و حذف
+        tree.remove_person(ids.pop(rng.randrange(len(ids))))
+        tree.add_person(f"n{step}", "جدید", "male")
+        tree.add_parent_child(f"n{step}", ids[0])
+        ids.append(f"n{step}")
+    
+    print("  ✅ موفق")
+    print("\n✅ تست 9 موفق!\n")
+
+
+def test_relationship_cache():
+    """کش LRU با تغییر نسخه درخت خالی می‌شود و ظرفیت را رعایت می‌کند"""
+    print("🧪 تست 10: کش نتایج نسبت")
+    print("=" * 50)
+    
+    from query_cache import RelationshipCache
+    
+    tree = FamilyTree()
+    version = tree.version
+    tree.add_person("a", "الف", "male")
+    tree.add_person("b", "ب", "female")
+    tree.add_spouse("a", "b")
+    assert tree.version == version + 3, "خطا: هر تغییر باید نسخه را افزایش دهد"
+    tree.remove_person("missing")
+    assert tree.version == version + 3, "خطا: حذف ناموفق نباید نسخه را تغییر دهد"
+    
+    cache = RelationshipCache(capacity=2)
+    cache.put(("bfs", "a", "b"), tree.version, "همسر")
+    cache.put(("bfs", "b", "a"), tree.version, "شوهر")
+    assert cache.get(("bfs", "a", "b"), tree.version) == "همسر"
+    cache.put(("dfs", "a", "b"), tree.version, "همسر")
+    assert cache.get(("bfs", "b", "a"), tree.version) is None, "خطا: قدیمی‌ترین مورد باید بیرون برود"
+    assert cache.evictions == 1
+    
+    tree.add_person("c", "ج", "male")
+    assert cache.get(("bfs", "a", "b"), tree.version) is None, "خطا: نتیجه کهنه نباید برگردد"
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (1, 2, 0)
+    
+    print("  ✅ موفق")
+    print("\n✅ تست 10 موفق!\n")
+
+
+def test_bfs_find_paths():
+    """یک پیمایش برای چند مقصد همان مسیرهای bfs_find_path را می‌دهد"""
+    print("🧪 تست 11: مسیرهای چندمقصدی")
+    print("=" * 50)
+    
+    tree = _random_tree(300, seed=21)
+    ids = list(tree.people)
+    for start_id in ids[:: 15]:
+        targets = ids[::7] + [start_id, "missing"]
+        paths = tree.bfs_find_paths(start_id, targets)
+        assert paths["missing"] is None
+        for end_id in ids[::7] + [start_id]:
+            expected = tree.bfs_find_path(start_id, end_id)
+            got = paths[end_id]
+            if expected is None:
+                assert got is None, "خطا: مسیری نباید پیدا شود"
+            else:
+                assert [(p.id, r) for p, r in got] == [(p.id, r) for p, r in expected], \
+                    f"خطا: مسیر {start_id} به {end_id} متفاوت است"
+    
+    assert all(path is None for path in tree.bfs_find_paths("missing", ids[:3]).values())
+    
+    print("  ✅ موفق")
+    print("\n✅ تست 11 موفق!\n")
+
+
+def test_relationship_map():
+    """نسبت همه افراد با یک پیمایش برابر با پرس‌وجوی تک‌تک جفت‌هاست"""
+    print("🧪 تست 12: نقشه نسبت‌ها از یک فرد")
+    print("=" * 50)
+    
+    tree = _random_tree(250, seed=17)
+    for source_id in list(tree.people)[::25]:
+        source = tree.people[source_id]
+        mapping = tree.relationship_map(source_id)
+        reachable = set()
+        for person, distance, label in mapping:
+            path = tree.bfs_find_path(source_id, person.id)
+            assert distance == len(path) - 1
+            assert label == tree.simplify_relationship(path, source), f"خطا: نسبت {person.id} متفاوت است"
+            reachable.add(person.id)
+        for other_id in tree.people:
+            if other_id != source_id and other_id not in reachable:
+                assert tree.bfs_find_path(source_id, other_id) is None
+    
+    print("  ✅ موفق")
+    print("\n✅ تست 12 موفق!\n")
+
+
+def test_persian_relation_classifier():
+    """طبقه‌بند جدول‌محور نسبت‌های عمیق و سببی را نام می‌برد"""
+    print("🧪 تست 13: طبقه‌بند نسبت‌های فارسی")
+    print("=" * 50)
+    
+    tree = FamilyTree()
+    people = [
+        ("ggf", "جد", Gender.MALE), ("gf", "پدربزرگ", Gender.MALE),
+        ("gf_bro", "برادر پدربزرگ", Gender.MALE), ("father", "پدر", Gender.MALE),
+        ("uncle", "عمو", Gender.MALE), ("uncle_wife", "زن عمو", Gender.FEMALE),
+        ("cousin", "پسرعمو", Gender.MALE), ("second", "نوه برادر پدربزرگ", Gender.MALE),
+        ("gf_bro_son", "پسر برادر پدربزرگ", Gender.MALE),
+        ("me", "خود", Gender.MALE), ("wife", "همسر", Gender.FEMALE),
+        ("brother", "برادر", Gender.MALE), ("brother_wife", "زن برادر", Gender.FEMALE),
+        ("nephew", "برادرزاده", Gender.MALE), ("grand_nephew", "نوه برادر", Gender.FEMALE),
+        ("wife_father", "پدرزن", Gender.MALE), ("wife_uncle", "عموی زن", Gender.MALE),
+        ("wife_sister", "خواهرزن", Gender.FEMALE), ("wife_sister_husband", "باجناق", Gender.MALE),
+        ("son", "پسر", Gender.MALE), ("grandson", "نوه", Gender.MALE),
+        ("great_grandson", "نتیجه", Gender.MALE), ("wife_gf", "پدربزرگ زن", Gender.MALE),
+    ]
+    for person_id, name, gender in people:
+        tree.add_person(person_id, name, gender)
+    for parent, child in [("ggf", "gf"), ("ggf", "gf_bro"), ("gf", "father"), ("gf", "uncle"),
+                          ("uncle", "cousin"), ("gf_bro", "gf_bro_son"), ("gf_bro_son", "second"),
+                          ("father", "me"), ("father", "brother"), ("brother", "nephew"),
+                          ("nephew", "grand_nephew"), ("wife_gf", "wife_father"),
+                          ("wife_gf", "wife_uncle"), ("wife_father", "wife"),
+                          ("wife_father", "wife_sister"), ("me", "son"), ("son", "grandson"),
+                          ("grandson", "great_grandson")]:
+        tree.add_parent_child(parent, child)
+    tree.add_spouse("uncle", "uncle_wife")
+    tree.add_spouse("me", "wife")
+    tree.add_spouse("brother", "brother_wife")
+    tree.add_spouse("wife_sister", "wife_sister_husband")
+    
+    expected = {
+        "ggf": "پدر پدربزرگ",
+        "gf_bro": "برادر پدربزرگ",
+        "gf_bro_son": "پسر برادر پدربزرگ",
+        "second": "نوه برادر پدربزرگ",
+        "cousin": "پسر عمو",
+        "uncle_wife": "زن عمو",
+        "brother_wife": "زن برادر",
+        "nephew": "پسر برادر",
+        "grand_nephew": "نوه برادر",
+        "wife_father": "پدر همسر",
+        "wife_uncle": "عموی همسر",
+        "wife_gf": "پدربزرگ همسر",
+        "wife_sister": "خواهر زن",
+        "wife_sister_husband": "باجناق",
+        "grandson": "نوه پسر",
+        "great_grandson": "نتیجه پسر",
+    }
+    mapping = {person.id: label for person, _, label in tree.relationship_map("me")}
+    for person_id, label in expected.items():
+        path = tree.bfs_find_path("me", person_id)
+        simplified = tree.simplify_relationship(path, tree.people["me"])
+        print(f"  {person_id}: {simplified}")
+        assert simplified == label, f"خطا: نسبت {person_id} باید «{label}» باشد نه «{simplified}»"
+        assert mapping[person_id] == label
+    
+    # از دید زن برادر، همسر برادر شوهر «جاری» است
+    tree.add_person("brother2", "برادر دوم", Gender.MALE)
+    tree.add_person("brother2_wife", "جاری", Gender.FEMALE)
+    tree.add_parent_child("father", "brother2")
+    tree.add_spouse("brother2", "brother2_wife")
+    path = tree.bfs_find_path("brother_wife", "brother2_wife")
+    assert tree.simplify_relationship(path, tree.people["brother_wife"]) == "جاری"
+    
+    # مسیری که به خود فرد برمی‌گردد
+    me = tree.people["me"]
+    loop = [(me, "شروع"), (tree.people["wife"], "همسر"), (me, "همسر")]
+    assert tree.simplify_relationship(loop, me) == "خود"
+    
+    print("  ✅ موفق")
+    print("\n✅ تست 13 موفق!\n")
+
+
+def test_sqlite_store():
+    """دو نمونه روی یک پایگاه داده (مثل دو worker) داده یکسان می‌بینند"""
+    import tempfile
+    from tree_store import SQLiteFamilyTree
+    
+    print("🧪 تست 14: ذخیره‌سازی SQLite مشترک")
+    print("=" * 50)
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "tree.db")
+        first = SQLiteFamilyTree(path)
+        second = SQLiteFamilyTree(path)
+        
+        first.add_person("f", "پدر", "male")
+        first.add_person("m", "مادر", "female")
+        first.add_person("c", "فرزند", "male")
+        first.add_spouse("f", "m")
+        first.add_parent_child("f", "c")
+        first.add_parent_child("m", "c")
+        
+        assert second.sync(), "خطا: تغییرات worker دیگر دیده نشد"
+        assert not second.sync(), "خطا: بدون تغییر نباید دوباره بارگذاری شود"
+        assert second.version == first.version
+        assert second.export_to_dict() == first.export_to_dict()
+        print("  ✅ همگام‌سازی بین دو اتصال")
+        
+        # نوشتن از نمونه دوم روی داده تازه اعتبارسنجی می‌شود
+        second.add_person("g", "نوه", "female")
+        second.add_parent_child("c", "g")
+        try:
+            first.add_parent_child("c", "missing")
+            assert False, "خطا: رابطه با فرد ناموجود نباید ذخیره شود"
+        except ValueError:
+            pass
+        assert "g" in first.people and first.version == second.version
+        assert first.remove_person("m")
+        assert not first.remove_person("m")
+        
+        first.sync()
+        second.sync()
+        assert second.export_to_dict() == first.export_to_dict()
+        assert second.simplify_relationship(second.bfs_find_path("g", "f"), second.people["g"]) == "پدربزرگ"
+        print("  ✅ نوشتن از هر دو اتصال")
+        
+        # تغییرات worker دیگر از جدول changes اجرا می‌شوند، بدون بارگذاری کامل
+        people = second.people
+        first.apply_batch([["add_person", "b1", "ب", "male"], ["add_parent_child", "g", "b1"],
+                           ["add_person", "b2", "ب", "female"]])
+        first.add_spouse("b1", "b2")
+        assert second.sync() and second.people is people, "خطا: همگام‌سازی باید افزایشی باشد"
+        assert second.export_to_dict() == first.export_to_dict() and second.version == first.version
+        assert second.is_ancestor("c", "b1")
+        
+        # تغییراتی که از جدول بیرون رفته‌اند بارگذاری کامل می‌خواهند
+        first.changes.resize(2)
+        for i in range(5):
+            first.add_person(f"x{i}", "ایکس", "male")
+        assert second.sync() and second.people is not people
+        assert second.export_to_dict() == first.export_to_dict() and second.version == first.version
+        print("  ✅ همگام‌سازی افزایشی و بارگذاری کامل پس از شکاف")
+        
+        expected = first.export_to_dict()
+        version = first.version
+        first.close()
+        second.close()
+        
+        # داده پس از راه‌اندازی دوباره باقی می‌ماند
+        reopened = SQLiteFamilyTree(path)
+        assert reopened.export_to_dict() == expected
+        assert reopened.version == version
+        assert reopened.people["f"].spouse is None
+        reopened.clear()
+        assert not reopened.people
+        reopened.close()
+        reopened = SQLiteFamilyTree(path)
+        assert not reopened.people
+        reopened.close()
+        print("  ✅ پایداری پس از راه‌اندازی دوباره")
+    
+    print("\n✅ تست 14 موفق!\n")
+
+
+def test_mutation_journal():
+    """بازیابی از تصویر و دنباله ژورنال همان درخت و نسخه را می‌سازد"""
+    import tempfile
+    import journal as journal_module
+    from journal import MutationJournal
+    
+    print("🧪 تست 15: ژورنال تغییرات و تصویر دوره‌ای")
+    print("=" * 50)
+    
+    with tempfile.TemporaryDirectory() as directory:
+        tree = FamilyTree()
+        journal = MutationJournal(directory, snapshot_every=50)
+        assert journal.attach(tree) == 0
+        
+        for i in range(40):
+            tree.add_person(f"p{i}", f"فرد {i}", "male" if i % 2 else "female", 1900 + i)
+        for i in range(2, 40):
+            tree.add_parent_child(f"p{(i - 2) // 2}", f"p{i}")
+        tree.add_spouse("p0", "p1")
+        tree.remove_person("p7")
+        tree.add_parent_child("p3", "p8")
+        # close منتظر تصویر پس‌زمینه (پس از 50 رکورد) می‌ماند
+        journal.close()
+        
+        assert os.path.exists(journal.snapshot_path), "خطا: تصویر دوره‌ای نوشته نشد"
+        
+        recovered = FamilyTree()
+        replayed = MutationJournal(directory).attach(recovered)
+        assert replayed < 50, "خطا: فقط دنباله ژورنال باید اجرا شود"
+        assert recovered.export_to_dict() == tree.export_to_dict()
+        assert recovered.version == tree.version
+        assert recovered.changes_since(recovered.version) == [], "خطا: فید پس از بازیابی باید از همین نسخه ادامه دهد"
+        for start_id, end_id in [("p20", "p0"), ("p30", "p12"), ("p8", "p9")]:
+            expected = [(p.id, r) for p, r in tree.bfs_find_path(start_id, end_id)]
+            assert [(p.id, r) for p, r in recovered.bfs_find_path(start_id, end_id)] == expected
+        
+        # تغییری که هنگام نوشتن تصویر می‌رسد (تصویر بدون قفل درخت نوشته می‌شود)
+        # و تغییرات بعدی در ژورنال می‌مانند
+        tree = recovered
+        journal = MutationJournal(directory)
+        journal.attach(tree)
+        write_snapshot_data = journal_module._write_snapshot_data
+        
+        def write_during_change(data, path):
+            tree.add_person("during", "هم‌زمان", "female")
+            write_snapshot_data(data, path)
+        
+        journal_module._write_snapshot_data = write_during_change
+        try:
+            journal.compact()
+        finally:
+            journal_module._write_snapshot_data = write_snapshot_data
+        tree.add_person("late", "دیررس", "male")
+        tree.add_parent_child("p3", "late")
+        journal.close()
+        
+        recovered = FamilyTree()
+        replayed = MutationJournal(directory).attach(recovered)
+        assert replayed == 3, "خطا: رکوردهای بعد از کپی تصویر باید در ژورنال بمانند"
+        assert recovered.export_to_dict() == tree.export_to_dict()
+        print(f"  ✅ بازیابی با {replayed} رکورد از ژورنال")
+        
+        # خط ناقص انتهای ژورنال (کرش حین نوشتن) نادیده گرفته و بریده می‌شود
+        with open(journal.journal_path, "ab") as f:
+            f.write('[999,"add_person","x"'.encode("utf-8"))
+        again = FamilyTree()
+        assert MutationJournal(directory).attach(again) == replayed
+        assert again.export_to_dict() == tree.export_to_dict()
+        with open(journal.journal_path, "rb") as f:
+            assert f.read().endswith(b"\n")
+        print("  ✅ نادیده گرفتن رکورد ناقص")
+    
+    print("\n✅ تست 15 موفق!\n")
+
+
+def test_binary_snapshot():
+    """پرس‌وجو روی تصویر دودویی mmap همان نتایج درخت حافظه‌ای را می‌دهد"""
+    import tempfile
+    from binary_snapshot import MappedFamilyTree, save_binary_snapshot
+    
+    print("🧪 تست 16: تصویر دودویی mmap")
+    print("=" * 50)
+    
+    tree = _random_tree(300, seed=5)
+    tree.add_person("فرد-ب", "بی‌تاریخ", "female")
+    ids = list(tree.people)
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "tree.bin")
+        save_binary_snapshot(tree, path)
+        mapped = MappedFamilyTree(path)
+        
+        assert mapped.version == tree.version and len(mapped.people) == len(tree.people)
+        assert "فرد-ب" in mapped.people and "missing" not in mapped.people
+        assert mapped.people["فرد-ب"].birth_year is None
+        assert mapped.get_all_people() == tree.get_all_people()
+        
+        for start_id in ids[::20]:
+            for end_id in ids[::23]:
+                expected = tree.bfs_find_path(start_id, end_id)
+                got = mapped.bfs_find_path(start_id, end_id)
+                if expected is None:
+                    assert got is None
+                    continue
+                assert [(p.id, r) for p, r in got] == [(p.id, r) for p, r in expected]
+                assert mapped.simplify_relationship(got, mapped.people[start_id]) == \
+                    tree.simplify_relationship(expected, tree.people[start_id])
+            assert [(p.id, d, l) for p, d, l in mapped.relationship_map(start_id)] == \
+                [(p.id, d, l) for p, d, l in tree.relationship_map(start_id)]
+        assert not mapped.materialized, "خطا: پرس‌وجوی مسیر نباید کل درخت را بسازد"
+        print("  ✅ پرس‌وجو بدون ساخت درخت")
+        
+        # اولین تغییر درخت را به ساختار معمولی تبدیل می‌کند
+        mapped.add_person("new", "جدید", "male")
+        mapped.add_parent_child(ids[0], "new")
+        tree.add_person("new", "جدید", "male")
+        tree.add_parent_child(ids[0], "new")
+        assert mapped.materialized
+        assert mapped.export_to_dict() == tree.export_to_dict()
+        assert mapped.is_ancestor(ids[0], "new")
+        print("  ✅ تبدیل به درخت قابل تغییر")
+        
+        with open(path, "r+b") as f:
+            f.write(b"NOTASNAP")
+        try:
+            MappedFamilyTree(path)
+            assert False, "خطا: فایل نامعتبر باید رد شود"
+        except ValueError:
+            pass
+    
+    print("\n✅ تست 16 موفق!\n")
+
+
+def test_bulk_load():
+    """وارد کردن جریانی با ارجاع جلورو و گزارش خطای هر رکورد"""
+    import io
+    import json
+    import tempfile
+    from tree_store import SQLiteFamilyTree
+    
+    print("🧪 تست 17: وارد کردن جریانی JSON/NDJSON/CSV")
+    print("=" * 50)
+    
+    sample_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sample_family.json")
+    with open(sample_path, "rb") as f:
+        sample = f.read()
+    with open(sample_path, encoding="utf-8") as f:
+        expected = json.load(f)["people"]
+    
+    # تکه‌های کوچک مرز رکوردها، رشته‌ها و اعداد را جابه‌جا قطع می‌کنند
+    for chunk_size in (7, 64, 1 << 20):
+        tree = FamilyTree()
+        report = tree.bulk_load(io.BytesIO(sample), "json", chunk_size=chunk_size)
+        assert report["error_count"] == 0
+        assert report["people_added"] == len(expected)
+        for person in expected:
+            got = tree.people[person["id"]].to_dict()
+            assert sorted(got["parents"]) == sorted(person["parents"]), f"خطا: والدین {person['id']}"
+            assert sorted(got["children"]) == sorted(person["children"])
+            assert got["spouse"] == person["spouse"]
+    print("  ✅ قالب sample_family.json")
+    
+    # فرزند پیش از والدین می‌آید؛ رکوردهای نامعتبر بقیه ورودی را متوقف نمی‌کنند
+    ndjson = "\n".join([
+        '{"id": "c", "name": "فرزند", "gender": "female", "parents": ["f", "m"]}',
+        '{"id": "bad", "name": "بی‌جنسیت"}',
+        '{not json',
+        '{"id": "f", "name": "پدر", "gender": "male", "spouse": "m", "birth_year": 1950}',
+        '{"id": "m", "name": "مادر", "gender": "female"}',
+        '{"id": "f", "name": "تکراری", "gender": "male"}',
+        '{"type": "parent-child", "parent": "ghost", "child": "c"}',
+    ])
+    tree = FamilyTree()
+    report = tree.bulk_load(io.StringIO(ndjson), "ndjson")
+    assert report["people_added"] == 3
+    assert report["relationships_added"] == 3
+    assert [error["item"] for error in report["errors"]] == [2, 3, 6, 7]
+    assert report["errors"][0]["id"] == "bad"
+    assert tree.simplify_relationship(tree.bfs_find_path("c", "f"), tree.people["c"]) == "پدر"
+    assert tree.people["m"].spouse is tree.people["f"]
+    print("  ✅ NDJSON با ارجاع جلورو و خطای هر رکورد")
+    
+    csv_text = (
+        "id,name,gender,birth_year,parents,children,spouse\n"
+        "a,علی,male,1970,,b;c,z\n"
+        "b,بهار,female,,a;z,,\n"
+        "c,کاوه,male,سال,,,\n"
+        "z,زهره,female,1972,,b,a\n"
+    )
+    tree = FamilyTree()
+    report = tree.bulk_load(io.BytesIO(csv_text.encode("utf-8")), "csv")
+    assert report["people_added"] == 3 and report["error_count"] == 2
+    assert tree.people["b"].birth_year is None
+    assert tree.simplify_relationship(tree.bfs_find_path("b", "z"), tree.people["b"]) == "مادر"
+    print("  ✅ CSV")
+    
+    # فایل ناتمام: هیچ فرد یا رابطه‌ای از آن نمی‌ماند، در حافظه و در SQLite
+    truncated = ('{"people": [{"id": "a", "name": "a", "gender": "male"}, '
+                 '{"id": "b", "name": "b", "gender": "female", "parents": ["a"]}, {')
+    with tempfile.TemporaryDirectory() as directory:
+        for tree in (FamilyTree(), SQLiteFamilyTree(os.path.join(directory, "tree.db"))):
+            tree.add_person("p", "قبلی", "male")
+            before = tree.get_all_people()
+            try:
+                tree.bulk_load(io.StringIO(truncated), "json")
+                assert False, "خطا: JSON ناتمام باید رد شود"
+            except ValueError:
+                pass
+            assert tree.get_all_people() == before and list(tree.people) == ["p"]
+            assert not tree.people["p"].children
+        reopened = SQLiteFamilyTree(os.path.join(directory, "tree.db"))
+        assert reopened.get_all_people() == before
+    try:
+        FamilyTree().bulk_load(io.StringIO(""), "xml")
+        assert False, "خطا: قالب ناشناخته باید رد شود"
+    except ValueError:
+        pass
+    print("  ✅ توقف روی JSON شکسته")
+    
+    print("\n✅ تست 17 موفق!\n")
+
+
+def test_gedcom():
+    """وارد کردن و صادرات GEDCOM"""
+    import io
+    
+    print("🧪 تست 18: GEDCOM")
+    print("=" * 50)
+    
+    gedcom = """0 HEAD
+1 CHAR UTF-8
+0 @F1@ FAM
+1 HUSB @I1@
+1 WIFE @I2@
+1 MARR
+2 DATE 1925
+1 CHIL @I4@
+1 CHIL @I3@
+0 @I1@ INDI
+1 NAME John /Smith/
+1 SEX M
+1 BIRT
+2 DATE ABT 12 JAN 1901
+0 @I2@ INDI
+1 NAME Mary /Jones/
+1 SEX F
+0 @I3@ INDI
+1 NAME Baby
+1 SEX U
+0 @I4@ INDI
+1 NAME Kid /Smith/
+1 SEX F
+0 @F2@ FAM
+1 HUSB @I1@
+1 NO MARR
+1 CHIL @I5@
+0 @I5@ INDI
+1 NAME Other /Smith/
+1 SEX M
+0 TRLR
+"""
+    tree = FamilyTree()
+    report = tree.bulk_load(io.StringIO(gedcom), "gedcom")
+    assert report["people_added"] == 4
+    assert [error["id"] for error in report["errors"]][0] == "I3", "خطا: جنسیت نامشخص باید گزارش شود"
+    assert tree.people["I1"].name == "John Smith" and tree.people["I1"].birth_year == 1901
+    assert tree.people["I1"].spouse is tree.people["I2"]
+    assert sorted(p.id for p in tree.people["I4"].parents) == ["I1", "I2"]
+    assert [p.id for p in tree.people["I5"].parents] == ["I1"]
+    print("  ✅ وارد کردن INDI/FAM با ارجاع جلورو")
+    
+    # رفت و برگشت: افراد، همسران و والدین حفظ می‌شوند
+    original = _random_tree(300, seed=5)
+    original.add_person("x1", "بی‌همسر", "female", 1960)
+    original.add_parent_child("x1", "r250")
+    exported = "".join(original.export_gedcom())
+    assert exported.startswith("0 HEAD\n") and exported.endswith("0 TRLR\n")
+    restored = FamilyTree()
+    report = restored.bulk_load(io.StringIO(exported), "gedcom")
+    assert report["error_count"] == 0
+    assert set(restored.people) == set(original.people)
+    for person_id, person in original.people.items():
+        copy = restored.people[person_id]
+        assert (copy.name, copy.gender, copy.birth_year) == (person.name, person.gender, person.birth_year)
+        assert sorted(p.id for p in copy.parents) == sorted(p.id for p in person.parents), f"خطا: والدین {person_id}"
+        assert (copy.spouse.id if copy.spouse else None) == (person.spouse.id if person.spouse else None)
+    print("  ✅ رفت و برگشت GEDCOM")
+    
+    # تغییر درخت در میان صادرات جریانی خروجی را ناقص یا ناسازگار نمی‌کند
+    tree = _random_tree(3000, seed=6)
+    expected = "".join(tree.export_gedcom())
+    chunks = tree.export_gedcom()
+    streamed = [next(chunks)]
+    tree.add_person("late1", "دیررس", "male")
+    tree.add_person("late2", "دیررس", "female")
+    tree.add_spouse("late1", "late2")
+    tree.add_parent_child("late1", "r2999")
+    tree.add_parent_child("late2", "r10")
+    tree.remove_person("r5")
+    streamed.extend(chunks)
+    assert len(streamed) > 1 and "".join(streamed) == expected
+    print("  ✅ صادرات از تصویر CSR همان نسخه در برابر تغییر هم‌زمان")
+    
+    print("\n✅ تست 18 موفق!\n")
+
+
+def test_ndjson_export():
+    """صادرات جریانی NDJSON همان افراد export_to_dict را خط به خط می‌دهد"""
+    import json
+    import tempfile
+    from binary_snapshot import MappedFamilyTree, save_binary_snapshot
+    
+    print("🧪 تست 19: صادرات جریانی NDJSON")
+    print("=" * 50)
+    
+    tree = _random_tree(250, seed=9)
+    expected = tree.export_to_dict()["people"]
+    
+    chunks = tree.export_ndjson(batch_size=100)
+    first = next(chunks)
+    assert first.count("\n") == 100, "خطا: اولین تکه باید پیش از پیمایش کل درخت آماده شود"
+    lines = (first + "".join(chunks)).splitlines()
+    assert [json.loads(line) for line in lines] == expected
+    print("  ✅ هر خط یک فرد، در تکه‌های ثابت")
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "tree.bin")
+        save_binary_snapshot(tree, path)
+        mapped = MappedFamilyTree(path)
+        lines = "".join(mapped.export_ndjson(batch_size=64)).splitlines()
+        assert [json.loads(line) for line in lines] == expected
+        assert not mapped.materialized, "خطا: صادرات نباید تصویر را به حافظه بیاورد"
+        mapped.close()
+    print("  ✅ صادرات مستقیم از تصویر دودویی")
+    
+    print("\n✅ تست 19 موفق!\n")
+
+
+def test_people_pagination():
+    """صفحه‌بندی افراد با cursor پایدار و انتخاب فیلدها"""
+    import tempfile
+    from binary_snapshot import MappedFamilyTree, save_binary_snapshot
+    
+    print("🧪 تست 20: صفحه‌بندی و انتخاب فیلدها")
+    print("=" * 50)
+    
+    tree = _random_tree(230, seed=3)
+    tree.add_person("ش-۱", "غیرلاتین", "female")
+    expected = sorted(tree.get_all_people(), key=lambda person: person["id"])
+    
+    def all_pages(source, limit, fields=None, between=None):
+        people, after = source.people_page(limit=limit, fields=fields)
+        while after is not None:
+            if between is not None:
+                between(after)
+            page, after = source.people_page(after, limit, fields)
+            people.extend(page)
+        return people
+    
+    assert all_pages(tree, 17) == expected
+    assert all_pages(tree, 1000) == expected
+    assert all_pages(tree, 10, ["id", "name"]) == [{"id": p["id"], "name": p["name"]} for p in expected]
+    try:
+        tree.people_page(limit=5, fields=["id", "password"])
+        assert False, "خطا: فیلد ناشناخته باید رد شود"
+    except ValueError:
+        pass
+    print("  ✅ همه صفحه‌ها به ترتیب شناسه")
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "tree.bin")
+        save_binary_snapshot(tree, path)
+        mapped = MappedFamilyTree(path)
+        assert all_pages(mapped, 17) == expected
+        assert all_pages(mapped, 9, ["id", "spouse"]) == [{"id": p["id"], "spouse": p["spouse"]} for p in expected]
+        columns = ["children", "birth_year", "gender", "name", "parents"]
+        assert all_pages(mapped, 11, columns) == [{field: p[field] for field in columns} for p in expected]
+        # فقط ستون‌های خواسته‌شده خوانده می‌شوند: بدون شناسه بستگان
+        decoded = []
+        table = mapped._table
+        person_id = table.person_id
+        table.person_id = lambda i: decoded.append(i) or person_id(i)
+        people, _ = mapped.people_page(limit=50, fields=["name", "birth_year"])
+        assert len(people) == 50 and len(decoded) <= 1
+        del table.person_id
+        assert not mapped.materialized
+        mapped.close()
+    print("  ✅ صفحه‌بندی روی تصویر دودویی")
+    
+    # تغییر درخت بین صفحه‌ها: افراد باقی‌مانده نه تکرار می‌شوند نه جا می‌افتند
+    removed = set()
+    
+    def mutate(after):
+        victim = next(person_id for person_id in sorted(tree.people) if person_id > after)
+        tree.remove_person(victim)
+        removed.add(victim)
+        tree.add_person(f"{after}-new", "تازه", "male")
+    
+    got = [person["id"] for person in all_pages(tree, 20, ["id"], between=mutate)]
+    assert len(got) == len(set(got))
+    assert {p["id"] for p in expected} - removed <= set(got)
+    print("  ✅ cursor پایدار با وجود افزودن و حذف")
+    
+    print("\n✅ تست 20 موفق!\n")
+
+
+def test_etag():
+    """ETag از نسخه درخت و پاسخ 304 برای درخواست تکراری"""
+    import tempfile
+    from tree_store import SQLiteFamilyTree
+    
+    print("🧪 تست 21: ETag و If-None-Match")
+    print("=" * 50)
+    
+    tree = FamilyTree()
+    first = tree.etag()
+    tree.add_person("a", "الف", "male")
+    assert tree.etag() != first
+    assert FamilyTree().etag() != FamilyTree().etag(), "خطا: دو درخت حافظه‌ای نباید برچسب یکسان بگیرند"
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "tree.db")
+        writer = SQLiteFamilyTree(path)
+        reader = SQLiteFamilyTree(path)
+        writer.add_person("a", "الف", "male")
+        reader.sync()
+        assert reader.etag() == writer.etag(), "خطا: workerها باید برای یک داده برچسب یکسان بدهند"
+        writer.close()
+        reader.close()
+        reopened = SQLiteFamilyTree(path)
+        assert reopened.etag() == writer.etag()
+        reopened.close()
+    print("  ✅ برچسب نسخه در حافظه و SQLite")
+    
+    import app
+    client = app.app.test_client()
+    client.post("/api/sample-data")
+    response = client.get("/api/people")
+    etag = response.headers["ETag"]
+    assert response.status_code == 200 and etag == f'"{app.family_tree.etag()}"'
+    
+    for url in ("/api/people", "/api/people?limit=5&fields=id", "/api/export?format=ndjson",
+                "/api/person/p13/relationships"):
+        response = client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 304 and not response.data, f"خطا: {url}"
+    
+    client.post("/api/person", json={"id": "etag-new", "name": "تازه", "gender": "female"})
+    response = client.get("/api/people", headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["ETag"] != etag
+    assert client.get("/api/people?limit=0").headers.get("ETag") is None
+    print("  ✅ پاسخ 304 بدون بدنه و برچسب تازه پس از تغییر")
+    
+    print("\n✅ تست 21 موفق!\n")
+
+
+def test_change_feed():
+    """فید تغییرات: تغییرات پس از یک نسخه، یا نیاز به همگام‌سازی کامل"""
+    import tempfile
+    from change_log import describe_change
+    from tree_store import SQLiteFamilyTree
+    
+    print("🧪 تست 22: فید تغییرات")
+    print("=" * 50)
+    
+    tree = FamilyTree()
+    tree.changes.resize(5)
+    tree.add_person("f", "پدر", "male")
+    tree.add_person("c", "فرزند", "female")
+    seen = tree.version
+    tree.add_parent_child("f", "c")
+    tree.add_person("m", "مادر", "female", 1960)
+    tree.add_spouse("f", "m")
+    changes = [describe_change(*change) for change in tree.changes_since(seen)]
+    assert [change["type"] for change in changes] == ["edge_added", "person_added", "spouse_set"]
+    assert [change["version"] for change in changes] == [seen + 1, seen + 2, seen + 3]
+    assert changes[1]["person"]["birth_year"] == 1960
+    assert tree.changes_since(tree.version) == []
+    
+    tree.remove_person("c")
+    tree.add_person("d", "دختر", "female")
+    assert len(tree.changes_since(seen)) == 5
+    tree.add_parent_child("m", "d")
+    assert tree.changes_since(seen) is None, "خطا: نسخه بیرون‌رفته از حلقه باید همگام‌سازی کامل بخواهد"
+    assert tree.changes_since(tree.version + 3) is None
+    assert describe_change(*tree.changes_since(tree.version - 2)[0])["type"] == "person_added"
+    print("  ✅ حلقه محدود و تشخیص نسخه قدیمی")
+    
+    # پرس‌وجو میان ثبت تغییر و انتشار نسخه: نه تغییر نیمه‌کاره و نه پاک شدن حلقه
+    current = tree.version
+    tree.changes.append(current + 1, "add_person", ("e", "ه", "male", None))
+    assert len(tree.changes_since(current - 1)) == 1
+    assert tree.changes_since(current) == []
+    tree.version += 1
+    assert [change[0] for change in tree.changes_since(current - 1)] == [current, current + 1]
+    tree.version += 1
+    assert tree.changes_since(current) is None, "خطا: نسخه بدون تغییر ثبت‌شده باید همگام‌سازی کامل بخواهد"
+    tree.version -= 1
+    assert len(tree.changes_since(current - 1)) == 2, "خطا: پاسخ None نباید حلقه را پاک کند"
+    print("  ✅ خواندن بدون قفل هم‌زمان با ثبت تغییر")
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "tree.db")
+        writer = SQLiteFamilyTree(path)
+        reader = SQLiteFamilyTree(path)
+        writer.add_person("a", "الف", "male")
+        seen = writer.version
+        writer.add_person("b", "ب", "female")
+        writer.add_spouse("a", "b")
+        try:
+            writer.add_parent_child("a", "missing")
+        except ValueError:
+            pass
+        reader.sync()
+        changes = reader.changes_since(seen)
+        assert [change[1] for change in changes] == ["add_person", "add_spouse"], \
+            "خطا: تغییرات worker دیگر باید از پایگاه داده خوانده شود"
+        assert changes[0][2] == ("b", "ب", "female", None)
+        writer.close()
+        reader.close()
+    print("  ✅ فید مشترک بین workerهای SQLite")
+    
+    import app
+    client = app.app.test_client()
+    client.post("/api/sample-data")
+    version = app.family_tree.version
+    client.post("/api/person", json={"id": "feed", "name": "تازه", "gender": "male"})
+    response = client.get(f"/api/changes?since={version}")
+    data = response.get_json()["data"]
+    assert data["version"] == version + 1 and data["changes"][0]["person"]["id"] == "feed"
+    assert client.get("/api/changes?since=-5").status_code == 410
+    assert client.get("/api/changes").status_code == 400
+    
+    app.CHANGE_STREAM_SECONDS = 0
+    body = client.get(f"/api/changes?since={version}&stream=1").get_data(as_text=True)
+    assert f"id: {version + 1}\nevent: change\n" in body
+    assert "event: resync" in client.get("/api/changes?since=-5",
+                                         headers={"Accept": "text/event-stream"}).get_data(as_text=True)
+    print("  ✅ polling، SSE و پاسخ 410")
+    
+    print("\n✅ تست 22 موفق!\n")
+
+
+def test_batch():
+    """دسته تغییرات: اتمیک، با یک نسخه و یک رکورد ژورنال"""
+    import tempfile
+    from change_log import describe_change
+    from journal import MutationJournal
+    from tree_store import SQLiteFamilyTree
+    
+    print("🧪 تست 23: دسته تغییرات اتمیک")
+    print("=" * 50)
+    
+    def people_by_id(tree):
+        return {person["id"]: person for person in tree.get_all_people()}
+    
+    with tempfile.TemporaryDirectory() as directory:
+        tree = FamilyTree()
+        journal = MutationJournal(directory)
+        journal.attach(tree)
+        tree.add_person("f", "پدر", "male", 1950)
+        tree.add_person("m", "مادر", "female", 1955)
+        tree.add_person("x", "همسر قبلی", "female")
+        tree.add_spouse("f", "x")
+        version = tree.version
+        applied = tree.apply_batch([
+            ("add_person", "c", "فرزند", "male", 1980),
+            ("add_parent_child", "f", "c"),
+            ("add_parent_child", "m", "c"),
+            ("add_spouse", "f", "m"),
+            ("remove_person", "x")
+        ])
+        assert applied == 5 and tree.version == version + 1, "خطا: کل دسته باید یک نسخه باشد"
+        assert [p.id for p in tree.people["c"].parents] == ["f", "m"]
+        changes = tree.changes_since(version)
+        assert len(changes) == 1
+        assert [change["type"] for change in describe_change(*changes[0])["changes"]] == \
+            ["person_added", "edge_added", "edge_added", "spouse_set", "person_removed"]
+        journal.close()
+        
+        recovered = FamilyTree()
+        assert MutationJournal(directory).attach(recovered) == 5
+        assert recovered.export_to_dict() == tree.export_to_dict() and recovered.version == tree.version
+        print("  ✅ یک نسخه، یک رویداد فید و بازیابی از ژورنال")
+        
+        before = people_by_id(tree)
+        order = list(tree.people)
+        version = tree.version
+        bfs_before = [(p.id, r) for p, r in tree.bfs_find_path("c", "m")]
+        try:
+            tree.apply_batch([
+                ("add_person", "d", "دختر", "female"),
+                ("add_parent_child", "m", "d"),
+                ("add_spouse", "c", "d"),
+                ("remove_person", "m"),
+                ("add_parent_child", "f", "missing")
+            ])
+            assert False, "خطا: باید ValueError رخ دهد"
+        except ValueError as e:
+            assert "5" in str(e)
+        assert people_by_id(tree) == before and tree.version == version, "خطا: دسته ناموفق باید کامل برگردد"
+        assert [(p.id, r) for p, r in tree.bfs_find_path("c", "m")] == bfs_before
+        assert tree.is_ancestor("m", "c") and "d" not in tree.people
+        # فرد حذف‌شده در جای قبلی خودش برمی‌گردد: ترتیب افراد و صادرات همان است
+        assert list(tree.people) == order and [p["id"] for p in tree.get_all_people()] == order
+        print("  ✅ برگشت کامل دسته ناموفق")
+        
+        path = os.path.join(directory, "tree.db")
+        store = SQLiteFamilyTree(path)
+        store.add_person("a", "الف", "male")
+        try:
+            store.apply_batch([("add_person", "b", "ب", "female"), ("remove_person", "nobody")])
+        except ValueError:
+            pass
+        store.apply_batch([("add_person", "b", "ب", "female"), ("add_spouse", "a", "b")])
+        store.close()
+        reopened = SQLiteFamilyTree(path)
+        assert sorted(people_by_id(reopened)) == ["a", "b"] and reopened.version == 2
+        assert reopened.changes_since(1)[0][1] == "apply_batch"
+        reopened.close()
+    print("  ✅ یک تراکنش SQLite برای هر دسته")
+    
+    import app
+    client = app.app.test_client()
+    client.post("/api/sample-data")
+    version = app.family_tree.version
+    response = client.post("/api/batch", json={"operations": [
+        {"op": "add_person", "id": "b1", "name": "یک", "gender": "male"},
+        {"op": "add_person", "id": "b2", "name": "دو", "gender": "female", "birth_year": 2000},
+        {"op": "add_parent_child", "parent_id": "b1", "child_id": "b2"}
+    ]})
+    assert response.status_code == 200 and response.get_json()["data"]["version"] == version + 1
+    response = client.post("/api/batch", json={"operations": [
+        {"op": "add_person", "id": "b3", "name": "سه", "gender": "male"},
+        {"op": "add_spouse", "person1_id": "b3"}
+    ]})
+    assert response.status_code == 400 and "b3" not in app.family_tree.people
+    assert client.post("/api/batch", json={"operations": [{"op": "rename"}]}).status_code == 400
+    print("  ✅ endpoint /api/batch")
+    
+    print("\n✅ تست 23 موفق!\n")
+
+
+def test_concurrent_access():
+    """خواننده‌ها و نویسنده‌های هم‌زمان: بدون خطا و بدون دیدن درخت نیمه‌کاره"""
+    import random
+    import threading
+    import time
+    from rw_lock import ReadWriteLock
+    
+    print("🧪 تست 24: دسترسی هم‌زمان چند نخ")
+    print("=" * 50)
+    
+    lock = ReadWriteLock()
+    with lock.read():
+        with lock.read():
+            pass
+        try:
+            with lock.write():
+                pass
+            assert False, "خطا: ارتقای خواندن به نوشتن باید خطا بدهد"
+        except RuntimeError:
+            pass
+    with lock.write():
+        with lock.read():
+            with lock.write():
+                pass
+    print("  ✅ قفل بازگشتی و جلوگیری از ارتقا")
+    
+    # ازدواج دوباره همسر قبلی را آزاد می‌کند (یال‌های نامتقارن BFS را در حلقه می‌انداخت)
+    remarried = FamilyTree()
+    for person_id in ("a", "b", "c"):
+        remarried.add_person(person_id, person_id, "male")
+    remarried.add_spouse("a", "b")
+    remarried.add_spouse("b", "c")
+    assert remarried.people["a"].spouse is None and remarried.people["c"].spouse.id == "b"
+    assert remarried.bfs_find_path("a", "c") is None
+    print("  ✅ رابطه همسری همیشه دوطرفه")
+    
+    # تعویض نخ‌ها بسیار زودتر از 5ms پیش‌فرض تا نخ‌ها وسط تغییرات در هم بروند
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)
+    
+    tree = _random_tree(300, seed=21)
+    errors = []
+    stop = threading.Event()
+    counts = {"reads": 0, "writes": 0}
+    
+    def connected(a, b):
+        return a in b.parents or a in b.children or a.spouse is b
+    
+    def reader(seed):
+        rng = random.Random(seed)
+        try:
+            while not stop.is_set():
+                with tree.lock.read():
+                    ids = list(tree.people)
+                    start, end = rng.choice(ids), rng.choice(ids)
+                    for find in (tree.bfs_find_path, tree.dfs_find_path):
+                        path = find(start, end)
+                        if path is not None:
+                            people = [person for person, _ in path]
+                            assert people[0].id == start and people[-1].id == end
+                            assert all(connected(a, b) for a, b in zip(people, people[1:]))
+                    if rng.random() < 0.2:
+                        tree.relationship_map(start)
+                        tree.is_ancestor(start, end)
+                people = {person["id"]: person for person in tree.get_all_people()}
+                for person in people.values():
+                    for parent_id in person["parents"]:
+                        assert person["id"] in people[parent_id]["children"], "خطا: درخت نیمه‌کاره دیده شد"
+                page, _ = tree.people_page(limit=50)
+                assert len(page) <= 50
+                counts["reads"] += 1
+        except Exception as e:
+            errors.append(e)
+    
+    def writer(seed):
+        rng = random.Random(seed)
+        try:
+            i = 0
+            while not stop.is_set():
+                i += 1
+                person_id = f"w{seed}-{i}"
+                # انتخاب شناسه و تغییرات وابسته به آن باید یک‌جا باشند
+                with tree.lock.write():
+                    ids = list(tree.people)
+                    tree.add_person(person_id, "نویسنده", rng.choice(["male", "female"]))
+                    tree.add_parent_child(rng.choice(ids), person_id)
+                    if rng.random() < 0.3:
+                        tree.add_spouse(person_id, rng.choice(ids))
+                    if rng.random() < 0.3:
+                        tree.remove_person(rng.choice([other for other in ids if other != person_id]))
+                if rng.random() < 0.2:
+                    tree.apply_batch([("add_person", person_id + "a", "دسته", "male"),
+                                      ("add_person", person_id + "b", "دسته", "female"),
+                                      ("add_parent_child", person_id + "a", person_id + "b")])
+                if rng.random() < 0.05:
+                    # پاک کردن و ساختن دوباره مثل /api/sample-data
+                    with tree.lock.write():
+                        survivors = [(p.id, p.name, p.gender.value) for p in tree.people.values()][:200]
+                        tree.clear()
+                        for survivor in survivors:
+                            tree.add_person(*survivor)
+                        for child, parent in zip(survivors[1:], survivors):
+                            tree.add_parent_child(parent[0], child[0])
+                counts["writes"] += 1
+        except Exception as e:
+            errors.append(e)
+    
+    threads = [threading.Thread(target=reader, args=(seed,)) for seed in range(6)]
+    threads += [threading.Thread(target=writer, args=(seed,)) for seed in range(100, 102)]
+    for thread in threads:
+        thread.start()
+    time.sleep(1.5)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    
+    assert not errors, f"خطا در نخ‌ها: {errors[0]!r}"
+    assert counts["reads"] > 0 and counts["writes"] > 0
+    print(f"  ✅ {counts['reads']} دور خواندن و {counts['writes']} دور نوشتن هم‌زمان بدون خطا")
+    
+    # بارگذاری داده نمونه (پاک کردن و ساختن دوباره) هم‌زمان با پرس‌وجوی مسیر
+    import app
+    app.app.test_client().post("/api/sample-data")
+    statuses = []
+    
+    def query():
+        client = app.app.test_client()
+        for _ in range(100):
+            statuses.append(client.post("/api/path/bfs", json={"start_id": "p13", "end_id": "p1"}).status_code)
+    
+    def reload():
+        client = app.app.test_client()
+        for _ in range(30):
+            statuses.append(client.post("/api/sample-data").status_code)
+    
+    threads = [threading.Thread(target=query) for _ in range(4)] + [threading.Thread(target=reload)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    sys.setswitchinterval(switch_interval)
+    assert statuses.count(200) == len(statuses) == 430, "خطا: درخت نیمه‌ساخته دیده شد"
+    print("  ✅ /api/sample-data هم‌زمان با /api/path/bfs")
+    
+    print("\n✅ تست 24 موفق!\n")
+
+
+def test_async_serving():
+    """استخر محدود پیمایش (503/504) و حالت ASGI با پاسخ سبک روی event loop"""
+    import asyncio
+    import json
+    import threading
+    import app
+    from traversal_pool import PoolSaturated, TraversalPool
+    
+    print("🧪 تست 25: استخر پیمایش و حالت ASGI")
+    print("=" * 50)
+    
+    pool = TraversalPool(workers=1, max_queue=1)
+    release = threading.Event()
+    running = pool.submit(release.wait)
+    queued = pool.submit(lambda: "queued")
+    try:
+        pool.submit(lambda: "rejected")
+        assert False, "خطا: صف پر باید PoolSaturated بدهد"
+    except PoolSaturated:
+        pass
+    stats = pool.stats()
+    assert (stats["running"], stats["queued"], stats["rejected"]) == (1, 1, 1)
+    release.set()
+    assert running.result(5) is True and queued.result(5) == "queued"
+    assert pool.run(sum, [1, 2, 3]) == 6
+    pool.shutdown()
+    print("  ✅ صف محدود و رد کار اضافه")
+    
+    client = app.app.test_client()
+    client.post("/api/sample-data")
+    pair = {"start_id": "p13", "end_id": "p1"}
+    original_pool, original_timeout = app.traversal_pool, app.TRAVERSAL_TIMEOUT
+    release = threading.Event()
+    try:
+        # استخر پر: پیمایش 503 می‌گیرد ولی درخواست‌های سبک جواب می‌گیرند
+        app.traversal_pool = TraversalPool(workers=1, max_queue=0)
+        app.traversal_pool.submit(release.wait)
+        response = client.post("/api/path/bfs", json=pair)
+        assert response.status_code == 503 and response.headers["Retry-After"] == "1"
+        assert client.get("/api/health").status_code == 200
+        assert client.get("/api/person/p1").get_json()["data"]["name"] == "احمد"
+        lines = client.post("/api/path/batch", json={"pairs": [pair]}).get_data(as_text=True).splitlines()
+        assert json.loads(lines[0])["success"] is False
+        assert client.get("/api/traversal/stats").get_json()["data"]["rejected"] == 2
+        release.set()
+        print("  ✅ 503 با Retry-After وقتی استخر پر است")
+        
+        # پیمایش در صف که در مهلت شروع نشود: 504
+        release.clear()
+        app.traversal_pool = TraversalPool(workers=1, max_queue=1)
+        app.traversal_pool.submit(release.wait)
+        app.TRAVERSAL_TIMEOUT = 0.2
+        assert client.post("/api/path/compare", json=pair).status_code == 504
+        release.set()
+        app.TRAVERSAL_TIMEOUT = original_timeout
+        assert client.post("/api/path/compare", json=pair).get_json()["data"]["same_path"] in (True, False)
+        print("  ✅ 504 پس از مهلت پیمایش")
+    finally:
+        release.set()
+        app.traversal_pool.shutdown()
+        app.traversal_pool, app.TRAVERSAL_TIMEOUT = original_pool, original_timeout
+    
+    import asgi
+    application = asgi.application
+    
+    async def call(method, path, chunks=(b"",), headers=()):
+        path, _, query = path.partition("?")
+        scope = {"type": "http", "method": method, "path": path, "root_path": "",
+                 "query_string": query.encode(), "headers": list(headers), "http_version": "1.1",
+                 "scheme": "http", "server": ("testserver", 80), "client": ("127.0.0.1", 1)}
+        incoming = [{"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1}
+                    for i, chunk in enumerate(chunks)]
+        sent = []
+        
+        async def receive():
+            return incoming.pop(0) if incoming else {"type": "http.disconnect"}
+        
+        async def send(message):
+            sent.append(message)
+        
+        await application(scope, receive, send)
+        body = b"".join(message.get("body", b"") for message in sent[1:])
+        return sent[0]["status"], dict(sent[0]["headers"]), body
+    
+    async def scenario():
+        # پیمایشی که در صف استخر مانده event loop را متوقف نمی‌کند
+        blocked = app.traversal_pool.submit(release.wait)
+        await asyncio.sleep(0)
+        slow = asyncio.ensure_future(call("POST", "/api/path/bfs", [json.dumps(pair).encode()],
+                                          [(b"content-type", b"application/json")]))
+        await asyncio.sleep(0.05)
+        status, _, body = await call("GET", "/api/health")
+        assert status == 200 and json.loads(body)["status"] == "healthy"
+        status, headers, body = await call("GET", "/api/person/p13", headers=[(b"origin", b"http://x")])
+        assert status == 200 and json.loads(body)["data"]["id"] == "p13"
+        assert headers[b"etag"] == f'"{app.family_tree.etag()}"'.encode()
+        assert headers[b"access-control-allow-origin"] == b"http://x"
+        # سرآیندهای CORS روی loop همان سرآیندهای flask-cors هستند
+        cors = ("access-control-allow-origin", "access-control-expose-headers", "vary")
+        for origin in ([("Origin", "http://x")], []):
+            _, headers, _ = await call("GET", "/api/person/p13",
+                                       headers=[(k.lower().encode(), v.encode()) for k, v in origin])
+            expected = client.get("/api/person/p13", headers=origin).headers
+            assert {name: headers.get(name.encode()) for name in cors} == \
+                {name: expected.get(name, type=str.encode) for name in cors}
+        assert not slow.done(), "خطا: پیمایش نباید پیش از آزاد شدن استخر تمام شود"
+        release.set()
+        status, _, body = await slow
+        blocked.result(5)
+        print(body);         assert status == 200 and json.loads(body)["data"]["path_length"] >= 1
+        
+        # بدنه چندتکه، پاسخ Flask از نخ و پاسخ جریانی
+        person = json.dumps({"id": "asgi", "name": "ناهمگام", "gender": "female"}).encode()
+        status, _, _ = await call("POST", "/api/person", [person[:10], person[10:]],
+                                  [(b"content-type", b"application/json")])
+        assert status == 200 and "asgi" in app.family_tree.people
+        status, _, body = await call("GET", "/api/person/missing")
+        assert status == 404 and json.loads(body)["success"] is False
+        status, _, body = await call("GET", "/api/person/p1", headers=[(b"if-none-match", body)])
+        assert status == 200
+        status, _, body = await call("GET", "/api/export?format=ndjson")
+        assert status == 200 and len(body.splitlines()) == len(app.family_tree.people)
+    
+    release.clear()
+    app.traversal_pool = TraversalPool(workers=1, max_queue=1)
+    try:
+        asyncio.run(scenario())
+    finally:
+        release.set()
+        app.traversal_pool.shutdown()
+        app.traversal_pool = original_pool
+    print("  ✅ health و دریافت فرد روی event loop هم‌زمان با پیمایش در صف")
+    
+    # نویسنده فعال: دریافت فرد به Flask در نخ جدا فرستاده می‌شود
+    scope = {"type": "http", "method": "GET", "path": "/api/person/p1", "headers": []}
+    assert application._on_loop(scope) is not None
+    holding, done = threading.Event(), threading.Event()
+    
+    def writer():
+        with app.family_tree.lock.write():
+            holding.set()
+            done.wait(5)
+    
+    thread = threading.Thread(target=writer)
+    thread.start()
+    holding.wait(5)
+    assert application._on_loop(scope) is None
+    done.set()
+    thread.join()
+    print("  ✅ بدون انتظار برای قفل روی event loop")
+    
+    print("\n✅ تست 25 موفق!\n")
+
+
+def test_distance_matrix():
+    """ماتریس فاصله و نسبت همه جفت‌ها با پروسه‌های موازی و حافظه مشترک"""
+    import os
+    import tempfile
+    
+    print("🧪 تست 26: ماتریس فاصله موازی")
+    print("=" * 50)
+    
+    tree = _random_tree(300, seed=11)
+    tree.add_person("alone", "تنها", "female")
+    ids = [f"r{i}" for i in range(0, 300, 2)] + ["alone"]
+    
+    # سه بلوک سطر، پس دو پروسه واقعاً استفاده می‌شوند
+    with tree.distance_matrix(ids, workers=2) as matrix:
+        temporary = matrix.path
+        for source_id in ids[::15]:
+            expected = {person.id: (distance, label)
+                        for person, distance, label in tree.relationship_map(source_id)}
+            expected[source_id] = (0, "خود")
+            for target_id in ids:
+                assert (matrix.distance(source_id, target_id), matrix.label(source_id, target_id)) == \
+                    expected.get(target_id, (None, None)), f"خطا: {source_id} -> {target_id}"
+        assert matrix.distance("alone", "r0") is None and matrix.label("alone", "alone") == "خود"
+        row = matrix.row("r0")
+        assert row[0] == 0 and row[-1] is None and len(row) == len(ids)
+    assert not os.path.exists(temporary), "خطا: فایل موقت باید حذف شود"
+    print(f"  ✅ {len(ids)}×{len(ids)} جفت برابر relationship_map")
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "distances.matrix")
+        with tree.distance_matrix(ids, path=path, workers=1, labels=False) as matrix:
+            distances = {person.id: distance for person, distance, _ in tree.relationship_map(ids[1])}
+            assert matrix.distance(ids[1], ids[0]) == distances.get(ids[0])
+            try:
+                matrix.label(ids[0], ids[1])
+                assert False, "خطا: ماتریس بدون برچسب"
+            except ValueError:
+                pass
+        assert os.path.getsize(path) == len(ids) * len(ids) * 2
+    
+    try:
+        tree.distance_matrix(["r0", "missing"])
+        assert False, "خطا: فرد ناموجود باید ValueError بدهد"
+    except ValueError:
+        pass
+    print("  ✅ فایل دلخواه، بدون برچسب و فرد ناموجود")
+    
+    print("\n✅ تست 26 موفق!\n")
+
+
+def test_kinship():
+    """ضریب خویشاوندی و هم‌خونی رایت با numpy و مسیر جایگزین پایتون"""
+    import random
+    from functools import lru_cache
+    from kinship import Pedigree, numpy
+    
+    print("🧪 تست 27: ضریب خویشاوندی و هم‌خونی")
+    print("=" * 50)
+    
+    tree = FamilyTree()
+    for person_id, gender in (("f", "male"), ("m", "female"), ("a", "male"), ("b", "female"),
+                              ("c", "male"), ("x", "female")):
+        tree.add_person(person_id, person_id, gender)
+    for child in ("a", "b"):
+        tree.add_parent_child("f", child)
+        tree.add_parent_child("m", child)
+    # فرزند خواهر و برادر تنی
+    tree.add_parent_child("a", "c")
+    tree.add_parent_child("b", "c")
+    
+    (siblings, sibling_r), (parent, _), (strangers, _) = tree.kinship([("a", "b"), ("f", "a"), ("f", "x")])
+    assert (siblings, sibling_r, parent, strangers) == (0.25, 0.5, 0.25, 0.0)
+    assert tree.inbreeding()["c"] == 0.25 and tree.inbreeding(["a"]) == {"a": 0.0}
+    assert tree.kinship([("c", "c")])[0] == (0.625, 1.0)
+    print("  ✅ خواهر و برادر 0.25، فرزندشان هم‌خونی 0.25")
+    
+    # مقایسه با بازگشت مستقیم روی همه مسیرهای اجدادی
+    tree = _random_tree(500, seed=5)
+    graph = tree.snapshot()
+    pedigree = Pedigree(graph)
+    
+    @lru_cache(maxsize=None)
+    def expected(a, b):
+        if a == b:
+            parents = [graph.index[p.id] for p in graph.people[a].parents]
+            return 0.5 * (1 + (expected(*parents) if len(parents) == 2 else 0))
+        if pedigree.rank[a] < pedigree.rank[b]:
+            a, b = b, a
+        return 0.5 * sum(expected(graph.index[p.id], b) for p in graph.people[a].parents)
+    
+    rng = random.Random(3)
+    pairs = [(rng.randrange(len(graph)), rng.randrange(len(graph))) for _ in range(300)]
+    # numpy در requirements.txt است؛ مسیر برداری همان چیزی است که اجرا می‌شود
+    assert numpy is not None, "خطا: numpy نصب نیست (pip install -r backend/requirements.txt)"
+    for vectorized in (True, False):
+        values = [phi for phi, _ in pedigree.kinship(pairs, vectorized)]
+        assert all(abs(value - expected(a, b)) < 1e-12 for value, (a, b) in zip(values, pairs))
+    inbred = pedigree.inbreeding(range(len(graph)), vectorized=False)
+    assert sum(1 for value in inbred if value > 0) > 0
+    assert pedigree.inbreeding(range(len(graph)), vectorized=True) == inbred
+    assert pedigree.inbreeding(range(len(graph))) == inbred
+    print("  ✅ برابر بازگشت مستقیم (numpy و مسیر جایگزین پایتون)")
+    
+    tree.add_parent_child("r499", "r0")
+    tree.add_parent_child("r0", "r499")
+    try:
+        tree.inbreeding()
+        assert False, "خطا: چرخه باید ValueError بدهد"
+    except ValueError:
+        pass
+    
+    import app
+    client = app.app.test_client()
+    client.post("/api/sample-data")
+    response = client.post("/api/kinship", json={"pairs": [{"person1_id": "p3", "person2_id": "p5"}]})
+    assert response.get_json()["data"]["pairs"][0]["kinship"] == 0.25
+    assert client.post("/api/kinship", json={"pairs": [{"person1_id": "p3", "person2_id": "nobody"}]}).status_code == 400
+    response = client.get("/api/kinship/inbreeding?ids=p3,p13")
+    assert response.get_json()["data"]["count"] == 2 and response.headers.get("ETag")
+    print("  ✅ /api/kinship و /api/kinship/inbreeding")
+    
+    print("\n✅ تست 27 موفق!\n")
+
+
+def test_layout():
+    """نسل افراد (افزایشی و بازسازی کامل) و چیدمان لایه‌ای /api/layout"""
+    import random
+    from layout import GenerationIndex, HORIZONTAL_SPACING, VERTICAL_SPACING
+    
+    print("🧪 تست 28: نسل‌ها و چیدمان لایه‌ای")
+    print("=" * 50)
+    
+    tree = FamilyTree()
+    for person_id, gender in (("g", "male"), ("w", "female"), ("f", "male"), ("m", "female"),
+                              ("c1", "male"), ("c2", "female")):
+        tree.add_person(person_id, person_id, gender)
+    tree.add_parent_child("g", "f")
+    tree.add_spouse("f", "m")
+    for child in ("c1", "c2"):
+        tree.add_parent_child("f", child)
+        tree.add_parent_child("m", child)
+    assert [tree.generation(p) for p in ("g", "f", "m", "c1")] == [0, 1, 0, 2]
+    # جد تازه بالای g همه نوادگان را یک نسل پایین می‌برد
+    tree.add_parent_child("w", "g")
+    assert [tree.generation(p) for p in ("w", "g", "f", "c2")] == [0, 1, 2, 3]
+    tree.remove_person("w")
+    assert tree.generation("c2") == 2
+    print("  ✅ نسل با افزودن جد به‌روز و پس از حذف بازسازی شد")
+    
+    nodes = {node["id"]: node for node in tree.layout()}
+    # m والد ندارد ولی کنار همسرش در نسل 1 کشیده می‌شود و generation گره همان ردیف است
+    assert nodes["m"]["y"] == nodes["f"]["y"] == VERTICAL_SPACING
+    assert nodes["m"]["generation"] == nodes["f"]["generation"] == 1 and tree.generation("m") == 0
+    assert all(node["y"] == node["generation"] * VERTICAL_SPACING for node in nodes.values())
+    assert abs(nodes["m"]["x"] - nodes["f"]["x"]) == HORIZONTAL_SPACING
+    assert nodes["c1"]["y"] == 2 * VERTICAL_SPACING
+    assert nodes["c1"]["x"] + nodes["c2"]["x"] == 0
+    print("  ✅ همسر بدون والد در ردیف همسرش و ردیف‌ها در مرکز")
+    
+    # افزایشی در برابر بازسازی کامل، با افزودن یال به ترتیب تصادفی
+    tree = _random_tree(400, seed=9)
+    rng = random.Random(4)
+    for _ in range(200):
+        parent, child = rng.sample(range(400), 2)
+        if parent < child:
+            tree.add_parent_child(f"r{parent}", f"r{child}")
+    expected = GenerationIndex()
+    expected.rebuild(tree.people.values())
+    assert all(tree.generation(p.id) == expected.generation(p) for p in tree.people.values())
+    for person in tree.people.values():
+        assert all(tree.generation(person.id) > tree.generation(parent.id) for parent in person.parents)
+    
+    tree.add_parent_child("r399", "r0")
+    tree.add_parent_child("r0", "r399")
+    assert len(tree.layout()) == 400
+    print("  ✅ نسل افزایشی برابر بازسازی کامل، چرخه بدون حلقه بی‌پایان")
+    
+    import app
+    client = app.app.test_client()
+    client.post("/api/sample-data")
+    response = client.get("/api/layout")
+    data = response.get_json()["data"]
+    assert data["count"] == len(app.family_tree.people) and data["generations"] >= 3
+    assert {node["id"] for node in data["nodes"]} == set(app.family_tree.people)
+    etag = response.headers["ETag"]
+    assert client.get("/api/layout", headers={"If-None-Match": etag}).status_code == 304
+    print("  ✅ /api/layout با ETag")
+    
+    print("\n✅ تست 28 موفق!\n")
+
+
 if __name__ == "__main__":
     print("\n" + "=" * 50)
     print("🌳 شروع تست‌های سیستم شجره‌نامه")
@@ -218,6 +1864,30 @@ if __name__ == "__main__":
         test_grandparents()
         test_siblings_and_cousins()
         test_bfs_vs_dfs()
+        test_bidirectional_bfs()
+        test_iterative_dfs()
+        test_graph_snapshot()
+        test_compact_person()
+        test_ancestor_index()
+        test_relationship_cache()
+        test_bfs_find_paths()
+        test_relationship_map()
+        test_persian_relation_classifier()
+        test_sqlite_store()
+        test_mutation_journal()
+        test_binary_snapshot()
+        test_bulk_load()
+        test_gedcom()
+        test_ndjson_export()
+        test_people_pagination()
+        test_etag()
+        test_change_feed()
+        test_batch()
+        test_concurrent_access()
+        test_async_serving()
+        test_distance_matrix()
+        test_kinship()
+        test_layout()
         
         print("\n" + "=" * 50)
         print("🎉 تمام تست‌ها با موفقیت انجام شد!")